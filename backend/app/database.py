@@ -1,36 +1,227 @@
 """
 数据库配置
 """
-from sqlalchemy import create_engine
+from typing import Any, Callable, Dict, Optional, Type, TypeVar, Union
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool, StaticPool
 from app.config import settings
+import threading
+import time
 
-# 根据数据库类型配置连接参数
-connect_args = {}
-if "sqlite" in settings.DATABASE_URL:
-    # SQLite 需要这个参数
-    connect_args = {"check_same_thread": False}
-
-# MySQL 连接池配置
-pool_config = {}
-if "mysql" in settings.DATABASE_URL:
-    pool_config = {
-        "pool_size": 10,
-        "max_overflow": 20,
-        "pool_pre_ping": True,  # 自动重连
-        "pool_recycle": 3600,   # 1小时回收连接
-    }
-
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args=connect_args,
-    echo=settings.DEBUG,
-    **pool_config
-)
+T = TypeVar("T")
 
+
+# ============= 连接池监控 =============
+
+class PoolMetrics:
+    """记录从连接池取连接的等待时间与超时次数"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool: Optional[Pool] = None
+        self._lock = threading.Lock()
+        self._checkouts = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def observe(self, wait: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self._timeouts += 1
+            else:
+                self._checkouts += 1
+                self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "avg_wait_ms": round(self._total_wait / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 3),
+            }
+        pool = self.pool
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                "idle": pool.checkedin(),
+            })
+        return stats
+
+
+_pool_metrics: Dict[str, PoolMetrics] = {}
+
+
+def _instrumented_pool(base: Type[QueuePool], metrics: PoolMetrics) -> Type[QueuePool]:
+    """生成带等待计时的连接池类（dispose 重建连接池时沿用同一个类）"""
+
+    class InstrumentedPool(base):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except exc.TimeoutError:
+                metrics.observe(time.perf_counter() - start, timed_out=True)
+                raise
+            metrics.observe(time.perf_counter() - start)
+            return connection
+
+    return InstrumentedPool
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    """各引擎连接池的状态与取连接等待统计"""
+    return {name: metrics.snapshot() for name, metrics in _pool_metrics.items()}
+
+
+# ============= 引擎配置 =============
+
+def to_async_url(url: str) -> str:
+    """把同步驱动连接串换成对应的异步驱动"""
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    for prefix in ("mysql+pymysql://", "mysql://"):
+        if url.startswith(prefix):
+            return "mysql+aiomysql://" + url[len(prefix):]
+    return url
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":"))
+
+
+def _engine_options(url: str, metrics: PoolMetrics, is_async: bool) -> Dict[str, Any]:
+    """按数据库类型生成连接池参数"""
+    options: Dict[str, Any] = {"echo": settings.DB_ECHO}
+    if _is_memory_sqlite(url):
+        # 内存数据库只能共享同一个连接
+        options["poolclass"] = StaticPool
+        if not is_async:
+            options["connect_args"] = {"check_same_thread": False}
+        return options
+
+    base = AsyncAdaptedQueuePool if is_async else QueuePool
+    options.update({
+        "poolclass": _instrumented_pool(base, metrics),
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    })
+    if url.startswith("sqlite") and not is_async:
+        # SQLite 需要这个参数
+        options["connect_args"] = {"check_same_thread": False}
+    return options
+
+
+def _configure_sqlite(engine: Engine, url: str) -> None:
+    """SQLite：WAL 日志、写锁等待和基于进度回调的语句超时"""
+    timeout = settings.DB_STATEMENT_TIMEOUT_MS / 1000
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        if settings.SQLITE_WAL and not _is_memory_sqlite(url):
+            cursor.execute("PRAGMA journal_mode = WAL")
+            cursor.execute("PRAGMA synchronous = NORMAL")
+        cursor.close()
+
+        # aiosqlite 的连接在独立线程中执行，无法注册进度回调
+        if timeout and hasattr(dbapi_connection, "set_progress_handler"):
+            info = connection_record.info
+
+            def check_deadline():
+                deadline = info.get("statement_deadline")
+                return 1 if deadline is not None and time.monotonic() > deadline else 0
+
+            dbapi_connection.set_progress_handler(check_deadline, 10000)
+
+    if timeout:
+        @event.listens_for(engine, "before_cursor_execute")
+        def start_statement(conn, cursor, statement, parameters, context, executemany):
+            conn.info["statement_deadline"] = time.monotonic() + timeout
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def end_statement(conn, cursor, statement, parameters, context, executemany):
+            conn.info.pop("statement_deadline", None)
+
+
+def _configure_mysql(engine: Engine) -> None:
+    """MySQL：会话级语句超时（max_execution_time 只作用于 SELECT）"""
+    if not settings.DB_STATEMENT_TIMEOUT_MS:
+        return
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"SET SESSION max_execution_time = {int(settings.DB_STATEMENT_TIMEOUT_MS)}")
+        cursor.close()
+
+
+def build_engine(url: str, name: str, is_async: bool = False):
+    """按配置创建引擎并登记连接池监控"""
+    metrics = _pool_metrics.setdefault(name, PoolMetrics(name))
+    options = _engine_options(url, metrics, is_async)
+    new_engine = (create_async_engine if is_async else create_engine)(url, **options)
+    sync_engine = new_engine.sync_engine if is_async else new_engine
+    metrics.pool = sync_engine.pool
+
+    @event.listens_for(sync_engine, "engine_disposed")
+    def on_disposed(disposed_engine):
+        metrics.pool = disposed_engine.pool
+
+    if url.startswith("sqlite"):
+        _configure_sqlite(sync_engine, url)
+    elif url.startswith("mysql"):
+        _configure_mysql(sync_engine)
+    return new_engine
+
+
+engine = build_engine(settings.DATABASE_URL, "primary")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 只读副本：未配置时读查询与写入共用主库会话
+read_engine = engine
+ReadSessionLocal = SessionLocal
+if settings.DATABASE_READ_URL:
+    read_engine = build_engine(settings.DATABASE_READ_URL, "replica")
+    ReadSessionLocal = sessionmaker(
+        autocommit=False, autoflush=False, bind=read_engine, info={"read_only": True}
+    )
+
+# 异步引擎（DB_ASYNC 开启时供路由使用，worker 与管理脚本仍使用同步引擎）
+async_engine = None
+async_read_engine = None
+AsyncSessionLocal = None
+AsyncReadSessionLocal = None
+if settings.DB_ASYNC:
+    async_engine = build_engine(
+        settings.ASYNC_DATABASE_URL or to_async_url(settings.DATABASE_URL), "async_primary", is_async=True
+    )
+    # 提交后不过期属性：响应序列化发生在会话之外，无法再懒加载
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    async_read_engine = async_engine
+    AsyncReadSessionLocal = AsyncSessionLocal
+    if settings.DATABASE_READ_URL:
+        async_read_engine = build_engine(
+            settings.ASYNC_DATABASE_READ_URL or to_async_url(settings.DATABASE_READ_URL),
+            "async_replica",
+            is_async=True
+        )
+        AsyncReadSessionLocal = async_sessionmaker(
+            async_read_engine, autoflush=False, expire_on_commit=False, info={"read_only": True}
+        )
+
 Base = declarative_base()
 
 
@@ -43,7 +234,61 @@ def get_db():
         db.close()
 
 
+def get_read_db():
+    """获取只读副本会话"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    """获取异步数据库会话"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db():
+    """获取异步只读副本会话"""
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
+# 路由使用的会话依赖，由 DB_ASYNC 切换
+get_request_db = get_async_db if settings.DB_ASYNC else get_db
+
+# 只读路由的会话依赖；没有副本时与 get_request_db 相同，同一请求内复用一个会话
+if not settings.DATABASE_READ_URL:
+    get_request_read_db = get_request_db
+else:
+    get_request_read_db = get_async_read_db if settings.DB_ASYNC else get_read_db
+
+DBSession = Union[Session, AsyncSession]
+
+
+def is_read_only(db: Session) -> bool:
+    """会话是否连接只读副本（只读会话中不能写入）"""
+    return bool(db.info.get("read_only"))
+
+
+async def run_db(db: DBSession, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    在会话上执行同步的服务函数 fn(db, *args, **kwargs)
+
+    异步会话通过 run_sync 在异步驱动上执行，服务层只需维护一份实现；
+    同步会话直接调用。
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return fn(db, *args, **kwargs)
+
+
 def init_db():
-    """初始化数据库"""
-    from app.models import User, UserSettings, Music, Collection, Favorite
-    Base.metadata.create_all(bind=engine)
+    """初始化数据库，返回本次执行的迁移版本"""
+    from app.models import (
+        User, UserSettings, Music, MusicRendition, MusicWaveform, Collection, Favorite,
+        GenerationJob, Blob, BlobArtifact, AnalysisCacheEntry, UserStats, PlayEvent,
+    )
+    from app.migrations import run_migrations
+    return run_migrations(engine, Base.metadata)
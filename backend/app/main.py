@@ -3,14 +3,30 @@ FastAPI 应用主文件
 """
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
 from app.config import settings
-from app.database import init_db
+from app.database import init_db, async_engine, async_read_engine, pool_stats
 from app.routers import auth_router, music_router, generate_router, user_router
+from app.services.job_queue import get_job_queue
+from app.services.cache_service import get_analysis_cache
+from app.services.auth_service import password_hasher
+from app.services.play_service import get_play_counter
+from app.services.transcode_service import shutdown_transcode_pool
+from app.services.stream_service import MediaStaticFiles
+from app.services.upload_service import UploadSizeLimitMiddleware
+from app.services.model_registry import get_model_registry
+from app.worker import WorkerPool
+import asyncio
 
 app = FastAPI(title=settings.APP_NAME, debug=settings.DEBUG)
 
+# 使用 gunicorn preload_app 时这里在 master 进程中执行，fork 出的 worker 共享已加载的权重
+if settings.MODEL_PRELOAD:
+    get_model_registry().preload(settings.MODEL_PRELOAD)
+
+# 解析表单前限制请求体大小（在 CORS 之内，413 响应也带 CORS 头）
+app.add_middleware(UploadSizeLimitMiddleware)
+
 # 配置 CORS - 更宽松的配置以支持开发环境
 app.add_middleware(
     CORSMiddleware,
@@ -23,7 +39,7 @@ app.add_middleware(
 
 # 挂载静态文件
 settings.UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=str(settings.UPLOAD_DIR)), name="uploads")
+app.mount("/uploads", MediaStaticFiles(directory=str(settings.UPLOAD_DIR)), name="uploads")
 
 # 注册路由
 app.include_router(auth_router)
@@ -36,6 +52,34 @@ app.include_router(user_router)
 async def startup_event():
     """应用启动时初始化数据库"""
     init_db()
+    
+    play_counter = get_play_counter()
+    if play_counter:
+        await play_counter.start()
+    
+    if settings.MODEL_PREWARM:
+        await asyncio.to_thread(get_model_registry().warm, settings.MODEL_PREWARM)
+    
+    # 仅开发环境在 API 进程内运行 worker 池，生成任务不与 API 请求争抢事件循环；生产环境单独运行 worker.py
+    if settings.RUN_EMBEDDED_WORKER:
+        app.state.worker_pool = WorkerPool(get_job_queue())
+        await app.state.worker_pool.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时停止 worker 池，未完成的任务归还队列，并写回缓冲的播放次数"""
+    worker_pool = getattr(app.state, "worker_pool", None)
+    if worker_pool:
+        await worker_pool.stop()
+    play_counter = get_play_counter()
+    if play_counter:
+        await play_counter.stop()
+    await asyncio.to_thread(shutdown_transcode_pool)
+    if async_engine is not None:
+        await async_engine.dispose()
+    if async_read_engine is not None and async_read_engine is not async_engine:
+        await async_read_engine.dispose()
 
 
 @app.get("/")
@@ -50,6 +94,20 @@ async def health_check():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+async def metrics():
+    """运行指标"""
+    analysis_cache = get_analysis_cache()
+    play_counter = get_play_counter()
+    return {
+        "analysis_cache": analysis_cache.stats() if analysis_cache else None,
+        "password_hash": password_hasher.stats(),
+        "db_pool": pool_stats(),
+        "play_counter": play_counter.stats() if play_counter else None,
+        "models": get_model_registry().stats(),
+    }
+
+
 # 全局异常处理
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
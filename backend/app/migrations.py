@@ -0,0 +1,181 @@
+"""
+数据库迁移 - 对已有数据库补充 create_all 不会处理的变更
+
+create_all 只创建缺失的表，不会给已存在的表加索引或约束。
+每个迁移只执行一次，已执行的版本记录在 schema_migrations 表中。
+迁移中的 DDL 显式写出，不依赖模型的当前定义，已发布的迁移不能再修改。
+API 进程、worker 进程启动时都会执行，建表和迁移在数据库锁内串行进行。
+"""
+from contextlib import contextmanager
+from typing import Callable, List, Sequence, Tuple
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+import re
+
+MIGRATION_LOCK_NAME = "soundmood_schema_migrations"
+MIGRATION_LOCK_TIMEOUT = 300    # MySQL 等待迁移锁的秒数
+
+_metadata = MetaData()
+
+# 内容寻址 URL 中的哈希（/uploads/blobs/xx/yy/<sha256>.<ext>）
+_BLOB_HASH_RE = re.compile(r"^/uploads/blobs/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})\.[a-z0-9]{1,10}$")
+
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+
+def _index_names(conn: Connection, table: str) -> set:
+    return {index["name"] for index in inspect(conn).get_indexes(table)}
+
+
+def _create_index(conn: Connection, name: str, table: str, columns: Sequence[str], unique: bool = False) -> None:
+    if name in _index_names(conn, table):
+        return
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    conn.execute(text(f"CREATE {kind} {name} ON {table} ({', '.join(columns)})"))
+
+
+def _column_names(conn: Connection, table: str) -> set:
+    return {column["name"] for column in inspect(conn).get_columns(table)}
+
+
+def _drop_index(conn: Connection, name: str, table: str) -> None:
+    if name not in _index_names(conn, table):
+        return
+    if conn.dialect.name == "mysql":
+        conn.execute(text(f"DROP INDEX {name} ON {table}"))
+    else:
+        conn.execute(text(f"DROP INDEX {name}"))
+
+
+def add_composite_indexes(conn: Connection) -> None:
+    """音乐与收藏表的复合索引"""
+    _create_index(conn, "ix_musics_user_created", "musics", ["user_id", "created_at"])
+    _create_index(conn, "ix_musics_user_status_created", "musics", ["user_id", "status", "created_at"])
+    _create_index(conn, "ix_musics_user_emotion", "musics", ["user_id", "primary_emotion"])
+    _create_index(conn, "ix_collections_user_music", "collections", ["user_id", "music_id"])
+    _create_index(conn, "ix_collections_user_folder", "collections", ["user_id", "folder_name"])
+    _create_index(conn, "ix_collections_music_id", "collections", ["music_id"])
+
+
+def unique_collections(conn: Connection) -> None:
+    """清理重复收藏（保留最早的一条），加唯一约束并修正收藏计数"""
+    duplicates = conn.execute(text(
+        "SELECT c.id, c.user_id FROM collections c "
+        "JOIN collections k ON k.user_id = c.user_id AND k.music_id = c.music_id AND k.id < c.id"
+    )).fetchall()
+    ids = sorted({row[0] for row in duplicates})
+    for start in range(0, len(ids), 500):
+        batch = ids[start:start + 500]
+        params = {f"id{i}": value for i, value in enumerate(batch)}
+        placeholders = ", ".join(f":{key}" for key in params)
+        conn.execute(text(f"DELETE FROM collections WHERE id IN ({placeholders})"), params)
+
+    for user_id in sorted({row[1] for row in duplicates}):
+        conn.execute(text(
+            "UPDATE user_stats SET favorite_count = "
+            "(SELECT COUNT(*) FROM collections WHERE collections.user_id = :user_id) "
+            "WHERE user_id = :user_id"
+        ), {"user_id": user_id})
+
+    _create_index(conn, "uq_collections_user_music", "collections", ["user_id", "music_id"], unique=True)
+    _drop_index(conn, "ix_collections_user_music", "collections")
+
+
+def add_stats_version(conn: Connection) -> None:
+    """user_stats 增加内容版本列"""
+    if "version" not in _column_names(conn, "user_stats"):
+        conn.execute(text("ALTER TABLE user_stats ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
+
+
+def add_artifact_phash(conn: Connection) -> None:
+    """blob_artifacts 增加图片感知哈希列"""
+    if "phash" not in _column_names(conn, "blob_artifacts"):
+        conn.execute(text("ALTER TABLE blob_artifacts ADD COLUMN phash VARCHAR(16)"))
+    _create_index(conn, "ix_blob_artifacts_phash", "blob_artifacts", ["phash"])
+
+
+def add_avatar_variants(conn: Connection) -> None:
+    """users 增加头像缩略图列"""
+    if "avatar_variants" not in _column_names(conn, "users"):
+        conn.execute(text("ALTER TABLE users ADD COLUMN avatar_variants JSON"))
+
+
+def add_blob_public(conn: Connection) -> None:
+    """blobs 增加公开标记，已有的头像及其缩略图标记为公开"""
+    if "is_public" not in _column_names(conn, "blobs"):
+        conn.execute(text("ALTER TABLE blobs ADD COLUMN is_public BOOLEAN NOT NULL DEFAULT 0"))
+
+    urls = set(conn.execute(text("SELECT avatar_url FROM users WHERE avatar_url IS NOT NULL")).scalars())
+    urls.update(conn.execute(text("SELECT url FROM blob_artifacts WHERE kind LIKE 'avatar_%'")).scalars())
+    hashes = {match.group(1) for match in map(_BLOB_HASH_RE.search, urls) if match}
+    for sha256 in hashes:
+        conn.execute(text("UPDATE blobs SET is_public = 1 WHERE sha256 = :sha256"), {"sha256": sha256})
+
+
+# (版本, 说明, 迁移函数)，只能追加，不能修改已发布的版本
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "composite indexes on musics and collections", add_composite_indexes),
+    (2, "unique (user_id, music_id) on collections", unique_collections),
+    (3, "content version on user_stats", add_stats_version),
+    (4, "perceptual hash on blob_artifacts", add_artifact_phash),
+    (5, "avatar variants on users", add_avatar_variants),
+    (6, "public flag on blobs", add_blob_public),
+]
+
+
+@contextmanager
+def _migration_lock(conn: Connection):
+    """
+    多个进程同时启动时串行执行建表和迁移，成功后提交
+
+    MySQL 使用 GET_LOCK（DDL 会隐式提交，事务无法保护）；
+    SQLite 使用 BEGIN IMMEDIATE，持有写锁直到提交，期间其他进程的迁移等待 busy_timeout。
+    """
+    dialect = conn.dialect.name
+    if dialect == "mysql":
+        locked = conn.execute(
+            text("SELECT GET_LOCK(:name, :timeout)"),
+            {"name": MIGRATION_LOCK_NAME, "timeout": MIGRATION_LOCK_TIMEOUT}
+        ).scalar()
+        conn.commit()
+        if locked != 1:
+            raise RuntimeError("timed out waiting for the schema migration lock")
+    elif dialect == "sqlite":
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+    try:
+        yield
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        if dialect == "mysql":
+            conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": MIGRATION_LOCK_NAME})
+            conn.commit()
+
+
+def run_migrations(engine: Engine, metadata: MetaData = None) -> List[int]:
+    """
+    在迁移锁内建表（metadata 为模型的元数据）并执行尚未执行的迁移，返回本次执行的版本号
+
+    已执行的版本在持有锁之后读取，并发启动的进程不会重复执行同一个迁移。
+    """
+    applied = []
+    with engine.connect() as conn, _migration_lock(conn):
+        if metadata is not None:
+            metadata.create_all(bind=conn)
+        _metadata.create_all(bind=conn)
+        done = set(conn.execute(select(schema_migrations.c.version)).scalars())
+        for version, description, migrate in MIGRATIONS:
+            if version in done:
+                continue
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(version=version, description=description))
+            applied.append(version)
+    return applied
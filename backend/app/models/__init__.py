@@ -2,12 +2,26 @@
 数据库模型包
 """
 from .user import User, UserSettings
-from .music import Music, Collection, Favorite
+from .music import Music, MusicRendition, MusicWaveform, Collection, Favorite
+from .job import GenerationJob, JobStatus
+from .blob import Blob, BlobArtifact
+from .cache import AnalysisCacheEntry
+from .stats import UserStats
+from .play import PlayEvent
 
 __all__ = [
     "User",
     "UserSettings",
     "Music",
+    "MusicRendition",
+    "MusicWaveform",
     "Collection",
     "Favorite",
+    "GenerationJob",
+    "JobStatus",
+    "Blob",
+    "BlobArtifact",
+    "AnalysisCacheEntry",
+    "UserStats",
+    "PlayEvent",
 ]
@@ -0,0 +1,37 @@
+"""
+内容寻址存储数据模型
+"""
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, JSON, UniqueConstraint
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class Blob(Base):
+    """按 SHA-256 去重存储的文件及其引用计数"""
+    __tablename__ = "blobs"
+    
+    sha256 = Column(String(64), primary_key=True)
+    ext = Column(String(10), nullable=False)
+    size = Column(Integer, nullable=False, default=0)
+    ref_count = Column(Integer, nullable=False, default=0, index=True)
+    is_public = Column(Boolean, nullable=False, default=False)   # 可通过 /uploads 直接访问（头像及其缩略图）
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class BlobArtifact(Base):
+    """由上传文件预处理得到的派生文件（规范化的语音、图片缩略图），按源文件内容哈希复用"""
+    __tablename__ = "blob_artifacts"
+    __table_args__ = (
+        UniqueConstraint("source_sha256", "kind", name="uq_blob_artifacts_source_kind"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    source_sha256 = Column(String(64), nullable=False)
+    kind = Column(String(20), nullable=False)         # voice / image
+    url = Column(String(500), nullable=False)         # 派生文件的 blob 地址（持有一次引用）
+    phash = Column(String(16), index=True)            # 图片感知哈希（64 位十六进制），用于查找近似图片
+    info = Column(JSON)                               # 采样率、时长等处理结果
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
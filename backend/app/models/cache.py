@@ -0,0 +1,16 @@
+"""
+分析结果缓存数据模型
+"""
+from sqlalchemy import Column, String, DateTime, JSON
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class AnalysisCacheEntry(Base):
+    """情绪分析/生成结果的持久化缓存（二级缓存）"""
+    __tablename__ = "analysis_cache"
+    
+    cache_key = Column(String(64), primary_key=True)
+    value = Column(JSON, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)  # UTC
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
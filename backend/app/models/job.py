@@ -0,0 +1,47 @@
+"""
+生成任务队列数据模型
+"""
+from sqlalchemy import Column, Integer, String, DateTime, Text, Enum, ForeignKey, JSON, Index
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from app.database import Base
+import enum
+
+
+class JobStatus(str, enum.Enum):
+    pending = "pending"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+
+class GenerationJob(Base):
+    """持久化的生成任务（由独立 worker 池租约执行）"""
+    __tablename__ = "generation_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    music_id = Column(Integer, ForeignKey("musics.id", ondelete="CASCADE"), nullable=False, index=True)
+    job_type = Column(String(50), nullable=False, default="generate_music")
+    payload = Column(JSON)
+    
+    # 执行状态
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.pending)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    available_at = Column(DateTime, nullable=False)  # UTC，重试退避后才可再次领取
+    last_error = Column(Text)
+    
+    # 租约信息
+    locked_by = Column(String(100))
+    lease_expires_at = Column(DateTime)  # UTC
+    heartbeat_at = Column(DateTime)      # UTC
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        Index("ix_generation_jobs_claim", "status", "available_at"),
+    )
+    
+    # 关系
+    music = relationship("Music")
@@ -1,7 +1,7 @@
 """
 音乐相关数据模型 - 完整修复版
 """
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Enum, ForeignKey, JSON, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Enum, ForeignKey, JSON, LargeBinary, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -63,10 +63,54 @@ class Music(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
+    # 列表/日记的常用过滤与排序（已有数据库由 app/migrations.py 补建）
+    __table_args__ = (
+        Index("ix_musics_user_created", "user_id", "created_at"),
+        Index("ix_musics_user_status_created", "user_id", "status", "created_at"),
+        Index("ix_musics_user_emotion", "user_id", "primary_emotion"),
+    )
+    
     # 关系
     user = relationship("User", back_populates="musics")
     collections = relationship("Collection", back_populates="music", cascade="all, delete-orphan")
     favorites = relationship("Favorite", back_populates="music", cascade="all, delete-orphan")
+    renditions = relationship("MusicRendition", back_populates="music", cascade="all, delete-orphan")
+    waveform = relationship("MusicWaveform", back_populates="music", uselist=False, cascade="all, delete-orphan")
+
+
+class MusicRendition(Base):
+    """转码生成的音频版本（不同码率及试听片段），文件保存在内容寻址存储中"""
+    __tablename__ = "music_renditions"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    music_id = Column(Integer, ForeignKey("musics.id", ondelete="CASCADE"), nullable=False)
+    name = Column(String(20), nullable=False)       # high / medium / low / preview
+    format = Column(String(10), nullable=False)
+    bitrate = Column(Integer, nullable=False)       # kbps
+    url = Column(String(500), nullable=False)
+    file_size = Column(Integer, default=0)
+    duration = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        UniqueConstraint("music_id", "name", name="uq_music_renditions_music_name"),
+    )
+    
+    music = relationship("Music", back_populates="renditions")
+
+
+class MusicWaveform(Base):
+    """预计算的波形峰值与频谱指纹（生成完成后分析一次）"""
+    __tablename__ = "music_waveforms"
+    
+    music_id = Column(Integer, ForeignKey("musics.id", ondelete="CASCADE"), primary_key=True)
+    duration_ms = Column(Integer, nullable=False, default=0)
+    peaks = Column(LargeBinary, nullable=False)          # uint8 峰值数组（按曲目最大幅度归一化）
+    fingerprint = Column(LargeBinary, nullable=False)    # 频谱指纹位图，按汉明距离比较
+    duplicate_of = Column(Integer, nullable=True)        # 同一用户下近似重复的最早作品
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    music = relationship("Music", back_populates="waveform")
 
 
 class Collection(Base):
@@ -81,6 +125,12 @@ class Collection(Base):
     tags = Column(JSON)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
+    __table_args__ = (
+        Index("uq_collections_user_music", "user_id", "music_id", unique=True),  # 同一首歌只能收藏一次
+        Index("ix_collections_user_folder", "user_id", "folder_name"),
+        Index("ix_collections_music_id", "music_id"),  # 删除音乐时级联查找收藏
+    )
+    
     # 关系
     user = relationship("User", back_populates="collections")
     music = relationship("Music", back_populates="collections")
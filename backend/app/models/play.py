@@ -0,0 +1,21 @@
+"""
+播放事件数据模型
+"""
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class PlayEvent(Base):
+    """单次播放记录，供后续统计分析（播放计数由缓冲批量写回 musics.play_count）"""
+    __tablename__ = "play_events"
+    
+    id = Column(Integer, primary_key=True)
+    music_id = Column(Integer, ForeignKey("musics.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    played_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_play_events_music_played", "music_id", "played_at"),
+        Index("ix_play_events_user_played", "user_id", "played_at"),
+    )
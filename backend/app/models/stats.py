@@ -0,0 +1,21 @@
+"""
+用户统计汇总数据模型
+"""
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, JSON
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class UserStats(Base):
+    """按用户预计算的统计数据，随音乐/收藏写操作增量维护"""
+    __tablename__ = "user_stats"
+    
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    total_count = Column(Integer, nullable=False, default=0)      # 已完成作品数
+    total_duration = Column(Integer, nullable=False, default=0)   # 已完成作品总时长
+    favorite_count = Column(Integer, nullable=False, default=0)   # 收藏数
+    monthly_counts = Column(JSON)   # {"2024-05": 3, ...} 按创建月份统计已完成作品
+    emotion_counts = Column(JSON)   # {"calm": 2, ...} 已完成作品的主情绪分布
+    version = Column(Integer, nullable=False, default=0, server_default="0")  # 内容版本，音乐/收藏/播放写入时递增，用作 ETag
+    
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
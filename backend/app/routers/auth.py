@@ -2,57 +2,38 @@
 认证路由 - 用户注册与登录
 """
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
 from datetime import timedelta
-from app.database import get_db
+from app.database import DBSession, get_request_db, run_db
 from app.schemas.user import UserCreate, UserLogin, UserResponse, Token
-from app.models.user import User, UserSettings
 from app.services.auth_service import (
-    get_password_hash,
+    get_password_hash_async,
     authenticate_user,
     create_access_token
 )
+from app.services.user_service import get_registration_conflict, create_user
 from app.config import settings
 
 router = APIRouter(prefix="/api/auth", tags=["认证"])
 
 
 @router.post("/register", response_model=Token, status_code=status.HTTP_201_CREATED)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: DBSession = Depends(get_request_db)):
     """
     用户注册
     """
-    # 检查邮箱是否已存在
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
-    if existing_user:
+    # 检查邮箱、用户名是否已存在
+    conflict = await run_db(db, get_registration_conflict, user_data.email, user_data.username)
+    if conflict:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
+            detail=conflict
         )
     
-    # 检查用户名是否已存在
-    existing_username = db.query(User).filter(User.username == user_data.username).first()
-    if existing_username:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already taken"
-        )
-    
-    # 创建新用户
-    hashed_password = get_password_hash(user_data.password)
-    new_user = User(
-        email=user_data.email,
-        username=user_data.username,
-        hashed_password=hashed_password
+    # 创建新用户（检查后已归还数据库连接，哈希期间不占用连接池）
+    hashed_password = await get_password_hash_async(user_data.password)
+    new_user = await run_db(
+        db, create_user, user_data.email, user_data.username, hashed_password
     )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    
-    # 创建用户设置（默认值）
-    user_settings = UserSettings(user_id=new_user.id)
-    db.add(user_settings)
-    db.commit()
     
     # 生成 token
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -68,11 +49,11 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=Token)
-async def login(user_data: UserLogin, db: Session = Depends(get_db)):
+async def login(user_data: UserLogin, db: DBSession = Depends(get_request_db)):
     """
     用户登录
     """
-    user = authenticate_user(db, user_data.email, user_data.password)
+    user = await authenticate_user(db, user_data.email, user_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -1,56 +1,39 @@
 """
 音乐生成路由 - 完整版
 """
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, status, BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Header, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from typing import Optional
-from app.database import get_db
+from app.database import DBSession, get_request_db, run_db
 from app.services.auth_service import get_current_user
-from app.services.music_service import create_music, update_music_status, get_music_by_id
+from app.services.music_service import create_music, get_music_by_id
+from app.services.generation_service import enqueue_generation
+from app.services.progress_service import sse_progress_stream
+from app.services.blob_service import store_upload, blob_url
+from app.services.play_service import with_pending_plays
 from app.models.user import User
 from app.models.music import Music, MusicStatus
 from app.schemas.music import MusicResponse, GenerateResponse
-from app.config import settings
-import uuid
-import os
 
 router = APIRouter(prefix="/api/generate", tags=["生成"])
 
 
-async def mock_generate_music(db: Session, music_id: int, music_url: str):
-    """
-    模拟音乐生成（实际项目中替换为真实的 AI 生成逻辑）
-    """
-    import asyncio
-    await asyncio.sleep(2)  # 模拟生成时间
-    
-    # 更新状态为完成
-    update_music_status(
-        db=db,
-        music_id=music_id,
-        status="completed",
-        music_url=music_url,
-        emotion_tags=["calm", "peaceful"],
-        primary_emotion="calm",
-        ai_analysis="基于您的输入，生成了一首平静舒缓的音乐。"
-    )
-
-
 @router.post("/text", response_model=GenerateResponse)
 async def generate_from_text(
-    background_tasks: BackgroundTasks,
     title: str = Form(...),
     text: str = Form(...),
     duration: int = Form(default=30),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_request_db)
 ):
     """
     从文本生成音乐
     """
     # 创建音乐记录
-    music = create_music(
-        db=db,
+    music = await run_db(
+        db,
+        create_music,
         user_id=current_user.id,
         title=title,
         input_type="text",
@@ -61,8 +44,8 @@ async def generate_from_text(
     # 生成模拟音乐 URL
     music_url = f"/uploads/music/generated_{music.id}.mp3"
     
-    # 添加后台任务（实际项目中替换为真实的生成逻辑）
-    background_tasks.add_task(mock_generate_music, db, music.id, music_url)
+    # 提交到生成任务队列，由 worker 池执行（队列使用同步会话，放到线程池中执行）
+    await run_in_threadpool(enqueue_generation, music, music_url)
     
     return {
         "id": music.id,
@@ -73,44 +56,34 @@ async def generate_from_text(
 
 @router.post("/voice", response_model=GenerateResponse)
 async def generate_from_voice(
-    background_tasks: BackgroundTasks,
     title: str = Form(...),
     audio: UploadFile = File(...),
     duration: int = Form(default=30),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_request_db)
 ):
     """
     从语音生成音乐
     """
-    # 保存音频文件
-    file_ext = audio.filename.split(".")[-1] if audio.filename else "wav"
-    filename = f"voice_{current_user.id}_{uuid.uuid4()}.{file_ext}"
-    
-    # 确保目录存在
-    audio_dir = settings.UPLOAD_DIR / "audio"
-    audio_dir.mkdir(parents=True, exist_ok=True)
-    
-    file_path = audio_dir / filename
-    with open(file_path, "wb") as f:
-        content = await audio.read()
-        f.write(content)
+    # 流式保存音频文件（按内容去重）
+    blob = await store_upload(db, audio, f"voice_{current_user.id}", "wav")
     
     # 创建音乐记录
-    music = create_music(
-        db=db,
+    music = await run_db(
+        db,
+        create_music,
         user_id=current_user.id,
         title=title,
         input_type="voice",
-        input_content=f"/uploads/audio/{filename}",
+        input_content=blob_url(blob),
         duration=duration
     )
     
     # 生成模拟音乐 URL
     music_url = f"/uploads/music/generated_{music.id}.mp3"
     
-    # 添加后台任务
-    background_tasks.add_task(mock_generate_music, db, music.id, music_url)
+    # 提交到生成任务队列
+    await run_in_threadpool(enqueue_generation, music, music_url, input_hash=blob.sha256)
     
     return {
         "id": music.id,
@@ -121,12 +94,11 @@ async def generate_from_voice(
 
 @router.post("/image", response_model=GenerateResponse)
 async def generate_from_image(
-    background_tasks: BackgroundTasks,
     title: str = Form(...),
     image: UploadFile = File(...),
     duration: int = Form(default=30),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_request_db)
 ):
     """
     从图片生成音乐
@@ -139,34 +111,25 @@ async def generate_from_image(
             detail="不支持的图片格式"
         )
     
-    # 保存图片文件
-    file_ext = image.filename.split(".")[-1] if image.filename else "jpg"
-    filename = f"image_{current_user.id}_{uuid.uuid4()}.{file_ext}"
-    
-    # 确保目录存在
-    image_dir = settings.UPLOAD_DIR / "images"
-    image_dir.mkdir(parents=True, exist_ok=True)
-    
-    file_path = image_dir / filename
-    with open(file_path, "wb") as f:
-        content = await image.read()
-        f.write(content)
+    # 流式保存图片文件（按内容去重）
+    blob = await store_upload(db, image, f"image_{current_user.id}", "jpg")
     
     # 创建音乐记录
-    music = create_music(
-        db=db,
+    music = await run_db(
+        db,
+        create_music,
         user_id=current_user.id,
         title=title,
         input_type="image",
-        input_content=f"/uploads/images/{filename}",
+        input_content=blob_url(blob),
         duration=duration
     )
     
     # 生成模拟音乐 URL
     music_url = f"/uploads/music/generated_{music.id}.mp3"
     
-    # 添加后台任务
-    background_tasks.add_task(mock_generate_music, db, music.id, music_url)
+    # 提交到生成任务队列
+    await run_in_threadpool(enqueue_generation, music, music_url, input_hash=blob.sha256)
     
     return {
         "id": music.id,
@@ -179,10 +142,33 @@ async def generate_from_image(
 async def get_generation_status(
     music_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_request_db)
 ):
     """
     查询生成状态
     """
-    music = get_music_by_id(db, music_id, current_user.id)
-    return music
+    music = await run_db(db, get_music_by_id, music_id, current_user.id)
+    return with_pending_plays(music)
+
+
+@router.get("/progress/{music_id}/stream")
+async def stream_generation_progress(
+    music_id: int,
+    last_event_id: Optional[int] = Header(None),
+    current_user: User = Depends(get_current_user),
+    db: DBSession = Depends(get_request_db)
+):
+    """
+    以 Server-Sent Events 推送生成进度（替代轮询状态接口）
+    """
+    music = await run_db(db, get_music_by_id, music_id, current_user.id)
+    music_status = music.status.value if isinstance(music.status, MusicStatus) else music.status
+    
+    return StreamingResponse(
+        sse_progress_stream(music_id, last_event_id or 0, music_status),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # 关闭 Nginx 缓冲
+        }
+    )
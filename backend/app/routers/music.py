@@ -1,21 +1,25 @@
 """
 音乐管理路由 - 完整版
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import date
-from app.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import BaseModel, TypeAdapter
+from typing import Any, Dict, List, Optional, Type, Union
+from datetime import date, datetime
+from app.database import DBSession, get_request_db, get_request_read_db, run_db
 from app.schemas.music import (
     MusicResponse, 
     MusicWithFavorite,
     MusicListResponse,
+    MusicCompactListResponse,
     CollectionCreate, 
     CollectionResponse, 
     CollectionUpdate,
     JournalResponse, 
+    JournalCompactResponse,
     UserStatsResponse, 
-    MusicStatusResponse
+    MusicStatusResponse,
+    WaveformPeaksResponse
 )
 from app.services.auth_service import get_current_user
 from app.services.music_service import (
@@ -30,86 +34,163 @@ from app.services.music_service import (
     get_user_stats,
     increment_play_count
 )
+from app.services.progress_service import get_latest_progress
+from app.services.etag_service import Validators, content_validators
+from app.services.stream_service import signed_stream_url, stream_media, verify_stream_signature
+from app.services.transcode_service import get_stream_source, rendition_from_hints
+from app.services.waveform_service import get_music_peaks
+from app.services.stats_service import month_key
+from app.services.play_service import with_pending_plays
 from app.models.user import User
 from app.models.music import Music
 
 router = APIRouter(prefix="/api/music", tags=["音乐"])
 
+# 播放接口既接受 Authorization 头也接受签名地址，缺少凭证时自行返回 401
+optional_bearer = HTTPBearer(auto_error=False)
 
-@router.get("/", response_model=List[MusicWithFavorite])
+VIEW_QUERY = Query("full", pattern="^(full|compact)$", description="full 完整字段，compact 精简字段（不含输入内容和 AI 分析）")
+
+
+_adapters: Dict[type, TypeAdapter] = {}
+
+
+def render(schema: Type[BaseModel], data: Any, validators: Optional[Validators] = None) -> Response:
+    """
+    校验一次后直接输出 JSON，带上缓存校验头
+
+    直接返回字典时 FastAPI 会先按 response_model 校验成模型、再转回字典做 JSON 编码；
+    这里只校验一次并由 pydantic 直接序列化为 UTF-8 字节。
+    """
+    adapter = _adapters.get(schema)
+    if adapter is None:
+        adapter = _adapters[schema] = TypeAdapter(schema)
+    return Response(
+        adapter.dump_json(adapter.validate_python(data)),
+        media_type="application/json",
+        headers=validators.headers if validators else None
+    )
+
+
+@router.get("/", response_model=Union[MusicListResponse, MusicCompactListResponse])
 async def list_musics(
-    skip: int = Query(0, ge=0),
+    request: Request,
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    skip: int = Query(0, ge=0, description="已废弃，仅兼容旧客户端，请使用 cursor"),
     limit: int = Query(20, ge=1, le=100),
     status: Optional[str] = Query(None),
     emotion: Optional[str] = Query(None, description="情绪筛选: happy, calm, sad, energetic, nostalgic"),
     is_favorite: Optional[bool] = Query(None),
+    view: str = VIEW_QUERY,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_request_read_db)
 ):
     """
-    获取用户音乐列表（包含收藏状态）
+    获取用户音乐列表（包含收藏状态，游标分页）
+
+    支持 If-None-Match，内容未变化时返回 304。
     """
-    musics = get_user_musics_with_favorite(
-        db, current_user.id, skip, limit, status, emotion
+    validators = await content_validators(request, db, current_user.id)
+    if validators and validators.matches(request):
+        return validators.not_modified()
+    page = await run_db(
+        db,
+        get_user_musics_with_favorite,
+        current_user.id,
+        limit=limit,
+        status_filter=status,
+        emotion=emotion,
+        is_favorite=is_favorite,
+        cursor=cursor,
+        skip=skip,
+        view=view
     )
-    
-    # 如果需要筛选收藏
-    if is_favorite is not None:
-        musics = [m for m in musics if m["is_favorite"] == is_favorite]
-    
-    return musics
+    return render(MusicCompactListResponse if view == "compact" else MusicListResponse, page, validators)
 
 
-@router.get("/journal", response_model=JournalResponse)
+@router.get("/journal", response_model=Union[JournalResponse, JournalCompactResponse])
 async def get_journal(
+    request: Request,
     start_date: Optional[date] = Query(None),
     end_date: Optional[date] = Query(None),
     emotion: Optional[str] = Query(None),
+    cursor: Optional[date] = Query(None, description="上一页返回的 next_cursor"),
+    days: int = Query(7, ge=1, le=31, description="每页日期数"),
+    tz: Optional[str] = Query(None, description="用户时区，如 Asia/Shanghai；按各日期当时的 UTC 偏移分日（含夏令时）"),
+    view: str = VIEW_QUERY,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_request_read_db)
 ):
     """
-    获取用户日记（按日期分组）
+    获取用户日记（按日期分组，按天分页）
+
+    支持 If-None-Match，内容未变化时返回 304。
     """
-    journal = get_user_journal(db, current_user.id, start_date, end_date, emotion)
-    return journal
+    validators = await content_validators(request, db, current_user.id)
+    if validators and validators.matches(request):
+        return validators.not_modified()
+    journal = await run_db(
+        db,
+        get_user_journal,
+        current_user.id,
+        start_date,
+        end_date,
+        emotion,
+        cursor=cursor,
+        days=days,
+        tz=tz,
+        view=view
+    )
+    return render(JournalCompactResponse if view == "compact" else JournalResponse, journal, validators)
 
 
 @router.get("/stats", response_model=UserStatsResponse)
 async def get_stats(
+    request: Request,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_request_read_db)
 ):
     """
     获取用户统计信息
+
+    支持 If-None-Match；本月数量随月份变化，月份计入 ETag。
     """
-    stats = get_user_stats(db, current_user.id)
-    return stats
+    validators = await content_validators(request, db, current_user.id, month_key(datetime.now()))
+    if validators and validators.matches(request):
+        return validators.not_modified()
+    stats = await run_db(db, get_user_stats, current_user.id)
+    return render(UserStatsResponse, stats, validators)
 
 
 @router.get("/{music_id}", response_model=MusicResponse)
 async def get_music(
     music_id: int,
+    request: Request,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_request_db)
 ):
     """
     获取音乐详情
+
+    支持 If-None-Match，内容未变化时返回 304。
     """
-    music = get_music_by_id(db, music_id, current_user.id)
-    return music
+    validators = await content_validators(request, db, current_user.id)
+    if validators and validators.matches(request):
+        return validators.not_modified()
+    music = await run_db(db, get_music_by_id, music_id, current_user.id)
+    return render(MusicResponse, with_pending_plays(music), validators)
 
 
 @router.delete("/{music_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_music_endpoint(
     music_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_request_db)
 ):
     """
     删除音乐
     """
-    delete_music(db, music_id, current_user.id)
+    await run_db(db, delete_music, music_id, current_user.id)
     return None
 
 
@@ -117,44 +198,124 @@ async def delete_music_endpoint(
 async def get_music_status(
     music_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_request_db)
 ):
     """
     获取音乐生成状态
     """
-    music = get_music_by_id(db, music_id, current_user.id)
+    music = await run_db(db, get_music_by_id, music_id, current_user.id)
+    latest = await run_db(db, get_latest_progress, music_id)
     return {
         "id": music.id,
         "status": music.status,
-        "progress": None,
-        "error_message": None,
+        "progress": latest.progress if latest else None,
+        "error_message": latest.message if latest and latest.status == "failed" else None,
+        # 响应模型把音频路径换成签名播放地址
         "music_url": music.music_url if music.status == "completed" else None
     }
 
 
+@router.api_route("/{music_id}/stream", methods=["GET", "HEAD"])
+async def stream_music(
+    music_id: int,
+    request: Request,
+    expires: Optional[int] = Query(None, description="签名地址的过期时间"),
+    signature: Optional[str] = Query(None, description="签名地址的签名"),
+    quality: Optional[str] = Query(
+        None, pattern="^(original|high|medium|low|preview)$",
+        description="音质版本，为空时按 Save-Data / ECT / Downlink 请求头选择"
+    ),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_bearer),
+    db: DBSession = Depends(get_request_db)
+):
+    """
+    播放音频（支持 Range 拖动进度）
+
+    使用 Authorization 头，或 /stream-url 返回的签名地址（无需登录）。
+    转码完成后按 quality 或网络提示返回对应码率的版本，没有该版本时返回原始文件。
+    """
+    rendition = rendition_from_hints(quality, request.headers)
+    if signature is not None:
+        if expires is None or not verify_stream_signature(music_id, expires, signature):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="播放地址无效或已过期")
+        music_url = await run_db(db, get_stream_source, music_id, None, rendition)
+    else:
+        if credentials is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Not authenticated",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        current_user = await get_current_user(credentials, db)
+        music_url = await run_db(db, get_stream_source, music_id, current_user.id, rendition)
+    response = stream_media(request, music_url)
+    if quality is None:
+        response.headers["Vary"] = "Save-Data, ECT, Downlink"
+    return response
+
+
+@router.get("/{music_id}/stream-url")
+async def get_stream_url(
+    music_id: int,
+    current_user: User = Depends(get_current_user),
+    db: DBSession = Depends(get_request_db)
+):
+    """
+    获取限时签名播放地址
+    """
+    await run_db(db, get_stream_source, music_id, current_user.id)
+    return signed_stream_url(music_id)
+
+
+@router.get("/{music_id}/peaks", response_model=WaveformPeaksResponse)
+async def get_peaks(
+    music_id: int,
+    request: Request,
+    resolution: int = Query(512, ge=16, le=8192, description="峰值点数，超过保存的点数时返回全部"),
+    format: str = Query("json", pattern="^(json|binary)$", description="binary 时返回 uint8 字节数组"),
+    current_user: User = Depends(get_current_user),
+    db: DBSession = Depends(get_request_read_db)
+):
+    """
+    获取波形峰值（0-255，按曲目最大幅度归一化），生成完成后异步计算，未完成时返回 404
+    """
+    data = await run_db(db, get_music_peaks, music_id, current_user.id, resolution)
+    validators = Validators(etag=data.pop("etag"))
+    if validators.matches(request):
+        return validators.not_modified()
+    if format == "binary":
+        headers = dict(validators.headers, **{
+            "X-Peaks-Resolution": str(data["resolution"]),
+            "X-Duration-Ms": str(data["duration_ms"]),
+        })
+        return Response(content=data["peaks"], media_type="application/octet-stream", headers=headers)
+    data["peaks"] = list(data["peaks"])
+    return render(WaveformPeaksResponse, data, validators)
+
+
 @router.post("/{music_id}/play")
 async def play_music(
     music_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_request_db)
 ):
     """
     增加播放次数
     """
-    music = increment_play_count(db, music_id, current_user.id)
-    return {"play_count": music.play_count}
+    play_count = await run_db(db, increment_play_count, music_id, current_user.id)
+    return {"play_count": play_count}
 
 
 @router.post("/{music_id}/favorite")
 async def toggle_music_favorite(
     music_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_request_db)
 ):
     """
     切换收藏状态
     """
-    is_favorite = toggle_favorite(db, current_user.id, music_id)
+    is_favorite = await run_db(db, toggle_favorite, current_user.id, music_id)
     return {"is_favorite": is_favorite}
 
 
@@ -162,13 +323,14 @@ async def toggle_music_favorite(
 async def create_collection(
     data: CollectionCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_request_db)
 ):
     """
     添加收藏
     """
-    collection = add_to_collection(
-        db, 
+    collection = await run_db(
+        db,
+        add_to_collection,
         current_user.id, 
         data.music_id,
         data.folder_name,
@@ -183,13 +345,13 @@ async def list_collections(
     folder_name: Optional[str] = Query(None),
     tag: Optional[str] = Query(None, description="标签筛选"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_request_db)
 ):
     """
     获取收藏列表
     """
-    collections = get_user_collections_with_tags(
-        db, current_user.id, folder_name, tag
+    collections = await run_db(
+        db, get_user_collections_with_tags, current_user.id, folder_name, tag
     )
     return collections
 
@@ -198,10 +360,10 @@ async def list_collections(
 async def delete_collection(
     music_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_request_db)
 ):
     """
     取消收藏
     """
-    remove_from_collection(db, current_user.id, music_id)
+    await run_db(db, remove_from_collection, current_user.id, music_id)
     return None
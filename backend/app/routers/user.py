@@ -2,8 +2,7 @@
 用户管理路由 - 完整版
 """
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import DBSession, get_request_db, run_db
 from app.schemas.user import (
     UserResponse, 
     UserSettingsResponse, 
@@ -14,11 +13,12 @@ from app.services.auth_service import get_current_user
 from app.services.user_service import (
     get_user_settings,
     update_user_settings,
-    update_user_profile
+    update_user_profile,
+    replace_avatar
 )
+from app.services.blob_service import store_upload, blob_url, release
+from app.services.preprocess_service import create_avatar_variants
 from app.models.user import User
-from app.config import settings
-import uuid
 
 router = APIRouter(prefix="/api/user", tags=["用户"])
 
@@ -26,12 +26,12 @@ router = APIRouter(prefix="/api/user", tags=["用户"])
 @router.get("/settings", response_model=UserSettingsResponse)
 async def get_settings(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_request_db)
 ):
     """
     获取用户设置
     """
-    user_settings = get_user_settings(db, current_user.id)
+    user_settings = await run_db(db, get_user_settings, current_user.id)
     return user_settings
 
 
@@ -39,12 +39,12 @@ async def get_settings(
 async def update_settings(
     settings_data: UserSettingsUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_request_db)
 ):
     """
     更新用户设置
     """
-    user_settings = update_user_settings(db, current_user.id, settings_data)
+    user_settings = await run_db(db, update_user_settings, current_user.id, settings_data)
     return user_settings
 
 
@@ -52,12 +52,12 @@ async def update_settings(
 async def update_profile(
     profile_data: UserProfileUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_request_db)
 ):
     """
     更新用户资料
     """
-    user = update_user_profile(db, current_user.id, profile_data)
+    user = await run_db(db, update_user_profile, current_user.id, profile_data)
     return user
 
 
@@ -65,7 +65,7 @@ async def update_profile(
 async def upload_avatar(
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_request_db)
 ):
     """
     上传头像
@@ -78,24 +78,20 @@ async def upload_avatar(
             detail="不支持的图片格式"
         )
     
-    # 保存文件
-    file_ext = file.filename.split(".")[-1] if file.filename else "jpg"
-    filename = f"avatar_{current_user.id}_{uuid.uuid4()}.{file_ext}"
+    # 流式保存文件（按内容去重）
+    blob = await store_upload(db, file, f"avatar_{current_user.id}", "jpg")
     
-    # 确保目录存在
-    image_dir = settings.UPLOAD_DIR / "images"
-    image_dir.mkdir(parents=True, exist_ok=True)
-    
-    file_path = image_dir / filename
-    
-    with open(file_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
+    # 生成各尺寸缩略图（在线程中处理图片）
+    try:
+        variants = await create_avatar_variants(db, blob)
+    except ValueError:
+        await run_db(db, release, blob_url(blob))
+        raise HTTPException(
+            status_code=400,
+            detail="无法识别的图片"
+        )
     
-    # 更新用户头像
-    avatar_url = f"/uploads/images/{filename}"
-    current_user.avatar_url = avatar_url
-    db.commit()
-    db.refresh(current_user)
+    # 更新用户头像，并释放旧头像及其缩略图的引用
+    user = await run_db(db, replace_avatar, current_user, blob_url(blob), variants)
     
-    return current_user
+    return user
@@ -18,13 +18,18 @@ from .music import (
     MusicWithFavorite,
     MusicListResponse,
     MusicList,
+    MusicListItem,
+    MusicCompactListResponse,
     CollectionCreate,
     CollectionUpdate,
     CollectionResponse,
     JournalEntry,
     JournalResponse,
+    JournalCompactEntry,
+    JournalCompactResponse,
     UserStatsResponse,
     MusicStatusResponse,
+    WaveformPeaksResponse,
     TextGenerateRequest,
     GenerateResponse,
 )
@@ -46,13 +51,18 @@ __all__ = [
     "MusicWithFavorite",
     "MusicListResponse",
     "MusicList",
+    "MusicListItem",
+    "MusicCompactListResponse",
     "CollectionCreate",
     "CollectionUpdate",
     "CollectionResponse",
     "JournalEntry",
     "JournalResponse",
+    "JournalCompactEntry",
+    "JournalCompactResponse",
     "UserStatsResponse",
     "MusicStatusResponse",
+    "WaveformPeaksResponse",
     "TextGenerateRequest",
     "GenerateResponse",
 ]
@@ -1,12 +1,19 @@
 """
 音乐相关 API 模式 - 完整版
 """
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional, List, Dict, Any
 from datetime import datetime, date
 from enum import Enum
 
 
+def _signed_music_url(model):
+    """音频只通过播放接口读取，响应中的 music_url 换成签名播放地址（/uploads 不公开音频）"""
+    from app.services.stream_service import playback_url
+    model.music_url = playback_url(model.id, model.music_url)
+    return model
+
+
 class InputType(str, Enum):
     voice = "voice"
     text = "text"
@@ -56,6 +63,8 @@ class MusicResponse(BaseModel):
     class Config:
         from_attributes = True
 
+    _sign_music_url = model_validator(mode="after")(_signed_music_url)
+
 
 # 带收藏状态的音乐响应
 class MusicWithFavorite(MusicResponse):
@@ -66,14 +75,43 @@ class MusicWithFavorite(MusicResponse):
 class MusicListResponse(BaseModel):
     items: List[MusicWithFavorite]
     total: int
-    skip: int
     limit: int
+    next_cursor: Optional[str] = None  # 为空表示没有下一页
 
 
 # 为兼容性添加别名
 MusicList = MusicListResponse
 
 
+# 列表精简条目（不含 input_content、ai_analysis 等大字段，详情接口返回完整字段）
+class MusicListItem(BaseModel):
+    id: int
+    user_id: int
+    title: str
+    input_type: InputType
+    emotion_tags: Optional[List[str]]
+    primary_emotion: Optional[str]
+    music_url: str
+    cover_url: Optional[str]
+    duration: int
+    status: MusicStatus
+    is_public: bool
+    play_count: int
+    created_at: datetime
+    updated_at: datetime
+    is_favorite: bool = False
+
+    _sign_music_url = model_validator(mode="after")(_signed_music_url)
+
+
+# 精简音乐列表响应
+class MusicCompactListResponse(BaseModel):
+    items: List[MusicListItem]
+    total: int
+    limit: int
+    next_cursor: Optional[str] = None
+
+
 # 收藏创建请求
 class CollectionCreate(BaseModel):
     music_id: int
@@ -115,6 +153,21 @@ class JournalEntry(BaseModel):
 class JournalResponse(BaseModel):
     entries: List[JournalEntry]
     total: int
+    next_cursor: Optional[date] = None  # 为空表示没有更早的日期
+
+
+# 精简日记条目
+class JournalCompactEntry(BaseModel):
+    date: date
+    items: List[MusicListItem]
+    count: int
+
+
+# 精简日记列表响应
+class JournalCompactResponse(BaseModel):
+    entries: List[JournalCompactEntry]
+    total: int
+    next_cursor: Optional[date] = None
 
 
 # 用户统计信息
@@ -134,6 +187,15 @@ class MusicStatusResponse(BaseModel):
     error_message: Optional[str] = None
     music_url: Optional[str] = None
 
+    _sign_music_url = model_validator(mode="after")(_signed_music_url)
+
+
+# 波形峰值
+class WaveformPeaksResponse(BaseModel):
+    resolution: int
+    duration_ms: int
+    peaks: List[int]
+
 
 # 文本生成请求
 class TextGenerateRequest(BaseModel):
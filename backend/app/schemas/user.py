@@ -2,7 +2,7 @@
 用户相关 API 模式 - 完整版
 """
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from typing import Dict, Optional
 from datetime import datetime
 
 
@@ -25,6 +25,7 @@ class UserResponse(BaseModel):
     email: str
     username: str
     avatar_url: Optional[str]
+    avatar_variants: Optional[Dict[str, str]] = None  # 边长 -> 缩略图 URL，按显示尺寸选择
     is_active: bool
     created_at: datetime
     
@@ -66,7 +67,6 @@ class UserSettingsUpdate(BaseModel):
     public_profile: Optional[bool] = None
 
 
-# 用户资料更新请求
+# 用户资料更新请求（头像只能通过 /api/user/avatar 上传）
 class UserProfileUpdate(BaseModel):
     username: Optional[str] = Field(None, min_length=2, max_length=100)
-    avatar_url: Optional[str] = None
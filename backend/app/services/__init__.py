@@ -7,6 +7,9 @@ from .auth_service import (
     create_access_token,
     get_password_hash,
     verify_password,
+    get_password_hash_async,
+    verify_password_async,
+    invalidate_user_cache,
 )
 
 from .music_service import (
@@ -28,10 +31,17 @@ from .music_service import (
     get_music_detail,
 )
 
+from .generation_service import (
+    enqueue_generation,
+)
+
 from .user_service import (
     get_user_settings,
     update_user_settings,
     update_user_profile,
+    create_user,
+    replace_avatar,
+    deactivate_user,
 )
 
 __all__ = [
@@ -41,6 +51,9 @@ __all__ = [
     "create_access_token",
     "get_password_hash",
     "verify_password",
+    "get_password_hash_async",
+    "verify_password_async",
+    "invalidate_user_cache",
     # Music service
     "get_music_by_id",
     "get_user_musics",
@@ -58,8 +71,13 @@ __all__ = [
     "update_music_status",
     "get_music_list",
     "get_music_detail",
+    # Generation service
+    "enqueue_generation",
     # User service
     "get_user_settings",
     "update_user_settings",
     "update_user_profile",
+    "create_user",
+    "replace_avatar",
+    "deactivate_user",
 ]
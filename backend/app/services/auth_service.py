@@ -2,19 +2,30 @@
 认证服务 - JWT token 生成与验证
 """
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Callable, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy.orm import Session, make_transient_to_detached
+from app.database import DBSession, get_request_db, run_db
 from app.models.user import User
 from app.config import settings
+from app.services.cache_service import TTLCache
+import asyncio
+import threading
+import time
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
 security = HTTPBearer()
 
+# 已验证 token -> user_id
+_token_cache = TTLCache(settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_TOKEN_CACHE_TTL)
+# user_id -> 用户字段快照（不含密码哈希）
+_user_cache = TTLCache(settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_USER_CACHE_TTL)
+_USER_CACHE_FIELDS = ("id", "email", "username", "avatar_url", "avatar_variants", "is_active", "created_at", "updated_at")
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """验证密码"""
@@ -26,6 +37,98 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+class PasswordHasher:
+    """
+    在有界线程池中执行 bcrypt，统计排队深度
+
+    排队请求超过 max_pending 或等待超过 queue_timeout 时返回 503，
+    登录洪峰只会拉长登录本身的排队，不会拖慢其他接口。
+    """
+
+    def __init__(self, workers: int, max_pending: int, queue_timeout: float):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+        self._in_flight = 0
+        self._stats = {"completed": 0, "rejected": 0, "timed_out": 0, "total_wait_ms": 0.0}
+
+    def _overloaded(self, reason: str) -> HTTPException:
+        with self._lock:
+            self._stats[reason] += 1
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts, please retry later",
+            headers={"Retry-After": "1"},
+        )
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+
+        with self._lock:
+            full = self._pending >= self.max_pending
+            if not full:
+                self._pending += 1
+        if full:
+            raise self._overloaded("rejected")
+
+        enqueued_at = time.perf_counter()
+        try:
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise self._overloaded("timed_out")
+            wait_ms = (time.perf_counter() - enqueued_at) * 1000
+            with self._lock:
+                self._in_flight += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, func, *args)
+            finally:
+                self._slots.release()
+                with self._lock:
+                    self._in_flight -= 1
+                    self._stats["completed"] += 1
+                    self._stats["total_wait_ms"] += wait_ms
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queued"] = self._pending - self._in_flight
+            stats["in_flight"] = self._in_flight
+        completed = stats.pop("completed")
+        total_wait_ms = stats.pop("total_wait_ms")
+        stats["completed"] = completed
+        stats["avg_wait_ms"] = round(total_wait_ms / completed, 2) if completed else 0.0
+        stats["workers"] = self.workers
+        stats["max_pending"] = self.max_pending
+        return stats
+
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+    queue_timeout=settings.PASSWORD_HASH_QUEUE_TIMEOUT,
+)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """在哈希线程池中生成密码哈希"""
+    return await password_hasher.run(pwd_context.hash, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """在哈希线程池中验证密码，成本参数变化时一并返回新哈希"""
+    return await password_hasher.run(pwd_context.verify_and_update, plain_password, hashed_password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """创建 JWT token"""
     to_encode = data.copy()
@@ -38,9 +141,64 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
+def decode_token_user_id(token: str) -> int:
+    """验证 token 并返回用户 ID，验证结果会被缓存；token 无效时抛出 JWTError"""
+    if settings.AUTH_CACHE_ENABLED:
+        user_id = _token_cache.get(token)
+        if user_id is not None:
+            return user_id
+    
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    sub = payload.get("sub")
+    if sub is None:
+        raise JWTError("missing subject")
+    try:
+        user_id = int(sub)
+    except (TypeError, ValueError):
+        raise JWTError("invalid subject")
+    
+    if settings.AUTH_CACHE_ENABLED:
+        ttl = settings.AUTH_TOKEN_CACHE_TTL
+        if payload.get("exp"):
+            ttl = min(ttl, payload["exp"] - time.time())
+        if ttl > 0:
+            _token_cache.set(token, user_id, ttl)
+    return user_id
+
+
+def load_user(db: Session, user_id: int) -> Optional[User]:
+    """
+    按 ID 获取用户，优先使用身份缓存
+
+    命中缓存时直接构造实例并挂到当前会话（不发查询），路由中修改后照常提交即可。
+    """
+    if settings.AUTH_CACHE_ENABLED:
+        snapshot = _user_cache.get(user_id)
+        if snapshot is not None:
+            user = User(**snapshot)
+            make_transient_to_detached(user)
+            db.add(user)
+            return user
+    
+    user = db.query(User).filter(User.id == user_id).first()
+    if user is not None and settings.AUTH_CACHE_ENABLED:
+        _user_cache.set(user_id, {field: getattr(user, field) for field in _USER_CACHE_FIELDS})
+    return user
+
+
+def invalidate_user_cache(user_id: int) -> None:
+    """用户资料变更、停用后清除身份缓存"""
+    _user_cache.delete(user_id)
+
+
+def clear_auth_cache() -> None:
+    _token_cache.clear()
+    _user_cache.clear()
+
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_request_db)
 ) -> User:
     """获取当前登录用户"""
     token = credentials.credentials
@@ -50,24 +208,42 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id: int = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
+        user_id = decode_token_user_id(token)
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await run_db(db, load_user, user_id)
     if user is None:
         raise credentials_exception
+    if not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Inactive user"
+        )
     return user
 
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
-    """验证用户"""
+def _load_login_user(db: Session, email: str) -> Tuple[Optional[User], Optional[str]]:
     user = db.query(User).filter(User.email == email).first()
+    hashed_password = user.hashed_password if user else None
+    # 结束只读事务、归还连接，避免校验期间占用连接池
+    db.commit()
+    return user, hashed_password
+
+
+def _save_password_hash(db: Session, user: User, hashed_password: str) -> None:
+    user.hashed_password = hashed_password
+    db.commit()
+
+
+async def authenticate_user(db: DBSession, email: str, password: str) -> Optional[User]:
+    """验证用户，bcrypt 成本变化时透明地升级密码哈希"""
+    user, hashed_password = await run_db(db, _load_login_user, email)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await verify_password_async(password, hashed_password)
+    if not valid:
         return None
+    if new_hash:
+        await run_db(db, _save_password_hash, user, new_hash)
     return user
@@ -0,0 +1,201 @@
+"""
+内容寻址存储服务 - 按内容哈希去重保存文件并维护引用计数
+"""
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from fastapi import UploadFile
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import DBSession, run_db
+from app.models.blob import Blob, BlobArtifact
+from app.services.upload_service import get_file_ext, save_upload
+import hashlib
+import os
+import re
+import shutil
+import time
+
+BLOB_SUBDIR = "blobs"
+_BLOB_URL_RE = re.compile(r"^/uploads/blobs/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})\.[a-z0-9]{1,10}$")
+
+
+def blob_relpath(sha256: str, ext: str) -> str:
+    """哈希对应的相对路径（两级目录分桶）"""
+    return f"{BLOB_SUBDIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}.{ext}"
+
+
+def blob_path(blob: Blob) -> Path:
+    return settings.UPLOAD_DIR / blob_relpath(blob.sha256, blob.ext)
+
+
+def blob_url(blob: Blob) -> str:
+    return f"/uploads/{blob_relpath(blob.sha256, blob.ext)}"
+
+
+def parse_blob_url(url: Optional[str]) -> Optional[str]:
+    """从 URL 中解析出内容哈希，非内容寻址 URL 返回 None"""
+    if not url:
+        return None
+    match = _BLOB_URL_RE.match(url)
+    return match.group(1) if match else None
+
+
+def _ingest(db: Session, staged_path: Path, sha256: str, ext: str, size: int) -> Blob:
+    """把已落盘的临时文件登记为 blob（引用计数 +1），重复内容直接丢弃临时文件"""
+    created = False
+    if db.query(Blob.sha256).filter(Blob.sha256 == sha256).first() is None:
+        db.add(Blob(sha256=sha256, ext=ext, size=size, ref_count=1))
+        try:
+            db.commit()
+            created = True
+        except IntegrityError:
+            # 并发上传了相同内容，改为增加引用
+            db.rollback()
+
+    if not created:
+        db.query(Blob).filter(Blob.sha256 == sha256).update(
+            {Blob.ref_count: Blob.ref_count + 1}, synchronize_session=False
+        )
+        db.commit()
+
+    blob = db.query(Blob).filter(Blob.sha256 == sha256).first()
+    target = blob_path(blob)
+    if target.exists():
+        staged_path.unlink(missing_ok=True)
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staged_path, target)
+    return blob
+
+
+async def store_upload(
+    db: DBSession,
+    upload: UploadFile,
+    prefix: str,
+    default_ext: str
+) -> Blob:
+    """流式保存上传文件并按内容去重，返回的 blob 已为调用方持有一次引用"""
+    stored = await save_upload(upload, "tmp", prefix, default_ext)
+    ext = get_file_ext(upload.filename, default_ext)
+    return await run_db(db, _ingest, stored.path, stored.sha256, ext, stored.size)
+
+
+def ingest_file(db: Session, path: Path, ext: str, move: bool = True) -> Blob:
+    """把本地文件（如生成的音频）登记到内容寻址存储，返回持有一次引用的 blob"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(settings.UPLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            size += len(chunk)
+
+    staged = path
+    if not move:
+        staged = settings.UPLOAD_DIR / "tmp" / f".{digest.hexdigest()}.{os.getpid()}.part"
+        staged.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(path, staged)
+    return _ingest(db, staged, digest.hexdigest(), ext, size)
+
+
+def add_ref(db: Session, url: Optional[str]) -> bool:
+    """为已存在的 blob 增加一次引用，非 blob URL 或 blob 不存在时返回 False"""
+    sha256 = parse_blob_url(url)
+    if not sha256:
+        return False
+    updated = db.query(Blob).filter(Blob.sha256 == sha256).update(
+        {Blob.ref_count: Blob.ref_count + 1}, synchronize_session=False
+    )
+    db.commit()
+    return bool(updated)
+
+
+def release(db: Session, url: Optional[str]) -> bool:
+    """释放一次引用，最后一个引用释放时立即回收文件，返回是否已回收"""
+    sha256 = parse_blob_url(url)
+    if not sha256:
+        return False
+    db.query(Blob).filter(Blob.sha256 == sha256, Blob.ref_count > 0).update(
+        {Blob.ref_count: Blob.ref_count - 1}, synchronize_session=False
+    )
+    db.commit()
+    return _delete_if_unreferenced(db, sha256)
+
+
+def mark_public(db: Session, urls: Iterable[Optional[str]]) -> None:
+    """允许通过 /uploads 直接访问这些 blob（头像及其缩略图），非 blob URL 忽略"""
+    hashes = {sha256 for sha256 in map(parse_blob_url, urls) if sha256}
+    if not hashes:
+        return
+    db.query(Blob).filter(Blob.sha256.in_(hashes), Blob.is_public.is_(False)).update(
+        {Blob.is_public: True}, synchronize_session=False
+    )
+    db.commit()
+
+
+def is_public_blob(db: Session, sha256: str) -> bool:
+    """blob 是否允许公开访问（其余内容只能通过鉴权的接口读取）"""
+    is_public = db.query(Blob.is_public).filter(Blob.sha256 == sha256).scalar()
+    db.commit()
+    return bool(is_public)
+
+
+def _delete_if_unreferenced(db: Session, sha256: str) -> bool:
+    # 引用计数由批量更新修改，需重新读取（异步会话提交后不会过期已加载的对象）
+    blob = db.query(Blob).filter(Blob.sha256 == sha256).populate_existing().first()
+    if blob is None or blob.ref_count > 0:
+        return False
+    path = blob_path(blob)
+    # 条件删除，避免与并发的新引用冲突
+    deleted = db.query(Blob).filter(Blob.sha256 == sha256, Blob.ref_count <= 0).delete(
+        synchronize_session=False
+    )
+    db.commit()
+    if deleted:
+        path.unlink(missing_ok=True)
+        _release_artifacts(db, sha256)
+    return bool(deleted)
+
+
+def _release_artifacts(db: Session, source_sha256: str) -> None:
+    """源文件被回收时删除由它预处理得到的派生记录，并释放派生文件"""
+    urls = [url for (url,) in db.query(BlobArtifact.url).filter(BlobArtifact.source_sha256 == source_sha256)]
+    if not urls:
+        return
+    db.query(BlobArtifact).filter(BlobArtifact.source_sha256 == source_sha256).delete(synchronize_session=False)
+    db.commit()
+    for url in urls:
+        release(db, url)
+
+
+def collect_garbage(db: Session) -> Dict[str, int]:
+    """
+    全量回收：删除引用计数为 0 的 blob、没有登记的孤儿文件和残留的临时文件
+    """
+    removed_blobs = 0
+    for (sha256,) in db.query(Blob.sha256).filter(Blob.ref_count <= 0).all():
+        if _delete_if_unreferenced(db, sha256):
+            removed_blobs += 1
+
+    known = {sha256 for (sha256,) in db.query(Blob.sha256).all()}
+    removed_files = 0
+    blob_root = settings.UPLOAD_DIR / BLOB_SUBDIR
+    if blob_root.exists():
+        for path in blob_root.glob("*/*/*"):
+            if path.stem in known:
+                continue
+            # 快照之后可能有新登记的 blob，删除前再确认一次
+            if db.query(Blob.sha256).filter(Blob.sha256 == path.stem).first() is None:
+                path.unlink(missing_ok=True)
+                removed_files += 1
+
+    tmp_root = settings.UPLOAD_DIR / "tmp"
+    if tmp_root.exists():
+        # 只清理超过一小时的临时文件，避免误删正在写入的上传
+        cutoff = time.time() - 3600
+        for path in tmp_root.iterdir():
+            if path.is_file() and path.stat().st_mtime < cutoff:
+                path.unlink(missing_ok=True)
+                removed_files += 1
+
+    return {"removed_blobs": removed_blobs, "removed_files": removed_files}
@@ -0,0 +1,203 @@
+"""
+结果缓存服务 - 情绪分析/生成结果的多级缓存
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Hashable, Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app.models.cache import AnalysisCacheEntry
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+
+
+class TTLCache:
+    """线程安全的 LRU 缓存，条目超过 TTL 后失效"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= now:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: float = None) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLCacheTier:
+    """基于 analysis_cache 表的二级缓存，多个 worker 进程共享"""
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal):
+        self._session_factory = session_factory
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        db = self._session_factory()
+        try:
+            entry = db.query(AnalysisCacheEntry).filter(
+                AnalysisCacheEntry.cache_key == key,
+                AnalysisCacheEntry.expires_at > datetime.utcnow()
+            ).first()
+            return entry.value if entry else None
+        finally:
+            db.close()
+
+    def set(self, key: str, value: Dict[str, Any], ttl_seconds: float) -> None:
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl_seconds)
+        db = self._session_factory()
+        try:
+            updated = db.query(AnalysisCacheEntry).filter(
+                AnalysisCacheEntry.cache_key == key
+            ).update({
+                AnalysisCacheEntry.value: value,
+                AnalysisCacheEntry.expires_at: expires_at,
+            }, synchronize_session=False)
+            if not updated:
+                db.add(AnalysisCacheEntry(cache_key=key, value=value, expires_at=expires_at))
+            try:
+                db.commit()
+            except IntegrityError:
+                # 其他进程已写入相同 key
+                db.rollback()
+        finally:
+            db.close()
+
+    def purge_expired(self) -> int:
+        db = self._session_factory()
+        try:
+            deleted = db.query(AnalysisCacheEntry).filter(
+                AnalysisCacheEntry.expires_at <= datetime.utcnow()
+            ).delete(synchronize_session=False)
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+
+class AnalysisCache:
+    """内存 LRU + 可选数据库二级缓存，统计命中率"""
+
+    def __init__(
+        self,
+        max_entries: int = None,
+        ttl_seconds: float = None,
+        sql_tier: Optional[SQLCacheTier] = None
+    ):
+        self.ttl_seconds = ttl_seconds or settings.ANALYSIS_CACHE_TTL_SECONDS
+        self.memory = TTLCache(max_entries or settings.ANALYSIS_CACHE_MAX_ENTRIES, self.ttl_seconds)
+        self.sql_tier = sql_tier
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "sql_hits": 0, "misses": 0, "sets": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+
+        if self.sql_tier is not None:
+            value = self.sql_tier.get(key)
+            if value is not None:
+                self._count("sql_hits")
+                self.memory.set(key, value)
+                return value
+
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        self._count("sets")
+        self.memory.set(key, value)
+        if self.sql_tier is not None:
+            self.sql_tier.set(key, value, self.ttl_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["memory_hits"] + stats["sql_hits"] + stats["misses"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        stats["sql_tier"] = self.sql_tier is not None
+        return stats
+
+
+def normalize_text(text: str) -> str:
+    """文本归一化：全角转半角、统一大小写、合并空白"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def make_analysis_key(
+    input_type: str,
+    duration: int,
+    content: str = None,
+    content_hash: str = None
+) -> Optional[str]:
+    """
+    生成缓存 key：文本按归一化内容，语音/图片按上传文件的内容哈希
+    """
+    if content_hash:
+        source = content_hash
+    elif content:
+        source = normalize_text(content)
+    else:
+        return None
+    raw = f"{input_type}|{duration}|{source}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+_analysis_cache: Optional[AnalysisCache] = None
+
+
+def get_analysis_cache() -> Optional[AnalysisCache]:
+    """返回全局分析缓存，未启用时返回 None"""
+    global _analysis_cache
+    if not settings.ANALYSIS_CACHE_ENABLED:
+        return None
+    if _analysis_cache is None:
+        sql_tier = SQLCacheTier() if settings.ANALYSIS_CACHE_SQL_TIER else None
+        _analysis_cache = AnalysisCache(sql_tier=sql_tier)
+    return _analysis_cache
+
+
+def set_analysis_cache(cache: Optional[AnalysisCache]) -> None:
+    """替换全局分析缓存（测试时注入）"""
+    global _analysis_cache
+    _analysis_cache = cache
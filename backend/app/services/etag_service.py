@@ -0,0 +1,78 @@
+"""
+HTTP 缓存服务 - 按用户内容版本生成 ETag / Last-Modified，处理条件请求
+"""
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Any, Dict, Optional
+from fastapi import Request, Response
+from app.database import DBSession, run_db
+from app.services.stats_service import get_version
+from app.services.stream_service import stream_url_expiry
+import hashlib
+
+
+@dataclass
+class Validators:
+    """一个响应的缓存校验信息"""
+    etag: str
+    last_modified: Optional[datetime] = None
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        # 按用户区分的内容：只允许客户端缓存，每次使用前都要带 If-None-Match 校验
+        headers = {"ETag": self.etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+        if self.last_modified is not None:
+            modified = self.last_modified
+            if modified.tzinfo is None:
+                modified = modified.replace(tzinfo=timezone.utc)
+            headers["Last-Modified"] = format_datetime(modified.astimezone(timezone.utc), usegmt=True)
+        return headers
+
+    def matches(self, request: Request) -> bool:
+        """If-None-Match 是否命中（弱比较，W/ 前缀视为相同）"""
+        header = request.headers.get("if-none-match")
+        if not header:
+            return False
+        if header.strip() == "*":
+            return True
+        tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+        return self.etag.removeprefix("W/") in tags
+
+    def not_modified(self) -> Response:
+        return Response(status_code=304, headers=self.headers)
+
+
+async def content_validators(
+    request: Request,
+    db: DBSession,
+    user_id: int,
+    *parts: Any
+) -> Optional[Validators]:
+    """
+    按用户内容版本生成校验信息，统计行缺失时返回 None（不缓存）
+
+    需在查询响应数据之前调用：版本先于数据读取，并发写入只会让 ETag 偏旧，
+    客户端下次请求会重新获取，不会把新数据当成未修改。
+    只比较 ETag；Last-Modified 精度为秒，同一秒内的多次写入无法区分，不用于 304 判断。
+    parts 为影响响应但不在 URL 中的因素（如按当前月份计算的统计）。
+
+    版本只取数据库中持久化的 user_stats.version，各进程对同一内容生成相同的 ETag；
+    缓冲中的播放次数写回时才递增版本，因此 ETag 为弱校验：响应中合并的未写回播放次数
+    可能与 ETag 生成时不同，最多滞后一个写回周期（PLAY_COUNT_FLUSH_INTERVAL）。
+    响应中的签名播放地址按时间窗变化，时间窗计入 ETag，304 不会让客户端继续使用快过期的地址。
+    """
+    version = await run_db(db, get_version, user_id)
+    if version is None:
+        return None
+    number, updated_at = version
+    key = "|".join(str(part) for part in (
+        user_id,
+        number,
+        request.url.path,
+        sorted(request.query_params.multi_items()),
+        stream_url_expiry(),
+        *parts,
+    ))
+    etag = 'W/"' + hashlib.sha1(key.encode()).hexdigest()[:20] + '"'
+    return Validators(etag=etag, last_modified=updated_at)
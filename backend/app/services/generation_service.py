@@ -0,0 +1,174 @@
+"""
+音乐生成服务 - 任务提交与执行
+"""
+from sqlalchemy.orm import Session
+from typing import Awaitable, Callable, Dict, Optional
+from app.models.music import Music
+from app.services.job_queue import Job, get_job_queue
+from app.services.music_service import update_music_status
+from app.services.progress_service import record_progress
+from app.services.cache_service import get_analysis_cache, make_analysis_key
+from app.services.inference_service import get_inference_scheduler
+from app.services.preprocess_service import prepare_image_input, prepare_voice_input
+from app.services.transcode_service import transcode_music
+from app.services.waveform_service import analyze_music
+from app.config import settings
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+GENERATE_MUSIC_JOB = "generate_music"
+TRANSCODE_MUSIC_JOB = "transcode_music"
+ANALYZE_AUDIO_JOB = "analyze_audio"
+
+# 非预期错误（数据库、驱动、模型异常等）展示给用户的失败原因，具体错误只记录在日志和任务的 last_error 中
+GENERATION_FAILED_MESSAGE = "音乐生成失败，请重新生成"
+
+
+def enqueue_generation(music: Music, music_url: str, input_hash: str = None) -> int:
+    """提交音乐生成任务到队列，返回任务 ID（input_hash 为上传媒体的内容哈希）"""
+    input_type = getattr(music.input_type, "value", music.input_type)
+    cache_key = make_analysis_key(
+        input_type,
+        music.duration,
+        content=music.input_content if input_type == "text" else None,
+        content_hash=input_hash
+    )
+    return get_job_queue().enqueue(
+        music_id=music.id,
+        job_type=GENERATE_MUSIC_JOB,
+        payload={
+            "music_url": music_url,
+            "input_type": input_type,
+            "input_hash": input_hash,
+            "cache_key": cache_key,
+        }
+    )
+
+
+async def _progress(db: Session, music_id: int, step: str, **kwargs) -> None:
+    """在线程中写入进度，数据库调用不阻塞 worker 的事件循环"""
+    await asyncio.to_thread(record_progress, db, music_id, step, **kwargs)
+
+
+def _load_input(db: Session, music_id: int):
+    row = db.query(Music.input_content, Music.duration).filter(Music.id == music_id).first()
+    db.commit()
+    return (row.input_content, row.duration) if row else (None, None)
+
+
+async def prepare_input(db: Session, job: Job) -> Dict:
+    """
+    读取输入内容并按类型预处理，返回推理输入
+
+    图片带上 similar_key：按感知哈希生成的缓存 key，近似图片共用分析结果。
+    """
+    input_type = job.payload.get("input_type") or "text"
+    content, duration = await asyncio.to_thread(_load_input, db, job.music_id)
+    item = {"music_id": job.music_id, "content": content}
+    if input_type == "voice":
+        # 解码、重采样并去除静音，模型只处理规范化后的短音频
+        await _progress(db, job.music_id, "preprocessing", progress=5, message="正在处理语音")
+        item["voice"] = await prepare_voice_input(db, job, content)
+    elif input_type == "image":
+        # 缩小到模型输入尺寸并计算感知哈希
+        await _progress(db, job.music_id, "preprocessing", progress=5, message="正在处理图片")
+        image = await prepare_image_input(db, job, content)
+        item["image"] = image
+        if image:
+            item["similar_key"] = make_analysis_key(
+                input_type, duration, content_hash="phash:" + (image["similar_phash"] or image["phash"])
+            )
+    return item
+
+
+async def analyze_and_generate(db: Session, job: Job, item: Dict) -> Dict:
+    """
+    情绪分析（经推理调度器与其他任务合批）与音乐生成（模拟，实际项目中替换为真实的生成逻辑）
+    """
+    await _progress(db, job.music_id, "analyzing", progress=10, message="正在分析输入情绪")
+    result = await get_inference_scheduler().submit(job.payload.get("input_type") or "text", item)
+
+    await _progress(db, job.music_id, "composing", progress=50, message="正在创作音乐")
+    await asyncio.sleep(1)  # 模拟生成时间
+
+    return result
+
+
+async def generate_music(db: Session, job: Job) -> None:
+    """
+    执行音乐生成任务，相同输入（图片包括近似图片）直接复用缓存的分析结果
+    """
+    cache = get_analysis_cache()
+    cache_key = job.payload.get("cache_key")
+    # 启用数据库二级缓存时读写会访问数据库，放到线程中执行
+    result = await asyncio.to_thread(cache.get, cache_key) if cache and cache_key else None
+
+    if result is None:
+        item = await prepare_input(db, job)
+        similar_key = item.pop("similar_key", None)
+        result = await asyncio.to_thread(cache.get, similar_key) if cache and similar_key else None
+        if result is None:
+            result = await analyze_and_generate(db, job, item)
+        else:
+            await _progress(db, job.music_id, "analyzing", progress=50, message="命中近似图片的分析缓存")
+        if cache:
+            for key in (cache_key, similar_key):
+                if key:
+                    await asyncio.to_thread(cache.set, key, result)
+    else:
+        await _progress(db, job.music_id, "analyzing", progress=50, message="命中分析缓存")
+
+    await asyncio.to_thread(complete_generation, db, job, result)
+
+
+def complete_generation(db: Session, job: Job, result: Dict) -> None:
+    """保存分析结果并标记完成，提交后处理任务"""
+    update_music_status(
+        db=db,
+        music_id=job.music_id,
+        status="completed",
+        music_url=job.payload.get("music_url"),
+        emotion_tags=result.get("emotion_tags"),
+        primary_emotion=result.get("primary_emotion"),
+        ai_analysis=result.get("ai_analysis")
+    )
+    record_progress(db, job.music_id, "completed", status="completed", progress=100)
+
+    # 后处理：转码为多码率版本、计算波形与指纹（独立任务，失败重试不影响已完成的音乐）
+    if settings.TRANSCODE_ENABLED:
+        get_job_queue().enqueue(
+            music_id=job.music_id,
+            job_type=TRANSCODE_MUSIC_JOB,
+            payload={"music_url": job.payload.get("music_url")}
+        )
+    if settings.WAVEFORM_ENABLED:
+        get_job_queue().enqueue(
+            music_id=job.music_id,
+            job_type=ANALYZE_AUDIO_JOB,
+            payload={"music_url": job.payload.get("music_url")}
+        )
+
+
+def mark_generation_failed(db: Session, job: Job, error: str, message: Optional[str] = None) -> None:
+    """
+    任务最终失败时同步音乐状态（转码、波形分析等后处理失败只记录日志，仍可播放原始文件）
+
+    error 为内部错误描述，只写入日志；message 为可以展示给用户的失败原因（如无法识别的上传文件），
+    没有时记录通用的失败信息。
+    """
+    if job.job_type != GENERATE_MUSIC_JOB:
+        logger.warning("%s for music %s failed: %s", job.job_type, job.music_id, error)
+        return
+    logger.warning("generation for music %s failed: %s", job.music_id, error)
+    update_music_status(db=db, music_id=job.music_id, status="failed")
+    record_progress(db, job.music_id, "failed", status="failed", message=message or GENERATION_FAILED_MESSAGE)
+
+
+# 任务类型 -> 处理函数
+JOB_HANDLERS: Dict[str, Callable[[Session, Job], Awaitable[None]]] = {
+    GENERATE_MUSIC_JOB: generate_music,
+    TRANSCODE_MUSIC_JOB: transcode_music,
+    ANALYZE_AUDIO_JOB: analyze_music,
+}
@@ -0,0 +1,199 @@
+"""
+推理调度服务 - 按输入类型把并发的分析请求合并成批次，一次前向计算后把结果分发给各任务
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Protocol, Union
+import numpy as np
+from app.config import settings
+from app.services.model_registry import get_model_registry, mmap_safetensors
+import asyncio
+import hashlib
+import importlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+EMOTION_MODEL = "emotion"
+
+
+class EmotionModel(Protocol):
+    """情绪分析模型接口：一次处理同一输入类型的一批输入，按顺序返回结果"""
+
+    def predict_batch(self, input_type: str, inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        ...
+
+
+# 关键词表（命中多个时取第一个）
+_KEYWORDS = [
+    ("happy", ("开心", "快乐", "高兴", "happy", "joy")),
+    ("sad", ("难过", "伤心", "孤独", "sad", "lonely")),
+    ("energetic", ("运动", "跑步", "兴奋", "run", "excited")),
+    ("calm", ("平静", "放松", "安静", "calm", "relax")),
+]
+_EMOTIONS = ["happy", "sad", "energetic", "calm", "peaceful", "romantic"]
+_COMPANIONS = {"happy": "energetic", "sad": "peaceful", "energetic": "happy", "calm": "peaceful"}
+_LABELS = {"happy": "欢快", "sad": "忧伤", "energetic": "活力", "calm": "平静", "peaceful": "舒缓", "romantic": "浪漫"}
+
+
+class KeywordEmotionModel:
+    """
+    内置的规则模型（未配置 EMOTION_MODEL_LOADER 时使用）
+
+    结果由输入内容确定：文本按关键词，其他按内容哈希；提供权重时用 classifier.weight 对哈希特征打分。
+    """
+
+    def __init__(self, weights: Dict[str, np.ndarray] = None):
+        self.weights = weights or {}
+        self.mapped_bytes = getattr(weights, "mapped_bytes", 0)
+        self.batches = 0
+
+    def predict_batch(self, input_type: str, inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        self.batches += 1
+        return [self._predict(input_type, item) for item in inputs]
+
+    def _classify(self, key: str) -> str:
+        classifier = self.weights.get("classifier.weight")
+        digest = hashlib.sha256(key.encode()).digest()
+        if classifier is None or classifier.shape[0] != len(_EMOTIONS):
+            return _EMOTIONS[digest[0] % len(_EMOTIONS)]
+        features = np.resize(np.frombuffer(digest, dtype=np.uint8), classifier.shape[1]).astype(np.float32)
+        return _EMOTIONS[int(np.argmax(classifier @ (features / 255 - 0.5)))]
+
+    def _predict(self, input_type: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        content = str(item.get("content") or "")
+        primary = None
+        if input_type == "text":
+            lowered = content.lower()
+            primary = next((emotion for emotion, words in _KEYWORDS if any(w in lowered for w in words)), None)
+        if primary is None:
+            primary = self._classify(f"{input_type}:{content}")
+        tags = [primary, _COMPANIONS.get(primary, "calm")]
+        return {
+            "emotion_tags": tags,
+            "primary_emotion": primary,
+            "ai_analysis": f"基于您的输入，生成了一首{'、'.join(_LABELS[tag] for tag in tags)}的音乐。",
+        }
+
+
+def load_emotion_model() -> EmotionModel:
+    """
+    情绪模型加载函数（由模型注册表调用）
+
+    配置了 EMOTION_MODEL_LOADER 时调用该函数加载（如真实模型、基准用的模拟耗时模型），
+    否则使用内置的关键词模型；配置了权重文件时以内存映射方式读取。
+    """
+    if settings.EMOTION_MODEL_LOADER:
+        module_name, _, attr = settings.EMOTION_MODEL_LOADER.partition(":")
+        return getattr(importlib.import_module(module_name), attr)()
+    weights = mmap_safetensors(settings.EMOTION_MODEL_WEIGHTS) if settings.EMOTION_MODEL_WEIGHTS else None
+    return KeywordEmotionModel(weights=weights)
+
+
+def warm_emotion_model(model: EmotionModel) -> None:
+    for input_type in ("text", "voice", "image"):
+        model.predict_batch(input_type, [{"content": "warmup"}])
+
+
+@dataclass
+class _Lane:
+    """同一输入类型的等待队列"""
+    items: List[tuple] = field(default_factory=list)
+    full: asyncio.Event = field(default_factory=asyncio.Event)
+    runner: Optional[asyncio.Task] = None
+
+
+class BatchScheduler:
+    """
+    微批调度器：同一输入类型的请求最多等待 max_wait_ms 或凑满 max_batch_size 条后一起推理
+
+    每个输入类型同时只有一个批次在推理（在线程中执行，不阻塞事件循环），
+    推理期间到达的请求进入下一批。批次大小受当前进程中并发执行的任务数限制（WORKER_CONCURRENCY）。
+    model 为模型名时从模型注册表获取，首次推理时在推理线程中加载。只在创建它的事件循环中使用。
+    """
+
+    def __init__(self, model: Union[EmotionModel, str], max_batch_size: int = None, max_wait_ms: int = None):
+        self.model = model
+        self.max_batch_size = max_batch_size or settings.INFERENCE_BATCH_MAX_SIZE
+        self.max_wait = (settings.INFERENCE_BATCH_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000
+        self._lanes: Dict[str, _Lane] = {}
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, input_type: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        """提交一条输入，等待所在批次推理完成后返回它的结果"""
+        lane = self._lanes.get(input_type)
+        if lane is None:
+            lane = self._lanes[input_type] = _Lane()
+        future = asyncio.get_running_loop().create_future()
+        lane.items.append((time.monotonic(), item, future))
+        if len(lane.items) >= self.max_batch_size:
+            lane.full.set()
+        if lane.runner is None:
+            lane.runner = asyncio.create_task(self._run(input_type, lane))
+        return await future
+
+    async def _run(self, input_type: str, lane: _Lane) -> None:
+        try:
+            while lane.items:
+                # 从最早一条的到达时间起最多等待 max_wait
+                remaining = lane.items[0][0] + self.max_wait - time.monotonic()
+                if len(lane.items) < self.max_batch_size and remaining > 0:
+                    try:
+                        await asyncio.wait_for(lane.full.wait(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                batch = lane.items[:self.max_batch_size]
+                del lane.items[:self.max_batch_size]
+                if len(lane.items) < self.max_batch_size:
+                    lane.full.clear()
+                # 已取消的任务（租约丢失、worker 停止）不再推理
+                batch = [entry for entry in batch if not entry[2].done()]
+                if batch:
+                    await self._infer(input_type, batch)
+        finally:
+            lane.runner = None
+            if self._lanes.get(input_type) is lane and not lane.items:
+                del self._lanes[input_type]
+
+    def _predict(self, input_type: str, inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        model = get_model_registry().get(self.model) if isinstance(self.model, str) else self.model
+        return model.predict_batch(input_type, inputs)
+
+    async def _infer(self, input_type: str, batch: List[tuple]) -> None:
+        started = time.perf_counter()
+        try:
+            results = await asyncio.to_thread(self._predict, input_type, [item for _, item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"model returned {len(results)} results for {len(batch)} inputs")
+        except Exception as exc:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        self.batches += 1
+        self.items += len(batch)
+        logger.debug(
+            "%s batch of %d inferred in %.0f ms",
+            input_type, len(batch), (time.perf_counter() - started) * 1000
+        )
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+_scheduler: Optional[BatchScheduler] = None
+
+
+def get_inference_scheduler() -> BatchScheduler:
+    """全局推理调度器（首次使用时创建）"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = BatchScheduler(EMOTION_MODEL)
+    return _scheduler
+
+
+def set_inference_scheduler(scheduler: Optional[BatchScheduler]) -> None:
+    """替换全局推理调度器（测试、基准时注入其他模型或批次参数）"""
+    global _scheduler
+    _scheduler = scheduler
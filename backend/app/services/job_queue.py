@@ -0,0 +1,357 @@
+"""
+生成任务队列 - 数据库持久化队列与进程内队列
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app.models.job import GenerationJob, JobStatus
+import threading
+
+
+@dataclass
+class Job:
+    """worker 领取到的任务快照（与数据库会话解耦）"""
+    id: int
+    music_id: int
+    job_type: str
+    payload: Dict[str, Any] = field(default_factory=dict)
+    attempts: int = 0
+    max_attempts: int = 3
+
+
+class PermanentJobError(Exception):
+    """任务输入本身无法处理（如无法解码的上传文件），重试也不会成功，任务直接判定失败"""
+
+
+def _utcnow() -> datetime:
+    return datetime.utcnow()
+
+
+def compute_backoff(attempts: int) -> float:
+    """计算第 attempts 次失败后的重试等待时间（指数退避）"""
+    delay = settings.JOB_RETRY_BACKOFF_SECONDS * (2 ** max(attempts - 1, 0))
+    return min(delay, settings.JOB_RETRY_BACKOFF_MAX_SECONDS)
+
+
+class JobQueue:
+    """任务队列接口"""
+
+    def enqueue(
+        self,
+        music_id: int,
+        job_type: str,
+        payload: Dict[str, Any] = None,
+        max_attempts: int = None
+    ) -> int:
+        """提交任务，返回任务 ID"""
+        raise NotImplementedError
+
+    def claim(self, worker_id: str, lease_seconds: int) -> Optional[Job]:
+        """领取一个可执行任务并加租约，队列为空时返回 None"""
+        raise NotImplementedError
+
+    def heartbeat(self, job_id: int, worker_id: str, lease_seconds: int) -> bool:
+        """续约，租约已被他人接管时返回 False"""
+        raise NotImplementedError
+
+    def complete(self, job_id: int, worker_id: str) -> None:
+        """标记任务成功"""
+        raise NotImplementedError
+
+    def fail(self, job_id: int, worker_id: str, error: str, retry: bool = True) -> bool:
+        """标记任务失败，返回是否会重试（retry 为 False 或已达最大尝试次数时直接判定失败）"""
+        raise NotImplementedError
+
+    def release(self, job_id: int, worker_id: str) -> None:
+        """归还未完成的任务（worker 停止时），不计入失败"""
+        raise NotImplementedError
+
+
+class DatabaseJobQueue(JobQueue):
+    """基于数据库表的持久化队列，API 重启或部署时任务不会丢失"""
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal, claim_batch: int = 5):
+        self._session_factory = session_factory
+        self._claim_batch = claim_batch
+
+    @staticmethod
+    def _claimable(now: datetime):
+        return or_(
+            and_(
+                GenerationJob.status == JobStatus.pending,
+                GenerationJob.available_at <= now
+            ),
+            and_(
+                GenerationJob.status == JobStatus.running,
+                GenerationJob.lease_expires_at < now
+            )
+        )
+
+    @staticmethod
+    def _owned(job_id: int, worker_id: str):
+        return and_(
+            GenerationJob.id == job_id,
+            GenerationJob.status == JobStatus.running,
+            GenerationJob.locked_by == worker_id
+        )
+
+    def enqueue(
+        self,
+        music_id: int,
+        job_type: str,
+        payload: Dict[str, Any] = None,
+        max_attempts: int = None
+    ) -> int:
+        db = self._session_factory()
+        try:
+            job = GenerationJob(
+                music_id=music_id,
+                job_type=job_type,
+                payload=payload or {},
+                status=JobStatus.pending,
+                attempts=0,
+                max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+                available_at=_utcnow()
+            )
+            db.add(job)
+            db.commit()
+            return job.id
+        finally:
+            db.close()
+
+    def claim(self, worker_id: str, lease_seconds: int) -> Optional[Job]:
+        now = _utcnow()
+        db = self._session_factory()
+        try:
+            candidates = db.query(GenerationJob.id).filter(
+                self._claimable(now)
+            ).order_by(GenerationJob.available_at, GenerationJob.id).limit(self._claim_batch).all()
+
+            for (job_id,) in candidates:
+                # 条件更新实现乐观加锁：只有一个 worker 能把该行改成功
+                updated = db.query(GenerationJob).filter(
+                    GenerationJob.id == job_id,
+                    self._claimable(now)
+                ).update({
+                    GenerationJob.status: JobStatus.running,
+                    GenerationJob.locked_by: worker_id,
+                    GenerationJob.lease_expires_at: now + timedelta(seconds=lease_seconds),
+                    GenerationJob.heartbeat_at: now,
+                    GenerationJob.attempts: GenerationJob.attempts + 1,
+                }, synchronize_session=False)
+                db.commit()
+
+                if updated:
+                    job = db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+                    return Job(
+                        id=job.id,
+                        music_id=job.music_id,
+                        job_type=job.job_type,
+                        payload=job.payload or {},
+                        attempts=job.attempts,
+                        max_attempts=job.max_attempts
+                    )
+            return None
+        finally:
+            db.close()
+
+    def heartbeat(self, job_id: int, worker_id: str, lease_seconds: int) -> bool:
+        now = _utcnow()
+        db = self._session_factory()
+        try:
+            updated = db.query(GenerationJob).filter(self._owned(job_id, worker_id)).update({
+                GenerationJob.lease_expires_at: now + timedelta(seconds=lease_seconds),
+                GenerationJob.heartbeat_at: now,
+            }, synchronize_session=False)
+            db.commit()
+            return bool(updated)
+        finally:
+            db.close()
+
+    def complete(self, job_id: int, worker_id: str) -> None:
+        db = self._session_factory()
+        try:
+            db.query(GenerationJob).filter(self._owned(job_id, worker_id)).update({
+                GenerationJob.status: JobStatus.succeeded,
+                GenerationJob.locked_by: None,
+                GenerationJob.lease_expires_at: None,
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def fail(self, job_id: int, worker_id: str, error: str, retry: bool = True) -> bool:
+        db = self._session_factory()
+        try:
+            job = db.query(GenerationJob).filter(self._owned(job_id, worker_id)).first()
+            if not job:
+                return False
+
+            job.last_error = error
+            job.locked_by = None
+            job.lease_expires_at = None
+            retry = retry and job.attempts < job.max_attempts
+            if retry:
+                job.status = JobStatus.pending
+                job.available_at = _utcnow() + timedelta(seconds=compute_backoff(job.attempts))
+            else:
+                job.status = JobStatus.failed
+            db.commit()
+            return retry
+        finally:
+            db.close()
+
+    def release(self, job_id: int, worker_id: str) -> None:
+        db = self._session_factory()
+        try:
+            db.query(GenerationJob).filter(self._owned(job_id, worker_id)).update({
+                GenerationJob.status: JobStatus.pending,
+                GenerationJob.attempts: GenerationJob.attempts - 1,
+                GenerationJob.available_at: _utcnow(),
+                GenerationJob.locked_by: None,
+                GenerationJob.lease_expires_at: None,
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+class LocalJobQueue(JobQueue):
+    """进程内队列，语义与数据库队列一致，用于测试和单进程调试（不持久化）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: Dict[int, Dict[str, Any]] = {}
+        self._next_id = 1
+
+    def enqueue(
+        self,
+        music_id: int,
+        job_type: str,
+        payload: Dict[str, Any] = None,
+        max_attempts: int = None
+    ) -> int:
+        with self._lock:
+            job_id = self._next_id
+            self._next_id += 1
+            self._jobs[job_id] = {
+                "id": job_id,
+                "music_id": music_id,
+                "job_type": job_type,
+                "payload": payload or {},
+                "status": JobStatus.pending,
+                "attempts": 0,
+                "max_attempts": max_attempts or settings.JOB_MAX_ATTEMPTS,
+                "available_at": _utcnow(),
+                "locked_by": None,
+                "lease_expires_at": None,
+                "last_error": None,
+            }
+            return job_id
+
+    def _claimable(self, job: Dict[str, Any], now: datetime) -> bool:
+        if job["status"] == JobStatus.pending:
+            return job["available_at"] <= now
+        if job["status"] == JobStatus.running:
+            return job["lease_expires_at"] is not None and job["lease_expires_at"] < now
+        return False
+
+    def _owned(self, job_id: int, worker_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        if job and job["status"] == JobStatus.running and job["locked_by"] == worker_id:
+            return job
+        return None
+
+    def claim(self, worker_id: str, lease_seconds: int) -> Optional[Job]:
+        now = _utcnow()
+        with self._lock:
+            candidates = sorted(
+                (j for j in self._jobs.values() if self._claimable(j, now)),
+                key=lambda j: (j["available_at"], j["id"])
+            )
+            if not candidates:
+                return None
+            job = candidates[0]
+            job["status"] = JobStatus.running
+            job["locked_by"] = worker_id
+            job["lease_expires_at"] = now + timedelta(seconds=lease_seconds)
+            job["attempts"] += 1
+            return Job(
+                id=job["id"],
+                music_id=job["music_id"],
+                job_type=job["job_type"],
+                payload=dict(job["payload"]),
+                attempts=job["attempts"],
+                max_attempts=job["max_attempts"]
+            )
+
+    def heartbeat(self, job_id: int, worker_id: str, lease_seconds: int) -> bool:
+        with self._lock:
+            job = self._owned(job_id, worker_id)
+            if not job:
+                return False
+            job["lease_expires_at"] = _utcnow() + timedelta(seconds=lease_seconds)
+            return True
+
+    def complete(self, job_id: int, worker_id: str) -> None:
+        with self._lock:
+            job = self._owned(job_id, worker_id)
+            if job:
+                job["status"] = JobStatus.succeeded
+                job["locked_by"] = None
+                job["lease_expires_at"] = None
+
+    def fail(self, job_id: int, worker_id: str, error: str, retry: bool = True) -> bool:
+        with self._lock:
+            job = self._owned(job_id, worker_id)
+            if not job:
+                return False
+            job["last_error"] = error
+            job["locked_by"] = None
+            job["lease_expires_at"] = None
+            retry = retry and job["attempts"] < job["max_attempts"]
+            if retry:
+                job["status"] = JobStatus.pending
+                job["available_at"] = _utcnow() + timedelta(seconds=compute_backoff(job["attempts"]))
+            else:
+                job["status"] = JobStatus.failed
+            return retry
+
+    def release(self, job_id: int, worker_id: str) -> None:
+        with self._lock:
+            job = self._owned(job_id, worker_id)
+            if job:
+                job["status"] = JobStatus.pending
+                job["attempts"] -= 1
+                job["available_at"] = _utcnow()
+                job["locked_by"] = None
+                job["lease_expires_at"] = None
+
+    def jobs(self) -> List[Dict[str, Any]]:
+        """返回所有任务的副本（便于测试断言）"""
+        with self._lock:
+            return [dict(j) for j in self._jobs.values()]
+
+
+_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """根据配置返回全局任务队列实例"""
+    global _queue
+    if _queue is None:
+        if settings.JOB_QUEUE_BACKEND == "local":
+            _queue = LocalJobQueue()
+        else:
+            _queue = DatabaseJobQueue()
+    return _queue
+
+
+def set_job_queue(queue: JobQueue) -> None:
+    """替换全局任务队列（测试时注入 LocalJobQueue）"""
+    global _queue
+    _queue = queue
@@ -0,0 +1,178 @@
+"""
+模型注册表 - 首次使用时加载模型，可在启动时预加载 / 预热，记录每个模型的加载耗时与内存
+"""
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Optional
+import numpy as np
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# safetensors 的数据类型 -> NumPy 类型（BF16 没有对应类型，按原始 16 位读出）
+_SAFETENSORS_DTYPES = {
+    "F64": np.float64, "F32": np.float32, "F16": np.float16, "BF16": np.uint16,
+    "I64": np.int64, "I32": np.int32, "I16": np.int16, "I8": np.int8,
+    "U8": np.uint8, "BOOL": np.bool_,
+}
+
+
+class MappedWeights(dict):
+    """以只读内存映射方式打开的权重：张量名 -> NumPy 数组（不复制文件内容）"""
+    path: str = ""
+    mapped_bytes: int = 0
+
+
+def mmap_safetensors(path) -> MappedWeights:
+    """
+    把 safetensors 文件映射为只读 NumPy 数组
+
+    数组直接引用文件页，页属于系统页缓存：同一台机器上的多个 worker 进程
+    （无论 fork 还是 spawn 启动）共享同一份物理内存，只在首次访问时从磁盘读入。
+    PyTorch 模型可用 torch.from_numpy 包装后 load_state_dict(..., assign=True) 使用。
+    """
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    header_size = int.from_bytes(buffer[:8], "little")
+    header = json.loads(buffer[8:8 + header_size])
+    base = 8 + header_size
+    weights = MappedWeights()
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        start, end = info["data_offsets"]
+        dtype = np.dtype(_SAFETENSORS_DTYPES[info["dtype"]]).newbyteorder("<")
+        weights[name] = np.frombuffer(buffer, dtype=dtype, count=(end - start) // dtype.itemsize,
+                                      offset=base + start).reshape(info["shape"])
+    weights.path = str(path)
+    weights.mapped_bytes = len(buffer) - base
+    return weights
+
+
+def process_memory() -> Dict[str, int]:
+    """
+    当前进程的内存（字节）
+
+    rss 包含与其他进程共享的页；pss 把共享页按共享进程数均摊，多个 worker 的 pss 之和
+    才是它们实际占用的物理内存。非 Linux 系统只返回 rss。
+    """
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line and not line[0].isdigit())
+    except OSError:
+        import resource
+        # ru_maxrss 在 Linux 上为 KB、在 macOS 上为字节，这里只用于非 Linux 系统
+        return {"rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+    def kb(key: str) -> int:
+        return int(fields.get(key, "0 kB").split()[0]) * 1024
+
+    return {
+        "rss": kb("Rss"),
+        "pss": kb("Pss"),
+        "shared": kb("Shared_Clean") + kb("Shared_Dirty"),
+    }
+
+
+@dataclass
+class _Entry:
+    loader: Callable[[], Any]
+    warmup: Optional[Callable[[Any], None]] = None
+    model: Any = None
+    loaded: bool = False
+    warmed: bool = False
+    load_seconds: float = 0.0
+    rss_delta_bytes: int = 0
+    loaded_in_pid: Optional[int] = None
+
+
+class ModelRegistry:
+    """
+    按名称管理模型：首次 get 时加载（同一模型只加载一次，并发调用等待同一次加载）
+
+    preload 用于 gunicorn preload_app：在 master 进程 fork 前加载，worker 以写时复制方式共享权重；
+    fork 前只加载不推理（部分推理库的线程池在 fork 后不可用），预热在各 worker 启动后执行。
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, _Entry] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable[[], Any], warmup: Callable[[Any], None] = None) -> None:
+        """注册模型加载函数与可选的预热函数（用一条样例输入跑一次推理）"""
+        with self._lock:
+            self._entries[name] = _Entry(loader=loader, warmup=warmup)
+            self._locks[name] = threading.Lock()
+
+    def get(self, name: str) -> Any:
+        """返回已加载的模型，尚未加载时在当前线程加载（会阻塞，异步代码中请放到线程中调用）"""
+        entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(f"unknown model: {name}")
+        if entry.loaded:
+            return entry.model
+        with self._locks[name]:
+            if not entry.loaded:
+                rss_before = process_memory()["rss"]
+                started = time.perf_counter()
+                entry.model = entry.loader()
+                entry.load_seconds = time.perf_counter() - started
+                entry.rss_delta_bytes = process_memory()["rss"] - rss_before
+                entry.loaded_in_pid = os.getpid()
+                entry.loaded = True
+                logger.info("model %s loaded in %.2fs", name, entry.load_seconds)
+        return entry.model
+
+    def preload(self, names: Iterable[str]) -> None:
+        """加载模型但不推理（fork 前调用）"""
+        for name in names:
+            self.get(name)
+
+    def warm(self, names: Iterable[str]) -> None:
+        """加载并预热模型，让第一个真实请求不承担加载和首次推理的开销"""
+        for name in names:
+            model = self.get(name)
+            entry = self._entries[name]
+            if entry.warmup is not None and not entry.warmed:
+                entry.warmup(model)
+                entry.warmed = True
+
+    def stats(self) -> Dict[str, Any]:
+        models = {}
+        for name, entry in self._entries.items():
+            models[name] = {
+                "loaded": entry.loaded,
+                "warmed": entry.warmed,
+                "load_seconds": round(entry.load_seconds, 3),
+                "rss_delta_bytes": entry.rss_delta_bytes,
+                "mapped_bytes": getattr(entry.model, "mapped_bytes", 0),
+                # 在父进程（fork 前）加载的模型，权重页与其他 worker 共享
+                "inherited": entry.loaded and entry.loaded_in_pid != os.getpid(),
+            }
+        return {"models": models, "process": process_memory()}
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """全局模型注册表（首次使用时创建并注册内置模型）"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            registry = ModelRegistry()
+            _register_builtin(registry)
+            _registry = registry
+        return _registry
+
+
+def _register_builtin(registry: ModelRegistry) -> None:
+    from app.services.inference_service import EMOTION_MODEL, load_emotion_model, warm_emotion_model
+
+    registry.register(EMOTION_MODEL, load_emotion_model, warm_emotion_model)
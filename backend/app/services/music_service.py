@@ -1,14 +1,31 @@
 """
 音乐管理服务 - 完整版
 """
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
-from typing import List, Optional, Dict, Any
-from datetime import datetime, date
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import case, desc, func, exists, or_, and_, literal, literal_column, String
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from typing import List, Optional, Dict, Any, Tuple
+from datetime import datetime, date, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from collections import defaultdict
-from app.models.music import Music, Collection, InputType, MusicStatus
+from app.config import settings
+from app.models.music import Music, MusicRendition, Collection, InputType, MusicStatus
 from app.schemas.music import MusicCreate
+from app.services.blob_service import release
+from app.services.play_service import discard_pending_plays, get_play_counter, pending_plays, record_play
+from app.services.stats_service import (
+    music_contribution,
+    apply_music_change,
+    adjust_favorite_count,
+    bump_favorite_count,
+    bump_version,
+    get_stats_row,
+    month_key
+)
 from fastapi import HTTPException, status
+import base64
 import uuid
 import os
 
@@ -30,6 +47,25 @@ def get_music_by_id(db: Session, music_id: int, user_id: int) -> Music:
     return music
 
 
+def get_music_url(db: Session, music_id: int, user_id: int = None) -> str:
+    """
+    只读取音乐文件地址（user_id 为空时不校验归属，用于已验证签名的播放地址）
+
+    读取后结束事务、归还连接，发送文件期间不占用连接。
+    """
+    query = db.query(Music.music_url).filter(Music.id == music_id)
+    if user_id is not None:
+        query = query.filter(Music.user_id == user_id)
+    row = query.first()
+    db.commit()
+    if not row or not row.music_url:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="音乐不存在"
+        )
+    return row.music_url
+
+
 def get_user_musics(
     db: Session,
     user_id: int,
@@ -50,15 +86,76 @@ def get_user_musics(
     return query.order_by(desc(Music.created_at)).offset(skip).limit(limit).all()
 
 
+def encode_cursor(created_at: datetime, music_id: int) -> str:
+    """把 (created_at, id) 编码为分页游标"""
+    raw = f"{created_at.isoformat(sep=' ')}|{music_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """解析分页游标，返回 (created_at 字符串, id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, music_id = base64.urlsafe_b64decode(padded).decode().rsplit("|", 1)
+        datetime.fromisoformat(created_at)
+        return created_at, int(music_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的分页游标"
+        )
+
+
+def favorite_exists(user_id: int):
+    """当前用户是否收藏该音乐的 EXISTS 子查询"""
+    return exists().where(
+        Collection.user_id == user_id,
+        Collection.music_id == Music.id
+    )
+
+
+# 列表精简视图加载的列，input_content、ai_analysis 等大字段只在完整视图和详情中读取
+LIST_ITEM_COLUMNS = (
+    Music.id, Music.user_id, Music.title, Music.input_type, Music.emotion_tags,
+    Music.primary_emotion, Music.music_url, Music.cover_url, Music.duration,
+    Music.status, Music.is_public, Music.play_count, Music.created_at, Music.updated_at,
+)
+
+
+def list_columns(view: str) -> Tuple:
+    """列表视图对应的列投影（full 为全部列，compact 为精简列）"""
+    if view == "compact":
+        return LIST_ITEM_COLUMNS
+    return tuple(Music.__table__.c)
+
+
+def music_row_with_favorite(row) -> Dict:
+    """把投影行转换为带收藏状态的字典，并合并未写回的播放次数"""
+    item = dict(row._mapping)
+    item["is_favorite"] = bool(item["is_favorite"])
+    item["play_count"] = (item["play_count"] or 0) + pending_plays(item["id"])
+    return item
+
+
 def get_user_musics_with_favorite(
     db: Session,
     user_id: int,
-    skip: int = 0,
     limit: int = 20,
     status_filter: str = None,
-    emotion: str = None
-) -> List[Dict]:
-    """获取用户音乐列表（包含收藏状态）"""
+    emotion: str = None,
+    is_favorite: bool = None,
+    cursor: str = None,
+    skip: int = 0,
+    view: str = "full"
+) -> Dict:
+    """
+    获取用户音乐列表（包含收藏状态）
+
+    按 (created_at, id) 倒序做游标分页，收藏状态由 EXISTS 子查询计算，
+    翻页深度不影响单页查询成本。skip 仅为兼容旧客户端，传入 cursor 时忽略。
+    只查询 view 需要的列，不构造 ORM 对象。
+    """
+    is_favorite_expr = favorite_exists(user_id)
     query = db.query(Music).filter(Music.user_id == user_id)
     
     if status_filter:
@@ -67,57 +164,100 @@ def get_user_musics_with_favorite(
     if emotion:
         query = query.filter(Music.primary_emotion == emotion)
     
-    musics = query.order_by(desc(Music.created_at)).offset(skip).limit(limit).all()
-    
-    # 获取用户的收藏列表
-    user_collection_ids = set(
-        c.music_id for c in 
-        db.query(Collection.music_id).filter(Collection.user_id == user_id).all()
-    )
-    
-    # 添加收藏状态
-    result = []
-    for music in musics:
-        music_dict = {
-            "id": music.id,
-            "user_id": music.user_id,
-            "title": music.title,
-            "description": music.description,
-            "input_type": music.input_type,
-            "input_content": music.input_content,
-            "emotion_tags": music.emotion_tags,
-            "primary_emotion": music.primary_emotion,
-            "ai_analysis": music.ai_analysis,
-            "music_url": music.music_url,
-            "cover_url": music.cover_url,
-            "music_format": music.music_format,
-            "duration": music.duration,
-            "file_size": music.file_size,
-            "bpm": music.bpm,
-            "genre": music.genre,
-            "instruments": music.instruments,
-            "status": music.status,
-            "is_public": music.is_public,
-            "play_count": music.play_count,
-            "created_at": music.created_at,
-            "updated_at": music.updated_at,
-            "is_favorite": music.id in user_collection_ids
-        }
-        result.append(music_dict)
+    if is_favorite is not None:
+        query = query.filter(is_favorite_expr if is_favorite else ~is_favorite_expr)
+    
+    total = query.with_entities(func.count(Music.id)).scalar() or 0
+    
+    page_query = query.with_entities(*list_columns(view), is_favorite_expr.label("is_favorite"))
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        # 以字符串绑定游标时间，SQLite 下与库中存储格式逐字比较，MySQL 会自动转换为 DATETIME
+        created_at = literal(created_at, String)
+        page_query = page_query.filter(or_(
+            Music.created_at < created_at,
+            and_(Music.created_at == created_at, Music.id < last_id)
+        ))
+    elif skip:
+        page_query = page_query.offset(skip)
+    
+    rows = page_query.order_by(
+        desc(Music.created_at), desc(Music.id)
+    ).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
     
-    return result
+    return {
+        "items": [music_row_with_favorite(row) for row in rows],
+        "total": total,
+        "limit": limit,
+        "next_cursor": next_cursor
+    }
 
 
 def delete_music(db: Session, music_id: int, user_id: int) -> bool:
-    """删除音乐"""
+    """删除音乐，并释放其引用的输入媒体和音频文件"""
     music = get_music_by_id(db, music_id, user_id)
+    referenced_urls = [music.input_content, music.music_url]
+    referenced_urls += [url for (url,) in db.query(MusicRendition.url).filter(MusicRendition.music_id == music_id)]
+    
+    # 同步统计：作品本身以及级联删除的收藏
+    apply_music_change(db, user_id, music_contribution(music), None)
+    collectors = db.query(Collection.user_id, func.count(Collection.id)).filter(
+        Collection.music_id == music_id
+    ).group_by(Collection.user_id).all()
+    for collector_id, count in collectors:
+        adjust_favorite_count(db, collector_id, -count)
+    
     db.delete(music)
+    bump_version(db, user_id, *(collector_id for collector_id, _ in collectors))
     db.commit()
+    discard_pending_plays(music_id)
+    
+    for url in referenced_urls:
+        release(db, url)
     return True
 
 
 # ============= 收藏相关 =============
 
+def _insert_collection(db: Session, values: Dict[str, Any]) -> bool:
+    """
+    插入收藏，(user_id, music_id) 已存在时什么也不做，返回是否插入
+
+    依赖唯一索引在一条语句内完成判重，并发的重复点击不会产生重复行。
+    """
+    dialect = db.bind.dialect.name
+    if dialect == "sqlite":
+        stmt = sqlite_insert(Collection).values(**values).on_conflict_do_nothing(
+            index_elements=["user_id", "music_id"]
+        )
+    elif dialect == "mysql":
+        # INSERT IGNORE 在唯一键冲突时影响行数为 0（ON DUPLICATE KEY 在 CLIENT_FOUND_ROWS 下无法区分）
+        stmt = mysql_insert(Collection).values(**values).prefix_with("IGNORE")
+    else:
+        try:
+            with db.begin_nested():
+                db.add(Collection(**values))
+            return True
+        except IntegrityError:
+            return False
+    return db.execute(stmt).rowcount > 0
+
+
+def _delete_collection(db: Session, user_id: int, music_id: int) -> bool:
+    """删除收藏，返回是否删除"""
+    deleted = db.query(Collection).filter(
+        Collection.user_id == user_id,
+        Collection.music_id == music_id
+    ).delete(synchronize_session=False)
+    return deleted > 0
+
+
 def add_to_collection(
     db: Session,
     user_id: int,
@@ -127,68 +267,65 @@ def add_to_collection(
     tags: List[str] = None
 ) -> Collection:
     """添加收藏"""
-    # 检查是否已收藏
-    existing = db.query(Collection).filter(
-        Collection.user_id == user_id,
-        Collection.music_id == music_id
-    ).first()
-    
-    if existing:
+    inserted = _insert_collection(db, {
+        "user_id": user_id,
+        "music_id": music_id,
+        "folder_name": folder_name,
+        "note": note,
+        "tags": tags,
+    })
+    
+    if not inserted:
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="已经收藏过了"
         )
     
-    collection = Collection(
-        user_id=user_id,
-        music_id=music_id,
-        folder_name=folder_name,
-        note=note,
-        tags=tags
-    )
-    db.add(collection)
+    bump_favorite_count(db, user_id, 1)
+    bump_version(db, user_id)
     db.commit()
-    db.refresh(collection)
-    return collection
+    
+    # 连同关联音乐一起加载，响应序列化时不再访问数据库
+    return db.query(Collection).options(joinedload(Collection.music)).filter(
+        Collection.user_id == user_id,
+        Collection.music_id == music_id
+    ).one()
 
 
 def remove_from_collection(db: Session, user_id: int, music_id: int) -> bool:
     """取消收藏"""
-    collection = db.query(Collection).filter(
-        Collection.user_id == user_id,
-        Collection.music_id == music_id
-    ).first()
-    
-    if not collection:
+    if not _delete_collection(db, user_id, music_id):
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="未找到该收藏"
         )
     
-    db.delete(collection)
+    bump_favorite_count(db, user_id, -1)
+    bump_version(db, user_id)
     db.commit()
     return True
 
 
 def toggle_favorite(db: Session, user_id: int, music_id: int) -> bool:
-    """切换收藏状态，返回新状态（True=已收藏）"""
-    collection = db.query(Collection).filter(
-        Collection.user_id == user_id,
-        Collection.music_id == music_id
-    ).first()
-    
-    if collection:
-        db.delete(collection)
+    """
+    切换收藏状态，返回新状态（True=已收藏）
+
+    先尝试删除，没有可删除的行再插入；两步都由唯一索引保证不会产生重复收藏。
+    """
+    if _delete_collection(db, user_id, music_id):
+        bump_favorite_count(db, user_id, -1)
+        bump_version(db, user_id)
         db.commit()
         return False
-    else:
-        new_collection = Collection(
-            user_id=user_id,
-            music_id=music_id
-        )
-        db.add(new_collection)
-        db.commit()
-        return True
+    
+    if _insert_collection(db, {"user_id": user_id, "music_id": music_id}):
+        bump_favorite_count(db, user_id, 1)
+        bump_version(db, user_id)
+    # 未插入说明并发请求刚刚收藏了同一首歌，结果同样是已收藏
+    db.commit()
+    return True
 
 
 def get_user_collections(
@@ -212,7 +349,9 @@ def get_user_collections_with_tags(
     tag: str = None
 ) -> List[Collection]:
     """获取用户收藏列表（支持标签筛选）"""
-    query = db.query(Collection).filter(Collection.user_id == user_id)
+    query = db.query(Collection).options(joinedload(Collection.music)).filter(
+        Collection.user_id == user_id
+    )
     
     if folder_name:
         query = query.filter(Collection.folder_name == folder_name)
@@ -228,137 +367,211 @@ def get_user_collections_with_tags(
 
 # ============= 日记和统计 =============
 
+def get_user_timezone(tz_name: Optional[str]) -> Optional[ZoneInfo]:
+    """解析用户时区，未提供时返回 None（按数据库时区分日）"""
+    if not tz_name:
+        return None
+    try:
+        return ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的时区"
+        )
+
+
+def _db_time(moment: datetime) -> datetime:
+    """带时区的时刻换算为数据库中的时间（不带时区）"""
+    return moment.astimezone(ZoneInfo(settings.DB_TIMEZONE)).replace(tzinfo=None)
+
+
+def _local_date(created_at: datetime, user_tz: Optional[ZoneInfo]) -> date:
+    """数据库时间在用户时区中的日期"""
+    if user_tz is None:
+        return created_at.date()
+    return created_at.replace(tzinfo=ZoneInfo(settings.DB_TIMEZONE)).astimezone(user_tz).date()
+
+
+def _offset_minutes(moment: datetime, user_tz: ZoneInfo) -> int:
+    """某一时刻用户时区相对数据库时区的偏移（分钟）"""
+    db_offset = moment.astimezone(ZoneInfo(settings.DB_TIMEZONE)).utcoffset()
+    return int((moment.astimezone(user_tz).utcoffset() - db_offset).total_seconds() // 60)
+
+
+def _offset_periods(user_tz: ZoneInfo, first: datetime, last: datetime) -> List[Tuple[Optional[datetime], int]]:
+    """
+    [first, last]（数据库时间）内的时区偏移分段，每段为 (结束的数据库时间, 偏移分钟)，最后一段结束时间为 None
+
+    夏令时切换前后偏移不同：按天找到偏移变化的那天，再二分到分钟。
+    """
+    minute = timedelta(minutes=1)
+    moment = first.replace(second=0, microsecond=0, tzinfo=ZoneInfo(settings.DB_TIMEZONE)).astimezone(dt_timezone.utc)
+    end = last.replace(tzinfo=ZoneInfo(settings.DB_TIMEZONE)).astimezone(dt_timezone.utc)
+    offset = _offset_minutes(moment, user_tz)
+    periods = []
+    while moment < end:
+        step = moment + timedelta(days=1)
+        if _offset_minutes(step, user_tz) == offset:
+            moment = step
+            continue
+        low, high = moment, step
+        while high - low > minute:
+            middle = low + (high - low) // minute // 2 * minute
+            if _offset_minutes(middle, user_tz) == offset:
+                low = middle
+            else:
+                high = middle
+        periods.append((_db_time(high), offset))
+        offset = _offset_minutes(high, user_tz)
+        moment = high
+    periods.append((None, offset))
+    return periods
+
+
+def _local_date_expr(db: Session, periods: List[Tuple[Optional[datetime], int]]):
+    """created_at 换算到用户时区后的日期表达式，偏移按夏令时分段"""
+    def shifted(offset_minutes: int):
+        if not offset_minutes:
+            return func.date(Music.created_at)
+        if db.bind.dialect.name == "sqlite":
+            return func.date(Music.created_at, f"{offset_minutes:+d} minutes")
+        return func.date(func.timestampadd(literal_column("MINUTE"), offset_minutes, Music.created_at))
+
+    if len(periods) == 1:
+        return shifted(periods[0][1])
+    return case(
+        *((Music.created_at < until, shifted(offset)) for until, offset in periods[:-1]),
+        else_=shifted(periods[-1][1])
+    )
+
+
+def _day_start(day: date, user_tz: Optional[ZoneInfo]) -> datetime:
+    """用户时区某天零点对应的数据库时间"""
+    midnight = datetime.combine(day, datetime.min.time())
+    if user_tz is None:
+        return midnight
+    return _db_time(midnight.replace(tzinfo=user_tz))
+
+
 def get_user_journal(
     db: Session,
     user_id: int,
     start_date: date = None,
     end_date: date = None,
-    emotion: str = None
+    emotion: str = None,
+    cursor: date = None,
+    days: int = 7,
+    tz: str = None,
+    view: str = "full"
 ) -> Dict:
-    """获取用户日记（按日期分组）"""
+    """
+    获取用户日记（按日期分组，按天分页）
+
+    每页返回最多 days 个有作品的日期，cursor 为上一页返回的 next_cursor（不含该日）。
+    每日数量由 SQL GROUP BY 计算，只加载当前页日期范围内的作品，且只查询 view 需要的列。
+    """
+    user_tz = get_user_timezone(tz)
+    
     query = db.query(Music).filter(
         Music.user_id == user_id,
         Music.status == "completed"
     )
     
     if start_date:
-        query = query.filter(Music.created_at >= datetime.combine(start_date, datetime.min.time()))
+        query = query.filter(Music.created_at >= _day_start(start_date, user_tz))
     if end_date:
-        query = query.filter(Music.created_at <= datetime.combine(end_date, datetime.max.time()))
+        query = query.filter(Music.created_at < _day_start(end_date + timedelta(days=1), user_tz))
     if emotion:
         query = query.filter(Music.primary_emotion == emotion)
     
-    musics = query.order_by(desc(Music.created_at)).all()
+    total, first, last = query.with_entities(
+        func.count(Music.id), func.min(Music.created_at), func.max(Music.created_at)
+    ).one()
     
-    # 获取收藏状态
-    user_collection_ids = set(
-        c.music_id for c in 
-        db.query(Collection.music_id).filter(Collection.user_id == user_id).all()
-    )
+    if cursor:
+        query = query.filter(Music.created_at < _day_start(cursor, user_tz))
+    
+    # 每个日期按当天的实际偏移换算（跨夏令时切换的作品不会落到相邻日期）
+    periods = _offset_periods(user_tz, first, last) if user_tz and total else [(None, 0)]
+    day_expr = _local_date_expr(db, periods)
+    
+    # 每日数量
+    day_counts = query.with_entities(
+        day_expr.label("day"),
+        func.count(Music.id)
+    ).group_by(day_expr).order_by(desc(day_expr)).limit(days + 1).all()
+    
+    day_counts = [(date.fromisoformat(str(day)), count) for day, count in day_counts]
+    next_cursor = None
+    if len(day_counts) > days:
+        day_counts = day_counts[:days]
+        next_cursor = day_counts[-1][0]
+    
+    if not day_counts:
+        return {"entries": [], "total": total, "next_cursor": None}
+    
+    # 只加载本页日期范围内的作品
+    newest_day, oldest_day = day_counts[0][0], day_counts[-1][0]
+    rows = query.filter(
+        Music.created_at >= _day_start(oldest_day, user_tz),
+        Music.created_at < _day_start(newest_day + timedelta(days=1), user_tz)
+    ).with_entities(
+        *list_columns(view),
+        favorite_exists(user_id).label("is_favorite")
+    ).order_by(desc(Music.created_at), desc(Music.id)).all()
     
-    # 按日期分组
     grouped = defaultdict(list)
-    for music in musics:
-        date_key = music.created_at.date()
-        music_dict = {
-            "id": music.id,
-            "user_id": music.user_id,
-            "title": music.title,
-            "description": music.description,
-            "input_type": music.input_type,
-            "input_content": music.input_content,
-            "emotion_tags": music.emotion_tags,
-            "primary_emotion": music.primary_emotion,
-            "ai_analysis": music.ai_analysis,
-            "music_url": music.music_url,
-            "cover_url": music.cover_url,
-            "music_format": music.music_format,
-            "duration": music.duration,
-            "file_size": music.file_size,
-            "bpm": music.bpm,
-            "genre": music.genre,
-            "instruments": music.instruments,
-            "status": music.status,
-            "is_public": music.is_public,
-            "play_count": music.play_count,
-            "created_at": music.created_at,
-            "updated_at": music.updated_at,
-            "is_favorite": music.id in user_collection_ids
-        }
-        grouped[date_key].append(music_dict)
+    for row in rows:
+        grouped[_local_date(row.created_at, user_tz)].append(music_row_with_favorite(row))
     
-    # 格式化输出
     entries = [
         {
-            "date": date_key,
-            "items": items,
-            "count": len(items)
+            "date": day,
+            "items": grouped.get(day, []),
+            "count": count
         }
-        for date_key, items in sorted(grouped.items(), reverse=True)
+        for day, count in day_counts
     ]
     
     return {
         "entries": entries,
-        "total": len(musics)
+        "total": total,
+        "next_cursor": next_cursor
     }
 
 
 def get_user_stats(db: Session, user_id: int) -> Dict:
-    """获取用户统计信息"""
-    # 总作品数
-    total_count = db.query(func.count(Music.id)).filter(
-        Music.user_id == user_id,
-        Music.status == "completed"
-    ).scalar() or 0
-    
-    # 本月作品数
-    now = datetime.now()
-    first_day_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    monthly_count = db.query(func.count(Music.id)).filter(
-        Music.user_id == user_id,
-        Music.status == "completed",
-        Music.created_at >= first_day_of_month
-    ).scalar() or 0
-    
-    # 总时长
-    total_duration = db.query(func.sum(Music.duration)).filter(
-        Music.user_id == user_id,
-        Music.status == "completed"
-    ).scalar() or 0
-    
-    # 收藏数
-    favorite_count = db.query(func.count(Collection.id)).filter(
-        Collection.user_id == user_id
-    ).scalar() or 0
-    
-    # 情绪分布
-    emotion_counts = db.query(
-        Music.primary_emotion,
-        func.count(Music.id)
-    ).filter(
-        Music.user_id == user_id,
-        Music.status == "completed",
-        Music.primary_emotion.isnot(None)
-    ).group_by(Music.primary_emotion).all()
-    
-    emotion_distribution = {emotion: count for emotion, count in emotion_counts if emotion}
+    """获取用户统计信息（读取预计算的 user_stats）"""
+    stats = get_stats_row(db, user_id)
+    monthly_counts = stats.monthly_counts or {}
     
     return {
-        "total_count": total_count,
-        "monthly_count": monthly_count,
-        "total_duration": total_duration,
-        "favorite_count": favorite_count,
-        "emotion_distribution": emotion_distribution
+        "total_count": stats.total_count,
+        "monthly_count": monthly_counts.get(month_key(datetime.now()), 0),
+        "total_duration": stats.total_duration,
+        "favorite_count": stats.favorite_count,
+        "emotion_distribution": stats.emotion_counts or {}
     }
 
 
-def increment_play_count(db: Session, music_id: int, user_id: int) -> Music:
-    """增加播放次数"""
-    music = get_music_by_id(db, music_id, user_id)
-    music.play_count += 1
+def increment_play_count(db: Session, music_id: int, user_id: int) -> int:
+    """记录一次播放，返回包含未写回增量的播放次数"""
+    row = db.query(Music.play_count).filter(
+        Music.id == music_id,
+        Music.user_id == user_id
+    ).first()
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="音乐不存在"
+        )
+    # 结束只读事务，缓冲模式下不再访问数据库
     db.commit()
-    db.refresh(music)
-    return music
+    
+    record_play(db, music_id, user_id)
+    if get_play_counter() is None:
+        return (row.play_count or 0) + 1
+    return (row.play_count or 0) + pending_plays(music_id)
 
 
 # ============= 音乐生成 =============
@@ -382,6 +595,7 @@ def create_music(
         music_url=""  # 生成完成后更新
     )
     db.add(music)
+    bump_version(db, user_id)
     db.commit()
     db.refresh(music)
     return music
@@ -404,6 +618,8 @@ def update_music_status(
             detail="音乐不存在"
         )
     
+    before = music_contribution(music)
+    
     music.status = status
     if music_url:
         music.music_url = music_url
@@ -414,11 +630,39 @@ def update_music_status(
     if ai_analysis:
         music.ai_analysis = ai_analysis
     
+    apply_music_change(db, music.user_id, before, music_contribution(music))
+    bump_version(db, music.user_id)
     db.commit()
     db.refresh(music)
     return music
 
 
+def update_music_media(
+    db: Session,
+    music_id: int,
+    duration: int,
+    file_size: int,
+    music_format: str
+) -> Music:
+    """转码后回填实际时长、文件大小和格式（时长变化同步到统计）"""
+    music = db.query(Music).filter(Music.id == music_id).first()
+    if not music:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="音乐不存在"
+        )
+    
+    before = music_contribution(music)
+    music.duration = duration
+    music.file_size = file_size
+    music.music_format = music_format
+    
+    apply_music_change(db, music.user_id, before, music_contribution(music))
+    bump_version(db, music.user_id)
+    db.commit()
+    return music
+
+
 # 别名，用于兼容不同的调用方式
 get_music_list = get_user_musics
 get_music_detail = get_music_by_id
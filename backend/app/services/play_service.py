@@ -0,0 +1,263 @@
+"""
+播放计数服务 - 进程内缓冲播放次数，定期批量写回数据库
+"""
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from app.config import settings
+from app.database import SessionLocal
+from app.models.music import Music
+from app.models.play import PlayEvent
+from app.models.stats import UserStats
+from app.models.user import User
+from app.services.stats_service import bump_version
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PlayCounter:
+    """
+    聚合播放次数，按 UPDATE musics SET play_count = play_count + n 批量写回
+
+    写回期间的增量仍计入 pending()，提交与移出增量在 _flushing_lock 内完成，
+    读接口合并后不会重复计入已提交的增量；记录播放只使用 _lock，不等待数据库提交。
+    已删除音乐的增量在写回前丢弃；写回失败时增量并回缓冲，下次重试。
+    写回时递增相关用户的内容版本（ETag 只按持久化的版本生成，多进程一致）。
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        flush_interval: float = None,
+        flush_threshold: int = None,
+        record_events: bool = None
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval or settings.PLAY_COUNT_FLUSH_INTERVAL
+        self.flush_threshold = flush_threshold or settings.PLAY_COUNT_FLUSH_THRESHOLD
+        self.record_events = settings.PLAY_EVENTS_ENABLED if record_events is None else record_events
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flushing_lock = threading.Lock()
+        self._counts: Counter = Counter()
+        self._events: List[Tuple[int, int, datetime]] = []
+        self._flushing: Counter = Counter()
+        self._users: set = set()
+        self._buffered = 0
+        self._stats = {"plays": 0, "flushes": 0, "flush_errors": 0, "rows_updated": 0, "last_flush_ms": 0.0}
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    def record(self, music_id: int, user_id: int) -> None:
+        """记录一次播放"""
+        with self._lock:
+            self._counts[music_id] += 1
+            self._users.add(user_id)
+            if self.record_events:
+                self._events.append((music_id, user_id, datetime.utcnow()))
+            self._buffered += 1
+            self._stats["plays"] += 1
+            full = self._buffered >= self.flush_threshold
+        if full and self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def pending(self, music_id: int) -> int:
+        """尚未写回数据库的播放次数（写回正在提交时等待提交完成，避免与数据库中的值重复计入）"""
+        with self._flushing_lock, self._lock:
+            return self._counts.get(music_id, 0) + self._flushing.get(music_id, 0)
+
+    def flush(self) -> int:
+        """把缓冲的增量写回数据库，返回更新的音乐数"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._counts and not self._events:
+                    return 0
+                counts, self._counts = self._counts, Counter()
+                events, self._events = self._events, []
+                users, self._users = self._users, set()
+                self._flushing = counts
+                self._buffered = 0
+
+            start = time.perf_counter()
+            db = self.session_factory()
+            try:
+                counts, events = self._existing_only(db, counts, events)
+                self._write(db, counts, events, users)
+                # 提交与清空写回中的增量对 pending() 是原子的；record() 只用 _lock，不等待提交
+                with self._flushing_lock:
+                    db.commit()
+                    with self._lock:
+                        self._flushing = Counter()
+            except Exception:
+                db.rollback()
+                logger.exception("failed to flush %d play counts, will retry", len(counts))
+                with self._lock:
+                    self._counts.update(counts)
+                    self._events[:0] = events
+                    self._users |= users
+                    self._buffered += sum(counts.values())
+                    self._flushing = Counter()
+                    self._stats["flush_errors"] += 1
+                return 0
+            finally:
+                db.close()
+
+            with self._lock:
+                self._stats["flushes"] += 1
+                self._stats["rows_updated"] += len(counts)
+                self._stats["last_flush_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            return len(counts)
+
+    @staticmethod
+    def _existing_only(
+        db: Session,
+        counts: Counter,
+        events: List[Tuple[int, int, datetime]]
+    ) -> Tuple[Counter, List[Tuple[int, int, datetime]]]:
+        """
+        丢弃已删除的音乐（和用户）的增量与播放事件
+
+        否则播放事件违反外键约束，整批写回失败并一直重试。检查之后才删除的音乐仍会让本次写回失败，
+        增量并回缓冲后下次写回时被丢弃。
+        """
+        music_ids = set(counts) | {music_id for music_id, _, _ in events}
+        existing = {music_id for (music_id,) in db.query(Music.id).filter(Music.id.in_(music_ids))}
+        if events:
+            user_ids = {user_id for _, user_id, _ in events}
+            users = {user_id for (user_id,) in db.query(User.id).filter(User.id.in_(user_ids))}
+            events = [event for event in events if event[0] in existing and event[1] in users]
+        dropped = music_ids - existing
+        if dropped:
+            logger.info("dropping buffered plays of deleted musics %s", sorted(dropped))
+            counts = Counter({music_id: delta for music_id, delta in counts.items() if music_id in existing})
+        return counts, events
+
+    @staticmethod
+    def _write(
+        db: Session,
+        counts: Counter,
+        events: List[Tuple[int, int, datetime]],
+        users: set
+    ) -> None:
+        # 相同增量的行合并为一次 executemany
+        by_delta: Dict[int, List[Dict[str, int]]] = defaultdict(list)
+        for music_id, delta in counts.items():
+            by_delta[delta].append({"music_id": music_id})
+        for delta, rows in by_delta.items():
+            db.execute(
+                update(Music.__table__)
+                .where(Music.__table__.c.id == bindparam("music_id"))
+                .values(play_count=Music.__table__.c.play_count + delta),
+                rows
+            )
+        if events:
+            db.execute(PlayEvent.__table__.insert(), [
+                {"music_id": music_id, "user_id": user_id, "played_at": played_at}
+                for music_id, user_id, played_at in events
+            ])
+        if users:
+            stats = UserStats.__table__
+            db.execute(
+                update(stats)
+                .where(stats.c.user_id == bindparam("owner_id"))
+                .values(version=stats.c.version + 1),
+                [{"owner_id": user_id} for user_id in users]
+            )
+
+    def discard(self, music_id: int) -> None:
+        """丢弃音乐尚未写回的播放（删除音乐后调用）"""
+        with self._lock:
+            self._buffered = max(self._buffered - self._counts.pop(music_id, 0), 0)
+            self._events = [event for event in self._events if event[0] != music_id]
+            self._flushing.pop(music_id, None)
+
+    async def start(self) -> None:
+        """启动定期写回"""
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止定期写回并写回剩余的增量"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await asyncio.to_thread(self.flush)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending_plays"] = sum(self._counts.values()) + sum(self._flushing.values())
+            stats["pending_events"] = len(self._events)
+        return stats
+
+
+_play_counter: Optional[PlayCounter] = None
+
+
+def get_play_counter() -> Optional[PlayCounter]:
+    """返回全局播放计数缓冲，未启用时返回 None"""
+    global _play_counter
+    if not settings.PLAY_COUNT_BUFFER_ENABLED:
+        return None
+    if _play_counter is None:
+        _play_counter = PlayCounter()
+    return _play_counter
+
+
+def set_play_counter(counter: Optional[PlayCounter]) -> None:
+    """替换全局播放计数缓冲（测试时注入）"""
+    global _play_counter
+    _play_counter = counter
+
+
+def pending_plays(music_id: int) -> int:
+    counter = get_play_counter()
+    return counter.pending(music_id) if counter else 0
+
+
+def discard_pending_plays(music_id: int) -> None:
+    counter = get_play_counter()
+    if counter:
+        counter.discard(music_id)
+
+
+def with_pending_plays(music: Music) -> Music:
+    """把未写回的播放次数合并到音乐对象上（不标记修改，不会被提交）"""
+    pending = pending_plays(music.id)
+    if pending:
+        set_committed_value(music, "play_count", (music.play_count or 0) + pending)
+    return music
+
+
+def record_play(db: Session, music_id: int, user_id: int) -> None:
+    """记录一次播放：启用缓冲时进入缓冲，否则直接原子更新"""
+    counter = get_play_counter()
+    if counter is not None:
+        counter.record(music_id, user_id)
+        return
+    db.query(Music).filter(Music.id == music_id).update(
+        {Music.play_count: Music.play_count + 1}, synchronize_session=False
+    )
+    if settings.PLAY_EVENTS_ENABLED:
+        db.add(PlayEvent(music_id=music_id, user_id=user_id))
+    bump_version(db, user_id)
+    db.commit()
@@ -0,0 +1,482 @@
+"""
+输入预处理服务 - 把上传的语音和图片规范化为模型输入、生成头像缩略图，结果按源文件内容哈希复用
+"""
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import DBSession, run_db
+from app.models.blob import Blob, BlobArtifact
+from app.services.blob_service import blob_path, blob_url, ingest_file, parse_blob_url, release
+from app.services.job_queue import Job, PermanentJobError
+from app.services.stream_service import media_path
+import asyncio
+import logging
+import os
+import shutil
+import struct
+import subprocess
+import uuid
+
+logger = logging.getLogger(__name__)
+
+VOICE_ARTIFACT = "voice"
+IMAGE_ARTIFACT = "image"
+AVATAR_ARTIFACT = "avatar_{size}"
+IMAGE_FORMATS = {"JPEG", "PNG", "GIF", "WEBP"}
+PHASH_SIZE = 32         # 感知哈希先缩小到 32x32 灰度，再取 DCT 左上角 8x8 低频
+WINDOW_MS = 20          # 静音检测窗口
+PAD_MS = 100            # 首尾保留的静音，避免截掉弱起的音节
+PEAK_TARGET = 0.9       # 归一化后的峰值（约 -1 dBFS）
+_WAV_HEADER_SIZE = 44
+
+
+def ffmpeg_binary() -> Optional[str]:
+    return settings.FFMPEG_PATH or shutil.which("ffmpeg")
+
+
+def _wav_header(samples: int, rate: int) -> bytes:
+    """16 位单声道 PCM 的 WAV 文件头"""
+    data_size = samples * 2
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE", b"fmt ", 16, 1, 1, rate, rate * 2, 2, 16, b"data", data_size
+    )
+
+
+def preprocess_voice_file(
+    source: str,
+    out_path: str,
+    rate: int,
+    max_seconds: int,
+    silence_db: float,
+    ffmpeg_path: str,
+    chunk_windows: int = 50
+) -> Dict:
+    """
+    流式解码为单声道 rate Hz 的 16 位 PCM，去除首尾静音、截断到 max_seconds 并做峰值归一化，写入 WAV
+
+    ffmpeg 负责解码和重采样，这里每次只读入 chunk_windows 个检测窗口（默认 1 秒）；
+    结尾静音在写完后按最后一个有声窗口截断，归一化通过内存映射原地缩放，
+    内存占用与上传文件的格式和时长无关。
+    """
+    window = rate * WINDOW_MS // 1000
+    pad_windows = PAD_MS // WINDOW_MS
+    max_samples = max_seconds * rate
+    threshold = 32768 * 10 ** (silence_db / 20)
+
+    process = subprocess.Popen(
+        [ffmpeg_path, "-v", "error", "-nostdin", "-i", source, "-vn", "-ac", "1", "-ar", str(rate), "-f", "s16le", "pipe:1"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    decoded = 0          # 解码得到的采样数
+    written = 0          # 写入的采样数
+    voiced_end = 0       # 最后一个有声窗口加上尾部保留的结束处（以写入的采样计，可超出已写入的部分）
+    peak = 0
+    started = False
+    lead: list = []      # 开始前最近的几个静音窗口，开始时作为前导保留
+    capped = False
+    try:
+        with open(out_path, "wb") as out:
+            out.write(_wav_header(0, rate))
+            while written < max_samples:
+                data = process.stdout.read(window * chunk_windows * 2)
+                if not data:
+                    break
+                samples = np.frombuffer(data[:len(data) // 2 * 2], dtype="<i2")
+                decoded += len(samples)
+                full = len(samples) // window * window
+                windows = samples[:full].reshape(-1, window).astype(np.float32)
+                rms = np.sqrt((windows ** 2).mean(axis=1)) if full else np.zeros(0)
+                voiced = rms >= threshold
+
+                if not started:
+                    if not voiced.any():
+                        lead = (lead + list(windows.astype("<i2")))[-pad_windows:]
+                        continue
+                    first = int(np.argmax(voiced))
+                    lead = (lead + list(windows[:first].astype("<i2")))[-pad_windows:]
+                    head = np.concatenate(lead) if lead else np.zeros(0, dtype="<i2")
+                    samples = np.concatenate([head, samples[first * window:]])
+                    voiced = np.concatenate([np.zeros(len(lead), dtype=bool), voiced[first:]])
+                    started = True
+
+                samples = samples[:max_samples - written]
+                if voiced.any():
+                    last = len(voiced) - 1 - int(np.argmax(voiced[::-1]))
+                    voiced_end = written + (last + 1 + pad_windows) * window
+                if len(samples):
+                    peak = max(peak, int(np.abs(samples.astype(np.int32)).max()))
+                out.write(samples.astype("<i2").tobytes())
+                written += len(samples)
+            capped = written >= max_samples
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        if capped:
+            # 已达到时长上限，不再解码剩余部分
+            process.kill()
+        process.stdout.close()
+        stderr = process.stderr.read().decode(errors="replace")
+        process.stderr.close()
+        process.wait()
+    if process.returncode and not capped:
+        # ffmpeg 的错误输出包含服务器上的文件路径，只记录在日志中
+        logger.warning("ffmpeg failed to decode %s: %s", source, stderr.strip()[:500])
+        raise ValueError("无法解码语音文件")
+
+    samples = min(voiced_end, written)
+    with open(out_path, "r+b") as out:
+        out.truncate(_WAV_HEADER_SIZE + samples * 2)
+        out.seek(0)
+        out.write(_wav_header(samples, rate))
+    if samples and 0 < peak < PEAK_TARGET * 32767:
+        pcm = np.memmap(out_path, dtype="<i2", mode="r+", offset=_WAV_HEADER_SIZE, shape=(samples,))
+        gain = PEAK_TARGET * 32767 / peak
+        step = rate * 10
+        for start in range(0, samples, step):
+            pcm[start:start + step] = np.clip(pcm[start:start + step] * gain, -32768, 32767).astype("<i2")
+        pcm.flush()
+        del pcm
+
+    return {
+        "sample_rate": rate,
+        "duration_ms": samples * 1000 // rate,
+        "decoded_ms": decoded * 1000 // rate,
+        "truncated": capped,
+        "silent": samples == 0,
+    }
+
+
+def encode_flac(wav_path: str, flac_path: str, ffmpeg_path: str) -> None:
+    subprocess.run(
+        [ffmpeg_path, "-v", "error", "-nostdin", "-y", "-i", wav_path, "-c:a", "flac", flac_path],
+        check=True,
+        capture_output=True
+    )
+
+
+def prepare_voice_artifact(source: Path, work_dir: Path, ffmpeg_path: str) -> Dict:
+    """预处理并按配置编码，返回输出文件路径和处理信息"""
+    wav_path = work_dir / "voice.wav"
+    info = preprocess_voice_file(
+        str(source),
+        str(wav_path),
+        settings.VOICE_SAMPLE_RATE,
+        settings.VOICE_MAX_SECONDS,
+        settings.VOICE_SILENCE_DB,
+        ffmpeg_path
+    )
+    if settings.VOICE_ARTIFACT_FORMAT == "flac" and not info["silent"]:
+        flac_path = work_dir / "voice.flac"
+        try:
+            encode_flac(str(wav_path), str(flac_path), ffmpeg_path)
+        except subprocess.CalledProcessError as exc:
+            # 规范化的 WAV 已经可用，压缩失败时直接使用
+            logger.warning("flac encoding failed, keep wav: %s", exc.stderr.decode(errors="replace").strip()[:200])
+        else:
+            return {"path": flac_path, "ext": "flac", **info}
+    return {"path": wav_path, "ext": "wav", **info}
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT = _dct_matrix(PHASH_SIZE)
+
+
+def perceptual_hash(image) -> str:
+    """
+    DCT 感知哈希：低频系数与中位数比较得到 64 位，返回 16 位十六进制
+
+    对缩放、重新压缩、轻微调色不敏感，近似图片的汉明距离很小。
+    """
+    from PIL import Image
+
+    gray = np.asarray(
+        image.convert("L").resize((PHASH_SIZE, PHASH_SIZE), Image.Resampling.BOX), dtype=np.float64
+    )
+    low = (_DCT @ gray @ _DCT.T)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return f"{int(''.join('1' if bit else '0' for bit in bits), 2):016x}"
+
+
+@contextmanager
+def _image_errors():
+    """
+    把 Pillow 的解码错误（无法识别、文件截断、像素数超过 Pillow 的上限）转换为 ValueError
+
+    原始错误只记录在服务端日志中（其中包含服务器上的文件路径），展示给用户的是固定信息。
+    """
+    from PIL import Image
+
+    try:
+        yield
+    except (OSError, Image.DecompressionBombError) as exc:
+        logger.warning("failed to decode image: %s", exc)
+        raise ValueError("无法识别的图片") from exc
+
+
+def _prepare_decode(image, size: int, max_pixels: int):
+    """校验格式与尺寸，JPEG 设置 draft 缩小解码（解码结果不小于 size），返回原始尺寸"""
+    if image.format not in IMAGE_FORMATS:
+        raise ValueError(f"不支持的图片格式: {image.format}")
+    width, height = image.size
+    if image.format == "JPEG":
+        image.draft("RGB", (size, size))
+    elif width * height > max_pixels:
+        raise ValueError(f"图片尺寸过大: {width}x{height}")
+    return width, height
+
+
+def preprocess_image_file(source: str, out_path: str, size: int, max_pixels: int, quality: int) -> Dict:
+    """
+    把图片缩小到最长边 size 并去除元数据，保存为 WebP，返回尺寸与感知哈希
+
+    JPEG 用 draft 模式让解码器直接按 1/2～1/8 比例解码，不会生成原始分辨率的像素；
+    其他格式只能完整解码，先按文件头中的尺寸检查像素数，超过 max_pixels 时拒绝。
+    动图只取第一帧。无法识别、无法解码或尺寸过大的图片抛出 ValueError。
+    """
+    from PIL import Image, ImageOps
+
+    with _image_errors(), Image.open(source) as image:
+        width, height = _prepare_decode(image, size, max_pixels)
+        # 按 EXIF 方向旋转后再丢弃元数据
+        frame = ImageOps.exif_transpose(image).convert("RGB")
+    frame.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    frame.info = {}
+    frame.save(out_path, "WEBP", quality=quality, method=4)
+    return {
+        "width": width,
+        "height": height,
+        "thumb_width": frame.width,
+        "thumb_height": frame.height,
+        "phash": perceptual_hash(frame),
+    }
+
+
+def make_avatar_variants(source: str, out_dir: str, sizes, max_pixels: int, quality: int) -> Dict[int, str]:
+    """
+    居中裁成正方形，输出各边长的 WebP 缩略图（从大到小逐级缩小），返回 边长 -> 文件路径
+
+    与图片预处理相同的有界解码；透明背景的图片保留透明通道。
+    """
+    from PIL import Image, ImageOps
+
+    sizes = sorted(set(sizes), reverse=True)
+    with _image_errors(), Image.open(source) as image:
+        _prepare_decode(image, sizes[0], max_pixels)
+        mode = "RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB"
+        frame = ImageOps.exif_transpose(image).convert(mode)
+    frame = ImageOps.fit(frame, (sizes[0], sizes[0]), Image.Resampling.LANCZOS)
+
+    outputs = {}
+    for size in sizes:
+        if frame.width != size:
+            frame = frame.resize((size, size), Image.Resampling.LANCZOS)
+        frame.info = {}
+        path = os.path.join(out_dir, f"{size}.webp")
+        frame.save(path, "WEBP", quality=quality, method=4)
+        outputs[size] = path
+    return outputs
+
+
+# ============= 派生文件登记 =============
+
+def get_artifact(db: Session, source_sha256: str, kind: str) -> Optional[Dict]:
+    row = db.query(BlobArtifact.url, BlobArtifact.info).filter(
+        BlobArtifact.source_sha256 == source_sha256,
+        BlobArtifact.kind == kind
+    ).first()
+    db.commit()
+    if row is None or media_path(row.url) is None:
+        return None
+    return {"url": row.url, **(row.info or {})}
+
+
+def find_similar_phash(db: Session, phash: str, exclude_sha256: str = None) -> Optional[str]:
+    """
+    查找与 phash 近似的已处理图片，返回它的感知哈希（没有时返回 None）
+
+    先按索引精确匹配，再与最近 IMAGE_PHASH_SCAN 张图片按汉明距离比较。
+    """
+    base = db.query(BlobArtifact.phash).filter(BlobArtifact.kind == IMAGE_ARTIFACT)
+    if exclude_sha256:
+        base = base.filter(BlobArtifact.source_sha256 != exclude_sha256)
+    if base.filter(BlobArtifact.phash == phash).first() is not None:
+        db.commit()
+        return phash
+    rows = [row.phash for row in base.filter(BlobArtifact.phash.isnot(None)).order_by(
+        BlobArtifact.id.desc()
+    ).limit(settings.IMAGE_PHASH_SCAN)]
+    db.commit()
+    if not rows:
+        return None
+    target = np.unpackbits(np.frombuffer(bytes.fromhex(phash), dtype=np.uint8))
+    others = np.unpackbits(np.frombuffer(bytes.fromhex("".join(rows)), dtype=np.uint8)).reshape(len(rows), -1)
+    distances = (others != target).sum(axis=1)
+    nearest = int(np.argmin(distances))
+    return rows[nearest] if distances[nearest] <= settings.IMAGE_PHASH_DISTANCE else None
+
+
+def save_artifact(db: Session, source_sha256: str, kind: str, path: Path, ext: str, info: Dict) -> Dict:
+    """
+    把派生文件登记到内容寻址存储并替换已有记录（原文件丢失时重新处理），返回登记后的信息
+
+    并发处理同一来源时以先提交的为准，释放本次入库的文件。
+    """
+    url = blob_url(ingest_file(db, path, ext))
+    existing = BlobArtifact.source_sha256 == source_sha256, BlobArtifact.kind == kind
+    old_urls = [old for (old,) in db.query(BlobArtifact.url).filter(*existing)]
+    db.query(BlobArtifact).filter(*existing).delete(synchronize_session=False)
+    db.add(BlobArtifact(source_sha256=source_sha256, kind=kind, url=url, info=info, phash=info.get("phash")))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        release(db, url)
+        return get_artifact(db, source_sha256, kind)
+    for old in old_urls:
+        release(db, old)
+    return {"url": url, **info}
+
+
+async def prepare_voice_input(db: Session, job: Job, source_url: str) -> Optional[Dict]:
+    """
+    语音生成任务的预处理步骤，返回规范化语音的地址与信息
+
+    相同内容只处理一次；未启用、找不到 ffmpeg 或源文件不存在时返回 None（分析使用原始文件）。
+    文件无法解码时抛出 PermanentJobError，任务直接失败而不重试；全是静音的语音不算错误。
+    """
+    source_sha256 = job.payload.get("input_hash")
+    source = media_path(source_url)
+    ffmpeg_path = ffmpeg_binary()
+    if not settings.VOICE_PREPROCESS_ENABLED or not source_sha256 or source is None:
+        return None
+    if ffmpeg_path is None:
+        logger.warning("ffmpeg not found, skip voice preprocessing")
+        return None
+
+    artifact = await asyncio.to_thread(get_artifact, db, source_sha256, VOICE_ARTIFACT)
+    if artifact is not None:
+        return artifact
+
+    work_dir = settings.UPLOAD_DIR / "tmp" / f"voice_{job.id}_{uuid.uuid4().hex}"
+    work_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        try:
+            result = await asyncio.to_thread(prepare_voice_artifact, source, work_dir, ffmpeg_path)
+        except ValueError as exc:
+            raise PermanentJobError(str(exc)) from exc
+        path, ext = result.pop("path"), result.pop("ext")
+        logger.info(
+            "voice for music %s: %d ms decoded, %d ms kept",
+            job.music_id, result["decoded_ms"], result["duration_ms"]
+        )
+        return await asyncio.to_thread(save_artifact, db, source_sha256, VOICE_ARTIFACT, path, ext, result)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+async def prepare_image_input(db: Session, job: Job, source_url: str) -> Optional[Dict]:
+    """
+    图片生成任务的预处理步骤，返回缩略图地址、尺寸、感知哈希，以及近似图片的感知哈希（similar_phash）
+
+    相同内容只处理一次；未启用或源文件不存在时返回 None（分析使用原始文件）。
+    无法识别、无法解码或尺寸过大的图片抛出 PermanentJobError，任务直接失败而不重试。
+    """
+    source_sha256 = job.payload.get("input_hash")
+    source = media_path(source_url)
+    if not settings.IMAGE_PREPROCESS_ENABLED or not source_sha256 or source is None:
+        return None
+
+    artifact = await asyncio.to_thread(get_artifact, db, source_sha256, IMAGE_ARTIFACT)
+    if artifact is None:
+        work_dir = settings.UPLOAD_DIR / "tmp" / f"image_{job.id}_{uuid.uuid4().hex}"
+        work_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            thumb_path = work_dir / "thumb.webp"
+            try:
+                info = await asyncio.to_thread(
+                    preprocess_image_file,
+                    str(source),
+                    str(thumb_path),
+                    settings.IMAGE_MODEL_SIZE,
+                    settings.IMAGE_MAX_PIXELS,
+                    settings.IMAGE_THUMB_QUALITY
+                )
+            except ValueError as exc:
+                raise PermanentJobError(str(exc)) from exc
+            # 先查近似图片再登记，避免匹配到自己
+            similar = await asyncio.to_thread(find_similar_phash, db, info["phash"], source_sha256)
+            artifact = await asyncio.to_thread(
+                save_artifact, db, source_sha256, IMAGE_ARTIFACT, thumb_path, "webp", info
+            )
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    else:
+        similar = await asyncio.to_thread(find_similar_phash, db, artifact["phash"], source_sha256)
+    return {**artifact, "similar_phash": similar}
+
+
+# ============= 头像缩略图 =============
+
+def get_avatar_variants(db: Session, avatar_url: Optional[str]) -> Optional[Dict[str, str]]:
+    """返回头像已生成的各尺寸缩略图（边长 -> URL），不是内容寻址地址或尺寸不全时返回 None"""
+    source_sha256 = parse_blob_url(avatar_url)
+    if not source_sha256:
+        return None
+    kinds = {AVATAR_ARTIFACT.format(size=size): str(size) for size in settings.AVATAR_SIZES}
+    rows = db.query(BlobArtifact.kind, BlobArtifact.url).filter(
+        BlobArtifact.source_sha256 == source_sha256,
+        BlobArtifact.kind.in_(kinds)
+    ).all()
+    db.commit()
+    variants = {kinds[row.kind]: row.url for row in rows}
+    return variants if len(variants) == len(kinds) else None
+
+
+def save_avatar_variants(db: Session, source_sha256: str, files: Dict[int, str]) -> Dict[str, str]:
+    return {
+        str(size): save_artifact(
+            db, source_sha256, AVATAR_ARTIFACT.format(size=size), Path(path), "webp", {"size": size}
+        )["url"]
+        for size, path in files.items()
+    }
+
+
+async def create_avatar_variants(db: DBSession, blob: Blob) -> Dict[str, str]:
+    """
+    为上传的头像生成各尺寸缩略图，相同内容的头像直接复用
+
+    图片处理在线程中执行，不阻塞事件循环；缩略图随原图 blob 回收时一起释放。
+    无法识别或尺寸过大的图片抛出 ValueError。
+    """
+    url = blob_url(blob)
+    variants = await run_db(db, get_avatar_variants, url)
+    if variants is not None:
+        return variants
+
+    work_dir = settings.UPLOAD_DIR / "tmp" / f"avatar_{uuid.uuid4().hex}"
+    work_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        files = await asyncio.to_thread(
+            make_avatar_variants,
+            str(blob_path(blob)),
+            str(work_dir),
+            settings.AVATAR_SIZES,
+            settings.IMAGE_MAX_PIXELS,
+            settings.AVATAR_QUALITY
+        )
+        return await run_db(db, save_avatar_variants, parse_blob_url(url), files)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,190 @@
+"""
+生成进度服务 - 写入 GenerationLog 并通过发布/订阅推送进度事件
+"""
+from contextlib import asynccontextmanager
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app.models.music import GenerationLog
+import asyncio
+import json
+import threading
+
+# 到达这些状态后进度流结束
+TERMINAL_STATUSES = {"completed", "failed"}
+
+
+class ProgressBroker:
+    """进度事件发布/订阅接口，可替换为 Redis 等消息中间件实现"""
+
+    def publish(self, music_id: int, event: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def subscribe(self, music_id: int):
+        """返回异步上下文管理器，进入后得到一个 asyncio.Queue"""
+        raise NotImplementedError
+
+
+class InProcessBroker(ProgressBroker):
+    """进程内发布/订阅，publish 可在任意线程调用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[int, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = defaultdict(set)
+
+    def publish(self, music_id: int, event: Dict[str, Any]) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(music_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # 订阅方的事件循环已关闭
+                pass
+
+    @asynccontextmanager
+    async def subscribe(self, music_id: int):
+        entry = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers[music_id].add(entry)
+        try:
+            yield entry[1]
+        finally:
+            with self._lock:
+                self._subscribers[music_id].discard(entry)
+                if not self._subscribers[music_id]:
+                    del self._subscribers[music_id]
+
+
+_broker: Optional[ProgressBroker] = None
+
+
+def get_progress_broker() -> ProgressBroker:
+    """返回全局进度事件代理"""
+    global _broker
+    if _broker is None:
+        _broker = InProcessBroker()
+    return _broker
+
+
+def set_progress_broker(broker: ProgressBroker) -> None:
+    """替换全局进度事件代理"""
+    global _broker
+    _broker = broker
+
+
+def _log_to_event(log: GenerationLog) -> Dict[str, Any]:
+    return {
+        "id": log.id,
+        "music_id": log.music_id,
+        "step": log.step,
+        "status": log.status,
+        "progress": log.progress,
+        "message": log.message,
+    }
+
+
+def record_progress(
+    db: Session,
+    music_id: int,
+    step: str,
+    status: str = "running",
+    progress: int = 0,
+    message: str = None
+) -> GenerationLog:
+    """写入一条生成日志并发布进度事件"""
+    log = GenerationLog(
+        music_id=music_id,
+        step=step,
+        status=status,
+        progress=progress,
+        message=message
+    )
+    db.add(log)
+    db.commit()
+    get_progress_broker().publish(music_id, _log_to_event(log))
+    return log
+
+
+def get_latest_progress(db: Session, music_id: int) -> Optional[GenerationLog]:
+    """获取最近一条生成日志"""
+    return db.query(GenerationLog).filter(
+        GenerationLog.music_id == music_id
+    ).order_by(GenerationLog.id.desc()).first()
+
+
+def _load_events_after(music_id: int, last_id: int) -> List[Dict[str, Any]]:
+    db = SessionLocal()
+    try:
+        logs = db.query(GenerationLog).filter(
+            GenerationLog.music_id == music_id,
+            GenerationLog.id > last_id
+        ).order_by(GenerationLog.id).all()
+        return [_log_to_event(log) for log in logs]
+    finally:
+        db.close()
+
+
+async def iter_progress_events(
+    music_id: int,
+    last_id: int = 0,
+    music_status: str = None
+) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """
+    逐条产出进度事件，空闲时产出 None（用于保活）
+
+    先订阅再补发已有日志，避免遗漏；worker 在其他进程时
+    收不到进程内事件，空闲时会从 GenerationLog 增量读取作为兜底。
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.PROGRESS_STREAM_TIMEOUT
+
+    async with get_progress_broker().subscribe(music_id) as queue:
+        pending = await asyncio.to_thread(_load_events_after, music_id, last_id)
+        if not pending and music_status in TERMINAL_STATUSES:
+            # 没有日志的历史记录，直接以音乐当前状态结束
+            yield {
+                "id": last_id,
+                "music_id": music_id,
+                "step": music_status,
+                "status": music_status,
+                "progress": 100 if music_status == "completed" else 0,
+                "message": None,
+            }
+            return
+
+        while True:
+            for event in pending:
+                if event["id"] <= last_id:
+                    continue
+                last_id = event["id"]
+                yield event
+                if event["status"] in TERMINAL_STATUSES:
+                    return
+
+            if loop.time() >= deadline:
+                return
+
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=settings.PROGRESS_POLL_INTERVAL)
+                pending = [event]
+            except asyncio.TimeoutError:
+                pending = await asyncio.to_thread(_load_events_after, music_id, last_id)
+                if not pending:
+                    yield None
+
+
+async def sse_progress_stream(
+    music_id: int,
+    last_event_id: int = 0,
+    music_status: str = None
+) -> AsyncIterator[str]:
+    """把进度事件编码为 Server-Sent Events 文本，支持 Last-Event-ID 断线续传"""
+    async for event in iter_progress_events(music_id, last_event_id, music_status):
+        if event is None:
+            yield ": keep-alive\n\n"
+            continue
+        data = json.dumps(event, ensure_ascii=False)
+        yield f"id: {event['id']}\nevent: progress\ndata: {data}\n\n"
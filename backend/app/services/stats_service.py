@@ -0,0 +1,225 @@
+"""
+用户统计服务 - 预计算统计的增量维护与重建
+"""
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+from app.database import is_read_only
+from app.models.music import Music, Collection, MusicStatus
+from app.models.stats import UserStats
+from app.models.user import User
+
+# 统计行按版本比较后更新的最多尝试次数
+STATS_UPDATE_ATTEMPTS = 5
+
+
+def month_key(value: datetime) -> str:
+    return value.strftime("%Y-%m")
+
+
+def music_contribution(music: Music) -> Optional[Dict]:
+    """一首音乐对统计的贡献，未完成的音乐不计入"""
+    if music.status not in (MusicStatus.completed, "completed"):
+        return None
+    return {
+        "duration": music.duration or 0,
+        "month": month_key(music.created_at or datetime.now()),
+        "emotion": music.primary_emotion,
+    }
+
+
+def _bump(counts: Optional[Dict[str, int]], key: Optional[str], delta: int) -> Dict[str, int]:
+    """返回计数字典的新副本（JSON 列需要整体赋值才能被检测到修改）"""
+    counts = dict(counts or {})
+    if not key or not delta:
+        return counts
+    value = counts.get(key, 0) + delta
+    if value > 0:
+        counts[key] = value
+    else:
+        counts.pop(key, None)
+    return counts
+
+
+def _compute_stats(db: Session, user_id: int) -> Dict:
+    """从明细表全量计算统计"""
+    completed = db.query(Music).filter(
+        Music.user_id == user_id,
+        Music.status == "completed"
+    )
+
+    total_count, total_duration = completed.with_entities(
+        func.count(Music.id),
+        func.coalesce(func.sum(Music.duration), 0)
+    ).one()
+
+    favorite_count = db.query(func.count(Collection.id)).filter(
+        Collection.user_id == user_id
+    ).scalar() or 0
+
+    monthly_counts: Dict[str, int] = {}
+    emotion_counts: Dict[str, int] = {}
+    for created_at, emotion in completed.with_entities(Music.created_at, Music.primary_emotion):
+        monthly_counts = _bump(monthly_counts, month_key(created_at), 1)
+        emotion_counts = _bump(emotion_counts, emotion, 1)
+
+    return {
+        "total_count": total_count or 0,
+        "total_duration": int(total_duration or 0),
+        "favorite_count": favorite_count,
+        "monthly_counts": monthly_counts,
+        "emotion_counts": emotion_counts,
+    }
+
+
+def rebuild_user_stats(db: Session, user_id: int, commit: bool = True) -> UserStats:
+    """重建（修复）单个用户的统计"""
+    values = _compute_stats(db, user_id)
+    stats = db.query(UserStats).filter(UserStats.user_id == user_id).with_for_update().first()
+    if stats is None:
+        stats = UserStats(user_id=user_id)
+        db.add(stats)
+    for field, value in values.items():
+        setattr(stats, field, value)
+    if commit:
+        db.commit()
+    return stats
+
+
+def rebuild_all_stats(db: Session, user_ids: Iterable[int] = None) -> int:
+    """重建全部（或指定）用户的统计，返回处理的用户数"""
+    if user_ids is None:
+        user_ids = [user_id for (user_id,) in db.query(User.id).all()]
+    count = 0
+    for user_id in user_ids:
+        rebuild_user_stats(db, user_id)
+        count += 1
+    return count
+
+
+def _locked_stats(db: Session, user_id: int) -> UserStats:
+    """
+    读取（MySQL 上锁定）最新的统计行，不存在时先按当前明细重建（不提交，由调用方提交）
+
+    SQLite 不支持 FOR UPDATE，读取不加锁，写入时由调用方按版本比较后更新。
+    本事务中刚重建、尚未写入的统计行直接返回（在 db.new 中）。
+    """
+    for pending in db.new:
+        if isinstance(pending, UserStats) and pending.user_id == user_id:
+            return pending
+    stats = db.query(UserStats).filter(
+        UserStats.user_id == user_id
+    ).with_for_update().populate_existing().first()
+    if stats is None:
+        stats = rebuild_user_stats(db, user_id, commit=False)
+    return stats
+
+
+def apply_music_change(
+    db: Session,
+    user_id: int,
+    before: Optional[Dict],
+    after: Optional[Dict]
+) -> None:
+    """
+    按音乐变更前后的贡献差量更新统计
+
+    需在修改写入数据库之前调用（会话未 flush），缺失统计行时的重建才不会重复计数。
+    计数和时长用 col = col + delta 原子更新；JSON 分布只能整体写回，按版本比较后更新，
+    版本已变化（并发写入）时重新读取再计算。SQLite 上第一次更新后本事务已持有写锁，重试必然成功。
+    """
+    if before == after:
+        return
+    changes = [(contribution, sign) for contribution, sign in ((before, -1), (after, 1)) if contribution]
+    count_delta = sum(sign for _, sign in changes)
+    duration_delta = sum(sign * contribution["duration"] for contribution, sign in changes)
+
+    for _ in range(STATS_UPDATE_ATTEMPTS):
+        stats = _locked_stats(db, user_id)
+        monthly_counts = stats.monthly_counts
+        emotion_counts = stats.emotion_counts
+        for contribution, sign in changes:
+            monthly_counts = _bump(monthly_counts, contribution["month"], sign)
+            emotion_counts = _bump(emotion_counts, contribution["emotion"], sign)
+
+        if stats in db.new:
+            stats.total_count = (stats.total_count or 0) + count_delta
+            stats.total_duration = (stats.total_duration or 0) + duration_delta
+            stats.monthly_counts = monthly_counts
+            stats.emotion_counts = emotion_counts
+            return
+        updated = db.query(UserStats).filter(
+            UserStats.user_id == user_id,
+            UserStats.version == stats.version
+        ).update({
+            UserStats.total_count: UserStats.total_count + count_delta,
+            UserStats.total_duration: UserStats.total_duration + duration_delta,
+            UserStats.monthly_counts: monthly_counts,
+            UserStats.emotion_counts: emotion_counts,
+            UserStats.version: UserStats.version + 1,
+        }, synchronize_session=False)
+        if updated:
+            db.expire(stats)
+            return
+    raise RuntimeError(f"user_stats for user {user_id} kept changing, gave up after {STATS_UPDATE_ATTEMPTS} attempts")
+
+
+def adjust_favorite_count(db: Session, user_id: int, delta: int) -> None:
+    """原子地增减收藏数，不小于 0（需在收藏写入数据库之前调用，统计行缺失时按当前明细重建）"""
+    if not delta:
+        return
+    value = UserStats.favorite_count + delta
+    updated = db.query(UserStats).filter(UserStats.user_id == user_id).update(
+        {UserStats.favorite_count: case((value > 0, value), else_=0)}, synchronize_session=False
+    )
+    if not updated:
+        stats = _locked_stats(db, user_id)
+        stats.favorite_count = max((stats.favorite_count or 0) + delta, 0)
+
+
+def bump_favorite_count(db: Session, user_id: int, delta: int) -> None:
+    """
+    原子地增减收藏数（需在收藏写入数据库之后调用，不提交）
+
+    单条 UPDATE 完成，不需要先锁定读取；统计行缺失时按当前明细重建，已包含本次变更。
+    """
+    if not delta:
+        return
+    updated = db.query(UserStats).filter(UserStats.user_id == user_id).update(
+        {UserStats.favorite_count: UserStats.favorite_count + delta}, synchronize_session=False
+    )
+    if not updated:
+        rebuild_user_stats(db, user_id, commit=False)
+
+
+def bump_version(db: Session, *user_ids: int) -> None:
+    """
+    递增用户的内容版本（不提交，随写操作一起提交）
+
+    列表、日记、统计和详情接口的 ETag 由版本生成，影响这些响应的写操作都要调用。
+    先 flush 让本事务中新建的统计行可见，统计行缺失时按当前明细重建。
+    """
+    db.flush()
+    for user_id in set(user_ids):
+        updated = db.query(UserStats).filter(UserStats.user_id == user_id).update(
+            {UserStats.version: UserStats.version + 1}, synchronize_session=False
+        )
+        if not updated:
+            rebuild_user_stats(db, user_id, commit=False).version = 1
+
+
+def get_version(db: Session, user_id: int) -> Optional[Tuple[int, Optional[datetime]]]:
+    """按主键读取 (内容版本, 最后修改时间)，统计行缺失时返回 None"""
+    row = db.query(UserStats.version, UserStats.updated_at).filter(UserStats.user_id == user_id).first()
+    return (row.version or 0, row.updated_at) if row else None
+
+
+def get_stats_row(db: Session, user_id: int) -> UserStats:
+    """按主键读取统计，缺失时重建（只读副本上只计算不写入）"""
+    stats = db.query(UserStats).filter(UserStats.user_id == user_id).first()
+    if stats is None:
+        if is_read_only(db):
+            return UserStats(user_id=user_id, **_compute_stats(db, user_id))
+        stats = rebuild_user_stats(db, user_id)
+    return stats
@@ -0,0 +1,274 @@
+"""
+音频流服务 - Range 请求、缓存头、签名播放地址与反向代理直出
+"""
+from email.utils import formatdate
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from fastapi import HTTPException, Request, Response, status
+from fastapi.staticfiles import StaticFiles
+from starlette.types import Receive, Scope, Send
+from app.config import settings
+from app.database import SessionLocal
+from app.services.blob_service import BLOB_SUBDIR, is_public_blob, parse_blob_url
+from app.services.cache_service import TTLCache
+import aiofiles
+import asyncio
+import hashlib
+import hmac
+import mimetypes
+import time
+
+# 内容寻址的文件内容永不改变，客户端可以一直缓存；其他文件每次使用前校验
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def media_path(url: Optional[str]) -> Optional[Path]:
+    """把 /uploads/ 下的 URL 解析为本地文件路径，越出上传目录或文件不存在时返回 None"""
+    if not url or not url.startswith("/uploads/"):
+        return None
+    root = settings.UPLOAD_DIR.resolve()
+    path = (root / url[len("/uploads/"):]).resolve()
+    if root not in path.parents or not path.is_file():
+        return None
+    return path
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单个字节区间，返回闭区间 (start, end)
+
+    没有 Range、格式无法识别或多个区间时返回 None（按完整内容响应）；
+    区间起点超出文件大小时抛出 RangeNotSatisfiable。
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if not start_text:
+            # bytes=-N：最后 N 个字节
+            suffix = int(end_text)
+            if suffix <= 0:
+                raise RangeNotSatisfiable()
+            return max(size - suffix, 0), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+class FileRangeResponse(Response):
+    """
+    发送文件的一个区间
+
+    服务器支持 ASGI zerocopysend 扩展时交给服务器用 sendfile 发送，
+    否则按 STREAM_CHUNK_SIZE 分块异步读取。
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        start: int,
+        length: int,
+        status_code: int = 200,
+        headers: Dict[str, str] = None,
+        media_type: str = None
+    ):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.length = length
+        self.headers["content-length"] = str(length)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or not self.length:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f.fileno(),
+                    "offset": self.start,
+                    "count": self.length,
+                    "more_body": False,
+                })
+            return
+
+        remaining = self.length
+        async with aiofiles.open(self.path, "rb") as f:
+            await f.seek(self.start)
+            while remaining > 0:
+                chunk = await f.read(min(settings.STREAM_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            # 文件在发送过程中被截断
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in {tag.strip().removeprefix("W/") for tag in header.split(",")}
+
+
+def stream_media(request: Request, url: Optional[str]) -> Response:
+    """
+    发送 /uploads/ 下的媒体文件，支持 Range / If-Range / If-None-Match
+
+    配置了 STREAM_ACCEL_REDIRECT 时只返回 X-Accel-Redirect 头，由反向代理读取并发送文件
+    （区间请求也由代理处理），音频字节不经过 Python 进程。
+    """
+    path = media_path(url)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="音频文件不存在")
+
+    stat = path.stat()
+    sha256 = parse_blob_url(url)
+    etag = f'"{sha256}"' if sha256 else f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if sha256 else REVALIDATE_CACHE_CONTROL,
+    }
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if settings.STREAM_ACCEL_REDIRECT:
+        relpath = path.relative_to(settings.UPLOAD_DIR.resolve()).as_posix()
+        headers["X-Accel-Redirect"] = settings.STREAM_ACCEL_REDIRECT.rstrip("/") + "/" + relpath
+        return Response(headers=headers, media_type=media_type)
+
+    size = stat.st_size
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range.strip() not in (etag, headers["Last-Modified"]):
+        # 客户端缓存的版本已变化，返回完整内容
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers=headers)
+
+    if byte_range is None:
+        return FileRangeResponse(path, 0, size, headers=headers, media_type=media_type)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return FileRangeResponse(
+        path, start, end - start + 1,
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        headers=headers,
+        media_type=media_type
+    )
+
+
+# 内容寻址存储之前上传的头像保存在 /uploads/images/avatar_*
+LEGACY_AVATAR_DIR = "images"
+LEGACY_AVATAR_PREFIX = "avatar_"
+
+# 公开的 blob 在文件回收前不会变为私有，只缓存肯定结果
+_public_blob_cache = TTLCache(max_entries=10000, ttl_seconds=300)
+
+
+def is_public_media(relpath: str) -> bool:
+    """/uploads 下的相对路径是否允许不经鉴权直接访问（头像及其缩略图）"""
+    parts = Path(relpath).parts
+    if len(parts) == 2 and parts[0] == LEGACY_AVATAR_DIR and parts[1].startswith(LEGACY_AVATAR_PREFIX):
+        return True
+    sha256 = parse_blob_url("/uploads/" + "/".join(parts))
+    if not sha256:
+        return False
+    if _public_blob_cache.get(sha256):
+        return True
+    db = SessionLocal()
+    try:
+        public = is_public_blob(db, sha256)
+    finally:
+        db.close()
+    if public:
+        _public_blob_cache.set(sha256, True)
+    return public
+
+
+class MediaStaticFiles(StaticFiles):
+    """
+    /uploads 下的公开文件：头像及其缩略图，内容寻址的文件带长期缓存头
+
+    生成的音频、上传的语音/图片和临时文件不公开，一律返回 404；
+    音频只能通过鉴权或签名的播放接口读取。
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if not await asyncio.to_thread(is_public_media, path):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+        return await super().get_response(path, scope)
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if Path(self.get_path(scope)).parts[:1] == (BLOB_SUBDIR,):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+# ============= 签名播放地址 =============
+
+def _stream_signature(music_id: int, expires: int) -> str:
+    message = f"stream:{music_id}:{expires}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()[:32]
+
+
+def signed_stream_url(music_id: int, ttl: int = None, expires: int = None) -> Dict:
+    """生成无需 Authorization 头的限时播放地址（供无法设置请求头的播放器使用）"""
+    if expires is None:
+        expires = int(time.time()) + (ttl or settings.STREAM_URL_TTL)
+    signature = _stream_signature(music_id, expires)
+    return {
+        "url": f"/api/music/{music_id}/stream?expires={expires}&signature={signature}",
+        "expires_at": expires,
+    }
+
+
+def stream_url_expiry(now: float = None) -> int:
+    """
+    响应中播放地址的过期时间，按半个有效期对齐
+
+    同一时间窗内生成的地址相同，列表、详情的 ETag 计入该值即可继续返回 304；
+    客户端拿到（或确认未修改）的地址剩余有效期不少于 STREAM_URL_TTL 的一半。
+    """
+    window = max(settings.STREAM_URL_TTL // 2, 1)
+    now = time.time() if now is None else now
+    return (int(now) // window + 2) * window
+
+
+def playback_url(music_id: int, music_url: Optional[str]) -> Optional[str]:
+    """把保存的 /uploads 音频路径换成签名播放地址，尚未生成（为空）或已经换过的原样返回"""
+    if not music_url or not music_url.startswith("/uploads/"):
+        return music_url
+    return signed_stream_url(music_id, expires=stream_url_expiry())["url"]
+
+
+def verify_stream_signature(music_id: int, expires: int, signature: str) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(_stream_signature(music_id, expires), signature)
@@ -0,0 +1,210 @@
+"""
+音频转码服务 - 在独立进程池中输出多码率版本与试听片段，按客户端提示选择版本
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models.music import MusicRendition
+from app.services.blob_service import blob_url, ingest_file, release
+from app.services.job_queue import Job
+from app.services.music_service import get_music_url, update_music_media
+from app.services.stream_service import media_path
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+
+logger = logging.getLogger(__name__)
+
+PREVIEW = "preview"
+# 网络质量提示（ECT 请求头）对应的版本
+_ECT_RENDITIONS = {"slow-2g": "low", "2g": "low", "3g": "medium", "4g": "high"}
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+# ============= 转码（在子进程中执行） =============
+
+def transcode_file(
+    source: str,
+    out_dir: str,
+    fmt: str,
+    bitrates: Dict[str, int],
+    preview_seconds: int,
+    preview_bitrate: int,
+    ffmpeg_path: str = ""
+) -> Dict:
+    """
+    解码源文件并导出各码率版本和试听片段，返回时长与输出文件信息
+
+    只依赖参数，不访问数据库，在进程池中执行。
+    """
+    from pydub import AudioSegment
+
+    if ffmpeg_path:
+        AudioSegment.converter = ffmpeg_path
+    audio = AudioSegment.from_file(source)
+    duration = len(audio) / 1000
+
+    outputs = []
+    for name, bitrate in bitrates.items():
+        path = os.path.join(out_dir, f"{name}.{fmt}")
+        audio.export(path, format=fmt, bitrate=f"{bitrate}k")
+        outputs.append({"name": name, "path": path, "bitrate": bitrate, "duration": duration})
+
+    # 试听片段从三分之一处开始截取，首尾淡入淡出
+    preview_ms = min(preview_seconds * 1000, len(audio))
+    start = min(len(audio) // 3, len(audio) - preview_ms)
+    fade = min(500, preview_ms // 4)
+    clip = audio[start:start + preview_ms].fade_in(fade).fade_out(fade)
+    path = os.path.join(out_dir, f"{PREVIEW}.{fmt}")
+    clip.export(path, format=fmt, bitrate=f"{preview_bitrate}k")
+    outputs.append({"name": PREVIEW, "path": path, "bitrate": preview_bitrate, "duration": len(clip) / 1000})
+
+    for output in outputs:
+        output["size"] = os.path.getsize(output["path"])
+    return {"duration": duration, "size": os.path.getsize(source), "renditions": outputs}
+
+
+def get_transcode_pool() -> ProcessPoolExecutor:
+    """
+    转码进程池（首次使用时创建）
+
+    使用 spawn 启动子进程：父进程中有事件循环和数据库连接池的线程，fork 可能继承被占用的锁。
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.TRANSCODE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def shutdown_transcode_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+async def run_transcode(source: Path, out_dir: Path) -> Dict:
+    """在进程池中转码，不占用调用方的事件循环和 CPU"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_transcode_pool(),
+        transcode_file,
+        str(source),
+        str(out_dir),
+        settings.TRANSCODE_FORMAT,
+        dict(settings.TRANSCODE_BITRATES),
+        settings.TRANSCODE_PREVIEW_SECONDS,
+        settings.TRANSCODE_PREVIEW_BITRATE,
+        settings.FFMPEG_PATH
+    )
+
+
+# ============= 版本登记 =============
+
+def save_renditions(db: Session, music_id: int, result: Dict, source_format: str) -> List[MusicRendition]:
+    """
+    把转码输出登记到内容寻址存储并替换音乐的版本记录，回填时长、大小和格式
+
+    文件先逐个入库（各自提交引用计数），版本记录与音乐信息在一个事务中替换，
+    失败时释放本次入库的引用；旧版本的文件引用在新记录提交后释放。
+    """
+    fmt = settings.TRANSCODE_FORMAT
+    stored = [(output, ingest_file(db, Path(output["path"]), fmt)) for output in result["renditions"]]
+    try:
+        old_urls = [url for (url,) in db.query(MusicRendition.url).filter(MusicRendition.music_id == music_id)]
+        db.query(MusicRendition).filter(MusicRendition.music_id == music_id).delete(synchronize_session=False)
+        renditions = [
+            MusicRendition(
+                music_id=music_id,
+                name=output["name"],
+                format=fmt,
+                bitrate=output["bitrate"],
+                url=blob_url(blob),
+                file_size=output["size"],
+                duration=round(output["duration"]),
+            )
+            for output, blob in stored
+        ]
+        db.add_all(renditions)
+        update_music_media(db, music_id, round(result["duration"]), result["size"], source_format)
+    except Exception:
+        db.rollback()
+        for _, blob in stored:
+            release(db, blob_url(blob))
+        raise
+
+    for url in old_urls:
+        release(db, url)
+    return renditions
+
+
+async def transcode_music(db: Session, job: Job) -> None:
+    """
+    转码任务：生成完成后执行，源文件不存在（如模拟生成）时跳过
+
+    最终失败不影响音乐本身，播放接口回退到原始文件。
+    """
+    source = media_path(job.payload.get("music_url"))
+    if source is None:
+        logger.info("music %s has no local audio file, skip transcoding", job.music_id)
+        return
+
+    out_dir = settings.UPLOAD_DIR / "tmp" / f"transcode_{job.id}_{os.getpid()}"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        result = await run_transcode(source, out_dir)
+        # 入库要计算哈希并移动文件，放到线程中执行
+        await asyncio.to_thread(save_renditions, db, job.music_id, result, source.suffix.lstrip(".") or "mp3")
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+# ============= 按客户端提示选择版本 =============
+
+def rendition_from_hints(quality: Optional[str], headers: Mapping[str, str]) -> Optional[str]:
+    """
+    按客户端提示选择版本名，None 表示原始文件
+
+    显式的 quality 参数优先，其次是 Save-Data、ECT、Downlink（Mbps）请求头。
+    """
+    if quality:
+        return None if quality == "original" else quality
+    if headers.get("save-data", "").lower() == "on":
+        return "low"
+    ect = headers.get("ect", "").lower()
+    if ect in _ECT_RENDITIONS:
+        return _ECT_RENDITIONS[ect]
+    try:
+        downlink = float(headers.get("downlink", ""))
+    except ValueError:
+        return None
+    if downlink < 0.5:
+        return "low"
+    if downlink < 2:
+        return "medium"
+    return None
+
+
+def get_stream_source(db: Session, music_id: int, user_id: int = None, rendition: str = None) -> str:
+    """返回要播放的文件地址：有对应版本时用该版本，否则用原始文件"""
+    music_url = get_music_url(db, music_id, user_id)
+    if not rendition:
+        return music_url
+    row = db.query(MusicRendition.url).filter(
+        MusicRendition.music_id == music_id,
+        MusicRendition.name == rendition
+    ).first()
+    db.commit()
+    return row.url if row else music_url
@@ -0,0 +1,133 @@
+"""
+上传服务 - 请求体大小限制与分块流式写入上传文件
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from fastapi import HTTPException, UploadFile, status
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.config import settings
+import aiofiles
+import aiofiles.os
+import hashlib
+import re
+import uuid
+
+
+@dataclass
+class StoredUpload:
+    """已落盘的上传文件"""
+    path: Path
+    url: str
+    size: int
+    sha256: str
+
+
+def _too_large_detail(max_size: int) -> str:
+    return f"文件大小超过限制（最大 {max_size // (1024 * 1024)}MB）"
+
+
+class UploadSizeLimitMiddleware:
+    """
+    在解析表单之前限制请求体大小
+
+    Starlette 会先把整个 multipart 请求体读到内存或临时文件，save_upload 的大小校验发生在这之后。
+    这里 Content-Length 超过上限时直接返回 413，不读取请求体；没有 Content-Length（分块传输）时
+    边接收边计数，超过上限立即中止。save_upload 的校验作为单个文件的兜底。
+    """
+
+    def __init__(self, app: ASGIApp, max_body_size: int = None):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.max_body_size or settings.MAX_FILE_SIZE + settings.UPLOAD_FORM_OVERHEAD
+        detail = _too_large_detail(settings.MAX_FILE_SIZE)
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse({"detail": detail}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def get_file_ext(filename: str, default: str) -> str:
+    """从文件名取扩展名，只保留安全字符"""
+    if not filename or "." not in filename:
+        return default
+    ext = filename.rsplit(".", 1)[-1].lower()
+    if not re.fullmatch(r"[a-z0-9]{1,10}", ext):
+        return default
+    return ext
+
+
+async def save_upload(
+    upload: UploadFile,
+    subdir: str,
+    prefix: str,
+    default_ext: str,
+    max_size: int = None,
+    chunk_size: int = None
+) -> StoredUpload:
+    """
+    分块读取上传文件并异步写入 UPLOAD_DIR/subdir
+
+    边写边计算 SHA-256 并校验大小，内存中最多只有一个分块；
+    超过大小限制时删除临时文件并返回 413。
+    """
+    max_size = max_size or settings.MAX_FILE_SIZE
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+
+    target_dir = settings.UPLOAD_DIR / subdir
+    target_dir.mkdir(parents=True, exist_ok=True)
+
+    filename = f"{prefix}_{uuid.uuid4()}.{get_file_ext(upload.filename, default_ext)}"
+    file_path = target_dir / filename
+    tmp_path = target_dir / f".{filename}.part"
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as f:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=_too_large_detail(max_size)
+                    )
+                digest.update(chunk)
+                await f.write(chunk)
+        await aiofiles.os.replace(tmp_path, file_path)
+    except BaseException:
+        if tmp_path.exists():
+            await aiofiles.os.remove(tmp_path)
+        raise
+    finally:
+        await upload.close()
+
+    return StoredUpload(
+        path=file_path,
+        url=f"/uploads/{subdir}/{filename}",
+        size=size,
+        sha256=digest.hexdigest()
+    )
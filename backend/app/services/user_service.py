@@ -2,11 +2,40 @@
 用户服务 - 完整版
 """
 from sqlalchemy.orm import Session
+from typing import Dict, Optional
 from app.models.user import User, UserSettings
+from app.models.stats import UserStats
 from app.schemas.user import UserSettingsUpdate, UserProfileUpdate
+from app.services.blob_service import mark_public, release
+from app.services.auth_service import invalidate_user_cache
 from fastapi import HTTPException, status
 
 
+def get_registration_conflict(db: Session, email: str, username: str) -> Optional[str]:
+    """检查邮箱/用户名是否已被占用，返回错误信息（检查后归还连接）"""
+    conflict = None
+    if db.query(User.id).filter(User.email == email).first():
+        conflict = "Email already registered"
+    elif db.query(User.id).filter(User.username == username).first():
+        conflict = "Username already taken"
+    db.rollback()
+    return conflict
+
+
+def create_user(db: Session, email: str, username: str, hashed_password: str) -> User:
+    """创建用户及默认设置和统计汇总"""
+    user = User(email=email, username=username, hashed_password=hashed_password)
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    
+    db.add(UserSettings(user_id=user.id))
+    db.add(UserStats(user_id=user.id))
+    db.commit()
+    db.refresh(user)
+    return user
+
+
 def get_user_settings(db: Session, user_id: int) -> UserSettings:
     """获取用户设置"""
     settings = db.query(UserSettings).filter(UserSettings.user_id == user_id).first()
@@ -57,5 +86,41 @@ def update_user_profile(
         setattr(user, field, value)
     
     db.commit()
+    invalidate_user_cache(user_id)
+    db.refresh(user)
+    return user
+
+
+def replace_avatar(db: Session, user: User, avatar_url: str, avatar_variants: Dict[str, str] = None) -> User:
+    """
+    设置新头像及其缩略图（调用方已持有新头像的引用），并释放旧头像的引用
+
+    头像和缩略图标记为公开，可通过 /uploads 直接访问；
+    旧头像的最后一个引用释放时，原图和由它生成的缩略图一起回收。
+    """
+    mark_public(db, [avatar_url, *(avatar_variants or {}).values()])
+    old_avatar_url = user.avatar_url
+    user.avatar_url = avatar_url
+    user.avatar_variants = avatar_variants
+    db.commit()
+    invalidate_user_cache(user.id)
+    release(db, old_avatar_url)
+    db.refresh(user)
+    return user
+
+
+def deactivate_user(db: Session, user_id: int) -> User:
+    """停用用户，已签发的 token 随即失效"""
+    user = db.query(User).filter(User.id == user_id).first()
+    
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="用户不存在"
+        )
+    
+    user.is_active = False
+    db.commit()
+    invalidate_user_cache(user_id)
     db.refresh(user)
     return user
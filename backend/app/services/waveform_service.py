@@ -0,0 +1,190 @@
+"""
+波形服务 - 生成完成后计算峰值数组与频谱指纹，按请求分辨率返回峰值
+"""
+from typing import Dict, Optional
+from fastapi import HTTPException, status
+import numpy as np
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models.music import Music, MusicWaveform
+from app.services.job_queue import Job
+from app.services.stream_service import media_path
+from app.services.transcode_service import get_transcode_pool
+import asyncio
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 指纹参数：频谱按对数刻度分为 FINGERPRINT_BANDS 个频带（相邻频带相减得到 BANDS-1 位），
+# 时间轴分为 FINGERPRINT_SEGMENTS 段（相邻段相减得到 SEGMENTS-1 行），共 32 x 32 位
+FINGERPRINT_BANDS = 33
+FINGERPRINT_SEGMENTS = 33
+FINGERPRINT_FRAME = 2048
+FINGERPRINT_MIN_HZ = 300
+FINGERPRINT_MAX_HZ = 5000
+FINGERPRINT_FLOOR = 1e-4                    # 能量下限（相对最强频带，约 -40 dB）
+
+
+# ============= 分析（在子进程中执行） =============
+
+def _mono_samples(source: str, ffmpeg_path: str = ""):
+    """解码为单声道 float32 数组（-1 ~ 1），返回 (samples, 采样率)"""
+    from pydub import AudioSegment
+
+    if ffmpeg_path:
+        AudioSegment.converter = ffmpeg_path
+    audio = AudioSegment.from_file(source)
+    samples = np.frombuffer(audio.raw_data, dtype={1: np.int8, 2: np.int16, 4: np.int32}[audio.sample_width])
+    samples = samples.reshape(-1, audio.channels).astype(np.float32).mean(axis=1)
+    samples /= float(1 << (8 * audio.sample_width - 1))
+    return samples, audio.frame_rate
+
+
+def compute_peaks(samples: np.ndarray, points: int) -> np.ndarray:
+    """把样本分为 points 个区间取绝对值最大，按曲目最大幅度归一化为 uint8"""
+    if not len(samples):
+        return np.zeros(points, dtype=np.uint8)
+    bucket = -(-len(samples) // points)
+    padded = np.zeros(bucket * points, dtype=np.float32)
+    padded[:len(samples)] = np.abs(samples)
+    peaks = padded.reshape(points, bucket).max(axis=1)
+    top = peaks.max()
+    if top > 0:
+        peaks = peaks / top
+    return np.round(peaks * 255).astype(np.uint8)
+
+
+def compute_fingerprint(samples: np.ndarray, rate: int) -> bytes:
+    """
+    频谱指纹：每段的对数频带能量，取频带间差值随时间的变化符号作为位
+
+    对音量整体缩放不敏感；时长不同的曲目按比例分段，可以直接比较。
+    """
+    frames = len(samples) // FINGERPRINT_FRAME
+    if frames < FINGERPRINT_SEGMENTS:
+        samples = np.pad(samples, (0, FINGERPRINT_FRAME * FINGERPRINT_SEGMENTS - len(samples)))
+        frames = FINGERPRINT_SEGMENTS
+    window = np.hanning(FINGERPRINT_FRAME).astype(np.float32)
+    spectrum = np.abs(np.fft.rfft(
+        samples[:frames * FINGERPRINT_FRAME].reshape(frames, FINGERPRINT_FRAME) * window, axis=1
+    )) ** 2
+
+    freqs = np.fft.rfftfreq(FINGERPRINT_FRAME, 1 / rate)
+    edges = np.geomspace(FINGERPRINT_MIN_HZ, min(FINGERPRINT_MAX_HZ, rate / 2), FINGERPRINT_BANDS + 1)
+    band_index = np.searchsorted(edges, freqs, side="right") - 1
+    in_range = (band_index >= 0) & (band_index < FINGERPRINT_BANDS)
+    bands = np.zeros((frames, FINGERPRINT_BANDS), dtype=np.float64)
+    np.add.at(bands.T, band_index[in_range], spectrum[:, in_range].T)
+
+    # 时间轴按比例分段求平均能量
+    starts = np.linspace(0, frames, FINGERPRINT_SEGMENTS + 1).astype(int)[:-1]
+    counts = np.diff(np.append(starts, frames))
+    energy = np.add.reduceat(bands, starts, axis=0) / counts[:, None]
+    # 相对最强频带归一化并设置下限，忽略量化噪声等低能量差异
+    energy = np.log(np.maximum(energy / max(energy.max(), 1e-12), FINGERPRINT_FLOOR))
+
+    band_diff = energy[:, :-1] - energy[:, 1:]
+    bits = (band_diff[1:] - band_diff[:-1]) > 1e-6
+    return np.packbits(bits).tobytes()
+
+
+def analyze_file(source: str, points: int, ffmpeg_path: str = "") -> Dict:
+    """解码并计算峰值与指纹，只依赖参数，在进程池中执行"""
+    samples, rate = _mono_samples(source, ffmpeg_path)
+    return {
+        "duration_ms": int(len(samples) * 1000 / rate),
+        "peaks": compute_peaks(samples, points).tobytes(),
+        "fingerprint": compute_fingerprint(samples, rate),
+    }
+
+
+async def run_analysis(source) -> Dict:
+    """在转码进程池中分析，不占用事件循环"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_transcode_pool(),
+        analyze_file,
+        str(source),
+        settings.WAVEFORM_PEAKS,
+        settings.FFMPEG_PATH
+    )
+
+
+# ============= 保存与查询 =============
+
+def find_duplicate(db: Session, music_id: int, fingerprint: bytes) -> Optional[int]:
+    """在同一用户的其他作品中查找指纹最接近且差异低于阈值的一首，返回其中最早的 ID"""
+    user_id = db.query(Music.user_id).filter(Music.id == music_id).scalar()
+    rows = db.query(MusicWaveform.music_id, MusicWaveform.fingerprint).join(
+        Music, Music.id == MusicWaveform.music_id
+    ).filter(
+        Music.user_id == user_id,
+        MusicWaveform.music_id != music_id
+    ).all()
+    rows = [row for row in rows if len(row.fingerprint) == len(fingerprint)]
+    if not rows:
+        return None
+
+    target = np.unpackbits(np.frombuffer(fingerprint, dtype=np.uint8))
+    others = np.unpackbits(np.frombuffer(b"".join(row.fingerprint for row in rows), dtype=np.uint8))
+    distances = (others.reshape(len(rows), -1) != target).mean(axis=1)
+    matches = [row.music_id for row, distance in zip(rows, distances)
+               if distance < settings.FINGERPRINT_DUPLICATE_THRESHOLD]
+    return min(matches) if matches else None
+
+
+def save_waveform(db: Session, music_id: int, result: Dict) -> Optional[MusicWaveform]:
+    """保存分析结果（重复执行时覆盖），音乐已被删除时返回 None"""
+    if db.query(Music.id).filter(Music.id == music_id).first() is None:
+        return None
+    waveform = db.get(MusicWaveform, music_id) or MusicWaveform(music_id=music_id)
+    waveform.duration_ms = result["duration_ms"]
+    waveform.peaks = result["peaks"]
+    waveform.fingerprint = result["fingerprint"]
+    waveform.duplicate_of = find_duplicate(db, music_id, result["fingerprint"])
+    db.add(waveform)
+    db.commit()
+    return waveform
+
+
+async def analyze_music(db: Session, job: Job) -> None:
+    """波形分析任务：生成完成后执行，源文件不存在（如模拟生成）时跳过"""
+    source = media_path(job.payload.get("music_url"))
+    if source is None:
+        logger.info("music %s has no local audio file, skip waveform analysis", job.music_id)
+        return
+    result = await run_analysis(source)
+    await asyncio.to_thread(save_waveform, db, job.music_id, result)
+
+
+def downsample_peaks(peaks: bytes, resolution: int) -> bytes:
+    """把保存的峰值降采样到 resolution 个点（每个点取区间最大值），不超过保存的点数"""
+    data = np.frombuffer(peaks, dtype=np.uint8)
+    if resolution >= len(data) or not len(data):
+        return data.tobytes()
+    starts = np.linspace(0, len(data), resolution + 1).astype(int)[:-1]
+    return np.maximum.reduceat(data, starts).tobytes()
+
+
+def get_music_peaks(db: Session, music_id: int, user_id: int, resolution: int) -> Dict:
+    """返回指定分辨率的峰值；音乐不存在或不属于该用户时 404，尚未分析完成时 404"""
+    row = db.query(MusicWaveform.duration_ms, MusicWaveform.peaks).join(
+        Music, Music.id == MusicWaveform.music_id
+    ).filter(
+        Music.id == music_id,
+        Music.user_id == user_id
+    ).first()
+    db.commit()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="波形尚未生成"
+        )
+    peaks = downsample_peaks(row.peaks, resolution)
+    return {
+        "resolution": len(peaks),
+        "duration_ms": row.duration_ms,
+        "peaks": peaks,
+        "etag": '"' + hashlib.sha1(row.peaks + str(resolution).encode()).hexdigest()[:20] + '"',
+    }
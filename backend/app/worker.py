@@ -0,0 +1,200 @@
+"""
+生成任务 worker 池 - 从队列领取任务并执行
+"""
+from typing import Awaitable, Callable, Dict, Optional, Set
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal, init_db
+from app.services.job_queue import Job, JobQueue, PermanentJobError, get_job_queue
+from app.services.generation_service import JOB_HANDLERS, mark_generation_failed
+from app.services.transcode_service import shutdown_transcode_pool
+from app.services.model_registry import get_model_registry
+import asyncio
+import logging
+import os
+import signal
+import socket
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool:
+    """可配置并发度的 worker 池，每个任务持有租约并定期心跳续约"""
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handlers: Dict[str, Callable[[Session, Job], Awaitable[None]]] = None,
+        concurrency: int = None,
+        session_factory: Callable[[], Session] = SessionLocal,
+        on_failed: Callable[[Session, Job, str, Optional[str]], None] = mark_generation_failed
+    ):
+        self.queue = queue
+        self.handlers = handlers if handlers is not None else JOB_HANDLERS
+        self.concurrency = concurrency or settings.WORKER_CONCURRENCY
+        self.session_factory = session_factory
+        self.on_failed = on_failed
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._stopping = asyncio.Event()
+        self._loops: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        """启动 worker 协程"""
+        self._stopping.clear()
+        for index in range(self.concurrency):
+            task = asyncio.create_task(self._worker_loop(f"{self.name}:{index}"))
+            self._loops.add(task)
+        logger.info("worker pool %s started with concurrency=%d", self.name, self.concurrency)
+
+    async def stop(self, timeout: float = None) -> None:
+        """停止领取新任务，等待进行中的任务完成，超时则取消并归还任务"""
+        timeout = settings.WORKER_SHUTDOWN_TIMEOUT if timeout is None else timeout
+        self._stopping.set()
+        if not self._loops:
+            return
+        _, pending = await asyncio.wait(self._loops, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*self._loops, return_exceptions=True)
+        self._loops.clear()
+        logger.info("worker pool %s stopped", self.name)
+
+    async def run_forever(self) -> None:
+        """以独立进程方式运行，直到收到停止信号"""
+        await self.start()
+        await self._stopping.wait()
+        await self.stop()
+
+    def request_stop(self) -> None:
+        self._stopping.set()
+
+    async def _worker_loop(self, worker_id: str) -> None:
+        while not self._stopping.is_set():
+            try:
+                job = await asyncio.to_thread(
+                    self.queue.claim, worker_id, settings.JOB_LEASE_SECONDS
+                )
+            except Exception:
+                logger.exception("worker %s failed to claim job", worker_id)
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=settings.JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run_job(worker_id, job)
+
+    async def _run_job(self, worker_id: str, job: Job) -> None:
+        # 租约过期被重新领取的任务也会计入尝试次数，超过上限直接判定失败
+        if job.attempts > job.max_attempts:
+            await self._fail(worker_id, job, "lease expired too many times")
+            return
+
+        handler = self.handlers.get(job.job_type)
+        if handler is None:
+            await self._fail(worker_id, job, f"unknown job type: {job.job_type}")
+            return
+
+        db = self.session_factory()
+        lease_lost = asyncio.Event()
+        work = asyncio.create_task(handler(db, job))
+        heartbeat = asyncio.create_task(self._heartbeat(worker_id, job, work, lease_lost))
+        try:
+            await work
+        except asyncio.CancelledError:
+            if lease_lost.is_set():
+                # 租约已被其他 worker 接管，放弃本次执行
+                await asyncio.to_thread(db.rollback)
+                return
+            # worker 停止：把任务还回队列，由其他 worker 接手
+            await asyncio.to_thread(self.queue.release, job.id, worker_id)
+            raise
+        except PermanentJobError as exc:
+            # 输入本身无法处理，不再重试，错误信息直接展示给用户
+            logger.warning("job %s (music %s) failed permanently: %s", job.id, job.music_id, exc)
+            await asyncio.to_thread(db.rollback)
+            await self._fail(worker_id, job, str(exc), db, retry=False, message=str(exc))
+        except Exception as exc:
+            logger.exception("job %s (music %s) failed", job.id, job.music_id)
+            await asyncio.to_thread(db.rollback)
+            await self._fail(worker_id, job, repr(exc), db)
+        else:
+            await asyncio.to_thread(self.queue.complete, job.id, worker_id)
+        finally:
+            heartbeat.cancel()
+            db.close()
+
+    async def _heartbeat(
+        self,
+        worker_id: str,
+        job: Job,
+        work: asyncio.Task,
+        lease_lost: asyncio.Event
+    ) -> None:
+        while not work.done():
+            await asyncio.sleep(settings.JOB_HEARTBEAT_SECONDS)
+            alive = await asyncio.to_thread(
+                self.queue.heartbeat, job.id, worker_id, settings.JOB_LEASE_SECONDS
+            )
+            if not alive:
+                logger.warning("job %s lost its lease, cancelling", job.id)
+                lease_lost.set()
+                work.cancel()
+                return
+
+    async def _fail(
+        self,
+        worker_id: str,
+        job: Job,
+        error: str,
+        db: Optional[Session] = None,
+        retry: bool = True,
+        message: Optional[str] = None
+    ) -> None:
+        """
+        记录失败并按需重试，最终失败时调用 on_failed
+
+        error 写入任务的 last_error 和日志；message 为可以展示给用户的失败原因，
+        其他错误（数据库、驱动异常等）不把细节返回给客户端。
+        """
+        retry = await asyncio.to_thread(self.queue.fail, job.id, worker_id, error, retry)
+        if retry:
+            return
+
+        await asyncio.to_thread(self._mark_failed, job, error, db, message)
+
+    def _mark_failed(self, job: Job, error: str, db: Optional[Session] = None, message: Optional[str] = None) -> None:
+        """任务最终失败时调用 on_failed（在线程中执行）"""
+        own_session = db is None
+        db = db or self.session_factory()
+        try:
+            self.on_failed(db, job, error, message)
+        except Exception:
+            logger.exception("failed to mark music %s as failed", job.music_id)
+        finally:
+            if own_session:
+                db.close()
+
+
+async def main() -> None:
+    """独立 worker 进程入口"""
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    models = settings.MODEL_PRELOAD + [name for name in settings.MODEL_PREWARM if name not in settings.MODEL_PRELOAD]
+    if models:
+        await asyncio.to_thread(get_model_registry().warm, models)
+    pool = WorkerPool(get_job_queue())
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, pool.request_stop)
+
+    await pool.run_forever()
+    await asyncio.to_thread(shutdown_transcode_pool)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+"""
+认证开销基准测试：对比 get_current_user 在关闭/开启认证缓存时的单次耗时
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_auth.py [--requests 5000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# 使用临时 SQLite 数据库，避免依赖 MySQL
+_tmpdir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmpdir}/bench.db")
+os.environ.setdefault("DEBUG", "False")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.security import HTTPAuthorizationCredentials  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services.auth_service import create_access_token, get_current_user, clear_auth_cache  # noqa: E402
+
+
+async def run(requests: int, cached: bool) -> float:
+    settings.AUTH_CACHE_ENABLED = cached
+    clear_auth_cache()
+    credentials = HTTPAuthorizationCredentials(
+        scheme="Bearer",
+        credentials=create_access_token({"sub": "1"})
+    )
+    start = time.perf_counter()
+    for _ in range(requests):
+        # 每个请求使用独立会话，与 get_db 一致
+        db = SessionLocal()
+        try:
+            await get_current_user(credentials, db)
+        finally:
+            db.close()
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    if not db.query(User).filter(User.id == 1).first():
+        db.add(User(id=1, email="bench@example.com", username="bench", hashed_password="x"))
+        db.commit()
+    db.close()
+
+    uncached = asyncio.run(run(args.requests, cached=False))
+    cached = asyncio.run(run(args.requests, cached=True))
+    print(f"requests: {args.requests}")
+    print(f"without cache: {uncached:8.1f} us/request")
+    print(f"with cache:    {cached:8.1f} us/request")
+    print(f"speedup:       {uncached / cached:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
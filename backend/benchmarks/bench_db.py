@@ -0,0 +1,162 @@
+"""
+数据库访问路径负载测试：对比同步会话与异步会话（DB_ASYNC）下接口吞吐量与事件循环延迟
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_db.py [--requests 1000] [--concurrency 10] [--musics 500]
+
+默认使用临时 SQLite 数据库（aiosqlite）；设置 DATABASE_URL 可对 MySQL 测试（aiomysql）。
+每种模式在独立子进程中运行，因为 DB_ASYNC 在导入时决定路由使用的会话。
+同步模式下并发数超过连接池容量时，连接池取连接会阻塞事件循环而卡死，结果记为失败。
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ["/api/music/?limit=20", "/api/music/stats", "/api/music/journal?days=7"]
+
+
+def seed(musics: int) -> str:
+    """准备测试用户和音乐数据，返回 token"""
+    from app.database import SessionLocal, init_db
+    from app.models.music import Music
+    from app.models.user import User
+    from app.services.auth_service import create_access_token
+    from app.services.stats_service import rebuild_user_stats
+
+    init_db()
+    db = SessionLocal()
+    try:
+        if not db.query(User).filter(User.id == 1).first():
+            db.add(User(id=1, email="bench@example.com", username="bench", hashed_password="x"))
+            db.commit()
+            db.add_all([
+                Music(
+                    user_id=1,
+                    title=f"music {i}",
+                    input_type="text",
+                    input_content="bench",
+                    music_url=f"/uploads/music/generated_{i}.mp3",
+                    status="completed",
+                    primary_emotion=("calm", "happy", "sad")[i % 3],
+                    duration=30,
+                )
+                for i in range(musics)
+            ])
+            db.commit()
+            rebuild_user_stats(db, 1)
+    finally:
+        db.close()
+    return create_access_token({"sub": "1"})
+
+
+async def run(requests: int, concurrency: int, token: str) -> dict:
+    import httpx
+    from app.main import app
+
+    headers = {"Authorization": f"Bearer {token}"}
+    latencies = []
+    loop_lag = []
+    done = asyncio.Event()
+
+    async def probe():
+        # 事件循环被同步 I/O 阻塞时，sleep 的实际耗时会明显变长
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            loop_lag.append(time.perf_counter() - start - 0.005)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            counter = iter(range(requests))
+
+            async def worker():
+                for i in counter:
+                    start = time.perf_counter()
+                    response = await client.get(ENDPOINTS[i % len(ENDPOINTS)], headers=headers)
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+
+            probe_task = asyncio.create_task(probe())
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+            done.set()
+            await probe_task
+
+    latencies.sort()
+    return {
+        "throughput": requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "max_loop_lag_ms": max(loop_lag) * 1000 if loop_lag else 0.0,
+    }
+
+
+def child(args) -> None:
+    sys.path.insert(0, BACKEND_DIR)
+    token = seed(args.musics)
+    result = asyncio.run(run(args.requests, args.concurrency, token))
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--timeout", type=int, default=300, help="单个模式的最长运行时间（秒）")
+    parser.add_argument("--musics", type=int, default=500)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    tmpdir = tempfile.mkdtemp()
+    results = {}
+    for mode in ("False", "True"):
+        env = dict(os.environ)
+        env.setdefault("DATABASE_URL", f"sqlite:///{tmpdir}/bench.db")
+        env.update({
+            "DB_ASYNC": mode,
+            "DEBUG": "False",
+            "RUN_EMBEDDED_WORKER": "False",
+            "UPLOAD_DIR": os.path.join(tmpdir, "uploads"),
+        })
+        name = "async" if mode == "True" else "sync"
+        try:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child",
+                 "--requests", str(args.requests),
+                 "--concurrency", str(args.concurrency),
+                 "--musics", str(args.musics)],
+                env=env, cwd=BACKEND_DIR, check=True, capture_output=True, text=True,
+                timeout=args.timeout
+            ).stdout
+            results[name] = json.loads(output.strip().splitlines()[-1])
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as exc:
+            results[name] = None
+            print(f"{name}: failed ({type(exc).__name__})", file=sys.stderr)
+
+    print(f"requests: {args.requests}, concurrency: {args.concurrency}, musics: {args.musics}")
+    print(f"{'mode':<6} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'max loop lag ms':>16}")
+    for mode, r in results.items():
+        if r is None:
+            print(f"{mode:<6} {'failed':>9}")
+            continue
+        print(
+            f"{mode:<6} {r['throughput']:9.1f} {r['p50_ms']:9.1f} "
+            f"{r['p99_ms']:9.1f} {r['max_loop_lag_ms']:16.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+推理合批吞吐基准：并发提交分析请求，对比逐条推理（批次大小 1）与微批调度
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_inference.py [--requests 200] [--concurrency 16] [--batch-sizes 1,4,8,16]
+        [--max-wait-ms 50] [--overhead-ms 80] [--per-item-ms 5]
+
+使用 fake_model.FakeEmotionModel，耗时为“每批固定开销 + 每条开销”；concurrency 对应 WORKER_CONCURRENCY。
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.inference_service import BatchScheduler  # noqa: E402
+from benchmarks.fake_model import FakeEmotionModel  # noqa: E402
+
+INPUT_TYPES = ("text", "voice", "image")
+
+
+async def run(args, batch_size: int) -> dict:
+    model = FakeEmotionModel(batch_overhead=args.overhead_ms / 1000, per_item=args.per_item_ms / 1000)
+    scheduler = BatchScheduler(model, max_batch_size=batch_size, max_wait_ms=args.max_wait_ms)
+    pending = list(range(args.requests))
+    latencies = []
+
+    async def worker():
+        # 与 worker 池一致：每个并发槽位处理完一条再取下一条
+        while pending:
+            index = pending.pop()
+            input_type = INPUT_TYPES[index % len(INPUT_TYPES)] if args.mixed else "text"
+            start = time.perf_counter()
+            await scheduler.submit(input_type, {"content": f"今天很开心 {index}"})
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "throughput": args.requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "avg_batch": scheduler.items / max(scheduler.batches, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-sizes", default="1,4,8,16")
+    parser.add_argument("--max-wait-ms", type=int, default=50)
+    parser.add_argument("--overhead-ms", type=float, default=80, help="每批固定开销")
+    parser.add_argument("--per-item-ms", type=float, default=5, help="每条输入的开销")
+    parser.add_argument("--mixed", action="store_true", help="混合 text / voice / image 三种输入")
+    args = parser.parse_args()
+
+    print(
+        f"requests: {args.requests}, concurrency: {args.concurrency}, max wait: {args.max_wait_ms} ms, "
+        f"cost: {args.overhead_ms} ms + {args.per_item_ms} ms/item"
+    )
+    print(f"{'batch':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'avg batch':>10}")
+    for batch_size in (int(size) for size in args.batch_sizes.split(",")):
+        r = asyncio.run(run(args, batch_size))
+        print(
+            f"{batch_size:>5} {r['throughput']:8.1f} {r['p50_ms']:8.1f} "
+            f"{r['p95_ms']:8.1f} {r['avg_batch']:10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
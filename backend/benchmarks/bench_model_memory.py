@@ -0,0 +1,100 @@
+"""
+多 worker 模型内存基准：对比每个进程各自把权重读入内存、fork 前预加载、内存映射 safetensors 三种方式
+
+用法（在 backend 目录下，仅 Linux）:
+    python benchmarks/bench_model_memory.py [--size-mb 200] [--workers 1,2,4]
+
+每个 worker 遍历一次全部权重（模拟推理访问），然后报告 RSS 与 PSS；
+PSS 把共享页按进程数均摊，各 worker 的 PSS 之和即实际占用的物理内存。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from app.services.model_registry import mmap_safetensors, process_memory  # noqa: E402
+
+MB = 1024 * 1024
+
+
+def write_safetensors(path: str, size_mb: int) -> None:
+    """写一个只含 float32 张量的 safetensors 文件"""
+    rows = size_mb * MB // (4 * 1024)
+    header = {"classifier.weight": {"dtype": "F32", "shape": [rows, 1024], "data_offsets": [0, rows * 1024 * 4]}}
+    encoded = json.dumps(header).encode()
+    encoded += b" " * (-len(encoded) % 8)
+    with open(path, "wb") as f:
+        f.write(len(encoded).to_bytes(8, "little"))
+        f.write(encoded)
+        chunk = np.random.default_rng(0).standard_normal((1024, 1024), dtype=np.float32).tobytes()
+        for _ in range(rows // 1024):
+            f.write(chunk)
+
+
+def load_copy(path: str) -> dict:
+    """每个进程把权重复制到自己的内存中（相当于 torch.load / 普通 load_file）"""
+    return {name: np.array(array) for name, array in mmap_safetensors(path).items()}
+
+
+def touch(weights: dict) -> float:
+    return float(sum(array.sum(dtype=np.float64) for array in weights.values()))
+
+
+def worker(mode: str, path: str, preloaded, ready, done, results) -> None:
+    weights = preloaded if mode == "preload" else (mmap_safetensors(path) if mode == "mmap" else load_copy(path))
+    touch(weights)
+    ready.wait()
+    results.put(process_memory())
+    done.wait()
+
+
+def run(mode: str, path: str, workers: int) -> dict:
+    # fork 前在父进程加载（preload 模式），子进程继承同一份物理页
+    preloaded = load_copy(path) if mode == "preload" else None
+    context = multiprocessing.get_context("fork")
+    ready, done, results = context.Barrier(workers + 1), context.Event(), context.Queue()
+    processes = [
+        context.Process(target=worker, args=(mode, path, preloaded, ready, done, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    ready.wait()
+    memory = [results.get() for _ in range(workers)]
+    done.set()
+    for process in processes:
+        process.join()
+    return {
+        "rss_mb": sum(m["rss"] for m in memory) / workers / MB,
+        "pss_mb": sum(m["pss"] for m in memory) / workers / MB,
+        "total_pss_mb": sum(m["pss"] for m in memory) / MB,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=200)
+    parser.add_argument("--workers", default="1,2,4")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "model.safetensors")
+        write_safetensors(path, args.size_mb)
+        print(f"weights: {args.size_mb} MB")
+        print(f"{'mode':<8} {'workers':>7} {'rss/worker':>11} {'pss/worker':>11} {'total pss':>10}")
+        for mode in ("copy", "preload", "mmap"):
+            for workers in (int(n) for n in args.workers.split(",")):
+                r = run(mode, path, workers)
+                print(
+                    f"{mode:<8} {workers:>7} {r['rss_mb']:10.0f}M {r['pss_mb']:10.0f}M "
+                    f"{r['total_pss_mb']:9.0f}M"
+                )
+
+
+if __name__ == "__main__":
+    main()
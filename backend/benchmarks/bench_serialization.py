@@ -0,0 +1,162 @@
+"""
+列表序列化微基准：对比旧的 ORM 对象 → 23 字段字典 → FastAPI 校验编码，
+与列投影 + 一次校验直接输出 JSON（full / compact 视图）
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_serialization.py [--items 100] [--rounds 200] [--content-size 4000]
+
+使用临时 SQLite 数据库；每轮取一页 items 条，分别统计查询与序列化耗时。
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_tmpdir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmpdir}/serialization.db")
+os.environ.setdefault("DEBUG", "False")
+os.environ.setdefault("PLAY_COUNT_BUFFER_ENABLED", "False")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+from sqlalchemy import desc  # noqa: E402
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.models.music import Music  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.routers.music import render  # noqa: E402
+from app.schemas.music import MusicCompactListResponse, MusicListResponse  # noqa: E402
+from app.services.music_service import favorite_exists, get_user_musics_with_favorite  # noqa: E402
+
+USER_ID = 1
+
+
+def seed(db, items: int, content_size: int) -> None:
+    db.add(User(id=USER_ID, email="bench@example.com", username="bench", hashed_password="x"))
+    db.commit()
+    now = datetime.utcnow()
+    db.add_all([
+        Music(
+            user_id=USER_ID,
+            title=f"music {i}",
+            description="晨跑时的轻快旋律" * 10,
+            input_type="text",
+            input_content="今天的心情" * (content_size // 5),
+            emotion_tags=["happy", "energetic"],
+            primary_emotion="happy",
+            ai_analysis="情绪分析" * (content_size // 8),
+            music_url=f"/uploads/music/generated_{i}.mp3",
+            status="completed",
+            instruments=["piano", "strings"],
+            duration=30,
+            created_at=now - timedelta(minutes=i),
+        )
+        for i in range(items)
+    ])
+    db.commit()
+
+
+def legacy_page(db, limit: int) -> dict:
+    """旧实现：加载完整 ORM 对象并逐字段拷贝成字典"""
+    rows = db.query(Music).filter(Music.user_id == USER_ID).add_columns(
+        favorite_exists(USER_ID).label("is_favorite")
+    ).order_by(desc(Music.created_at), desc(Music.id)).limit(limit).all()
+    items = []
+    for music, is_favorite in rows:
+        items.append({
+            "id": music.id,
+            "user_id": music.user_id,
+            "title": music.title,
+            "description": music.description,
+            "input_type": music.input_type,
+            "input_content": music.input_content,
+            "emotion_tags": music.emotion_tags,
+            "primary_emotion": music.primary_emotion,
+            "ai_analysis": music.ai_analysis,
+            "music_url": music.music_url,
+            "cover_url": music.cover_url,
+            "music_format": music.music_format,
+            "duration": music.duration,
+            "file_size": music.file_size,
+            "bpm": music.bpm,
+            "genre": music.genre,
+            "instruments": music.instruments,
+            "status": music.status,
+            "is_public": music.is_public,
+            "play_count": music.play_count or 0,
+            "created_at": music.created_at,
+            "updated_at": music.updated_at,
+            "is_favorite": bool(is_favorite),
+        })
+    return {"items": items, "total": len(items), "limit": limit, "next_cursor": None}
+
+
+def legacy_render(field, page: dict) -> bytes:
+    """按 FastAPI 处理字典返回值的方式：按 response_model 校验、转回字典再 JSON 编码"""
+    content = asyncio.run(serialize_response(field=field, response_content=page))
+    return JSONResponse(content).body
+
+
+def measure(rounds: int, query, encode) -> dict:
+    query_times, encode_times = [], []
+    size = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        page = query()
+        middle = time.perf_counter()
+        body = encode(page)
+        end = time.perf_counter()
+        query_times.append(middle - start)
+        encode_times.append(end - middle)
+        size = len(body)
+    return {
+        "query_ms": statistics.median(query_times) * 1000,
+        "encode_ms": statistics.median(encode_times) * 1000,
+        "bytes": size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--content-size", type=int, default=4000, help="input_content / ai_analysis 的大致字符数")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    seed(db, args.items, args.content_size)
+    field = create_response_field(name="response", type_=MusicListResponse)
+
+    def run_view(view):
+        return lambda: get_user_musics_with_favorite(db, USER_ID, limit=args.items, view=view)
+
+    cases = [
+        ("legacy", lambda: legacy_page(db, args.items), lambda page: legacy_render(field, page)),
+        ("full", run_view("full"), lambda page: render(MusicListResponse, page).body),
+        ("compact", run_view("compact"), lambda page: render(MusicCompactListResponse, page).body),
+    ]
+
+    results = {}
+    for name, query, encode in cases:
+        measure(10, query, encode)
+        # 每轮清空会话，避免旧实现复用身份映射中的对象
+        results[name] = measure(args.rounds, lambda: (db.expunge_all(), query())[1], encode)
+    db.close()
+
+    print(f"items: {args.items}, rounds: {args.rounds}, content size: {args.content_size}")
+    print(f"{'path':<8} {'query ms':>9} {'encode ms':>10} {'total ms':>9} {'bytes':>9}")
+    for name, r in results.items():
+        print(
+            f"{name:<8} {r['query_ms']:9.2f} {r['encode_ms']:10.2f} "
+            f"{r['query_ms'] + r['encode_ms']:9.2f} {r['bytes']:9d}"
+        )
+
+
+if __name__ == "__main__":
+    main()
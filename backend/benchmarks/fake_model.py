@@ -0,0 +1,33 @@
+"""
+模拟推理耗时的情绪模型，用于基准和本地压测（不在生产中使用）
+
+耗时为“每批固定开销 + 每条开销”，模拟真实模型在 CPU 上的开销，所以合批能提高吞吐。
+在应用中启用（在 backend 目录下启动）:
+    EMOTION_MODEL_LOADER=benchmarks.fake_model:load_fake_emotion_model python run.py
+"""
+import os
+import time
+from typing import Any, Dict, List
+
+from app.services.inference_service import KeywordEmotionModel
+
+
+class FakeEmotionModel(KeywordEmotionModel):
+    """结果与内置的关键词模型相同，每次推理额外等待模拟的耗时"""
+
+    def __init__(self, batch_overhead: float = 0.08, per_item: float = 0.005, **kwargs):
+        super().__init__(**kwargs)
+        self.batch_overhead = batch_overhead
+        self.per_item = per_item
+
+    def predict_batch(self, input_type: str, inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        time.sleep(self.batch_overhead + self.per_item * len(inputs))
+        return super().predict_batch(input_type, inputs)
+
+
+def load_fake_emotion_model() -> FakeEmotionModel:
+    """EMOTION_MODEL_LOADER 使用的加载函数，耗时由 FAKE_MODEL_OVERHEAD_MS / FAKE_MODEL_PER_ITEM_MS 环境变量设置"""
+    return FakeEmotionModel(
+        batch_overhead=float(os.environ.get("FAKE_MODEL_OVERHEAD_MS", 80)) / 1000,
+        per_item=float(os.environ.get("FAKE_MODEL_PER_ITEM_MS", 5)) / 1000,
+    )
@@ -0,0 +1,21 @@
+"""
+gunicorn 配置（生产环境多进程部署）
+
+用法（在 backend 目录下）:
+    MODEL_PRELOAD='["emotion"]' gunicorn app.main:app -c gunicorn.conf.py
+
+preload_app 让 master 进程先导入应用并加载 MODEL_PRELOAD 中的模型，再 fork 出 worker，
+各 worker 以写时复制方式共享权重，增加 worker 不会成倍增加内存。
+"""
+import gc
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+
+def when_ready(server):
+    # 把 fork 前已有的对象移出垃圾回收跟踪，避免 worker 中的回收扫描改写共享页
+    gc.freeze()
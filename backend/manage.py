@@ -0,0 +1,61 @@
+"""
+运维命令脚本
+
+用法:
+    python manage.py gc-blobs       回收未被引用的内容寻址文件
+    python manage.py purge-cache    清理数据库中过期的分析缓存
+    python manage.py rebuild-stats [--user ID ...]    重建用户统计汇总
+    python manage.py migrate        执行数据库迁移（启动时也会自动执行）
+"""
+import argparse
+from app.database import SessionLocal, init_db
+from app.migrations import MIGRATIONS
+from app.services.blob_service import collect_garbage
+from app.services.cache_service import SQLCacheTier
+from app.services.stats_service import rebuild_all_stats
+
+
+def gc_blobs(args):
+    db = SessionLocal()
+    try:
+        result = collect_garbage(db)
+        print(f"removed {result['removed_blobs']} blobs, {result['removed_files']} files")
+    finally:
+        db.close()
+
+
+def purge_cache(args):
+    deleted = SQLCacheTier().purge_expired()
+    print(f"removed {deleted} expired cache entries")
+
+
+def rebuild_stats(args):
+    db = SessionLocal()
+    try:
+        count = rebuild_all_stats(db, args.user or None)
+        print(f"rebuilt stats for {count} users")
+    finally:
+        db.close()
+
+
+def migrate(args):
+    applied = init_db()
+    print(f"applied {len(applied)} migrations, schema version {MIGRATIONS[-1][0]}")
+
+
+COMMANDS = {
+    "gc-blobs": gc_blobs,
+    "purge-cache": purge_cache,
+    "rebuild-stats": rebuild_stats,
+    "migrate": migrate,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SoundMood 运维命令")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--user", type=int, action="append", help="rebuild-stats 只处理指定用户")
+    args = parser.parse_args()
+    if args.command != "migrate":
+        init_db()
+    COMMANDS[args.command](args)
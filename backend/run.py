@@ -1,8 +1,12 @@
 """
 应用启动脚本
 """
+import os
 import uvicorn
 
+# 开发环境在 API 进程内运行生成任务 worker，免去单独启动 worker.py
+os.environ.setdefault("RUN_EMBEDDED_WORKER", "True")
+
 if __name__ == "__main__":
     uvicorn.run(
         "app.main:app",
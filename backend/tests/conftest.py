@@ -0,0 +1,52 @@
+"""
+测试配置 - 使用内存 SQLite 和临时上传目录，不依赖 MySQL 等外部服务
+"""
+import os
+import tempfile
+
+# 必须在导入 app 之前设置（settings 和数据库引擎在导入时创建）
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="soundmood-test-"))
+os.environ.setdefault("DB_ASYNC", "False")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("RUN_EMBEDDED_WORKER", "False")
+os.environ.setdefault("TRANSCODE_ENABLED", "False")
+os.environ.setdefault("WAVEFORM_ENABLED", "False")
+os.environ.setdefault("ANALYSIS_CACHE_SQL_TIER", "False")
+
+import pytest  # noqa: E402
+from app import models  # noqa: E402,F401
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.models import Music, User  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """每个测试使用一份空的内存数据库"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def music(db):
+    """一个生成中的音乐（文本输入）"""
+    user = User(email="test@example.com", username="test", hashed_password="x")
+    db.add(user)
+    db.flush()
+    music = Music(
+        user_id=user.id,
+        title="test",
+        input_type="text",
+        input_content="今天很开心",
+        music_url="/uploads/music/test.mp3",
+        duration=30,
+        status="generating",
+    )
+    db.add(music)
+    db.commit()
+    return music
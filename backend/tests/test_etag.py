@@ -0,0 +1,48 @@
+"""
+ETag 测试：只按持久化的内容版本生成，各进程一致
+"""
+import asyncio
+from starlette.requests import Request
+from app.models.stats import UserStats
+from app.services.etag_service import content_validators
+from app.services.play_service import PlayCounter
+
+
+def _request(path: str = "/api/music/", query: bytes = b"", if_none_match: str = None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": path, "query_string": query, "headers": headers})
+
+
+def _etag(db, user_id: int, **kwargs) -> str:
+    return asyncio.run(content_validators(_request(**kwargs), db, user_id)).etag
+
+
+def test_etag_ignores_unflushed_plays(db, music):
+    db.add(UserStats(user_id=music.user_id, version=1))
+    db.commit()
+    before = _etag(db, music.user_id)
+
+    # 其他进程缓冲中的播放不影响 ETag，写回递增版本后才变化
+    counter = PlayCounter(record_events=False)
+    counter.record(music.id, music.user_id)
+    assert _etag(db, music.user_id) == before
+    counter.flush()
+    db.expire_all()
+    assert _etag(db, music.user_id) != before
+
+
+def test_etag_varies_by_query_and_matches_weakly(db, music):
+    db.add(UserStats(user_id=music.user_id, version=1))
+    db.commit()
+    etag = _etag(db, music.user_id)
+    assert etag.startswith('W/"')
+    assert _etag(db, music.user_id, query=b"view=compact") != etag
+
+    validators = asyncio.run(content_validators(_request(if_none_match=etag), db, music.user_id))
+    assert validators.matches(_request(if_none_match=etag))
+    assert validators.matches(_request(if_none_match=etag.removeprefix("W/")))
+    assert not validators.matches(_request(if_none_match='"other"'))
+
+
+def test_missing_stats_row_disables_validators(db, music):
+    assert asyncio.run(content_validators(_request(), db, music.user_id)) is None
@@ -0,0 +1,73 @@
+"""
+推理合批测试：并发提交合并成少量批次，结果分发回各自的调用方
+"""
+import asyncio
+import math
+import threading
+from app.config import settings
+from app.services.inference_service import BatchScheduler, KeywordEmotionModel, load_emotion_model
+
+
+class RecordingModel:
+    """按输入原样返回结果，记录每次推理的批次"""
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def predict_batch(self, input_type, inputs):
+        with self.lock:
+            self.calls.append((input_type, [item["n"] for item in inputs]))
+        return [{"input_type": input_type, "n": item["n"]} for item in inputs]
+
+
+def _submit_all(scheduler, requests):
+    async def scenario():
+        return await asyncio.gather(*(scheduler.submit(input_type, {"n": n}) for input_type, n in requests))
+    return asyncio.run(scenario())
+
+
+def test_concurrent_submits_are_coalesced_and_routed():
+    model = RecordingModel()
+    scheduler = BatchScheduler(model, max_batch_size=8, max_wait_ms=20)
+    requests = [("text", n) for n in range(20)]
+
+    results = _submit_all(scheduler, requests)
+
+    assert len(model.calls) <= math.ceil(len(requests) / 8)
+    assert all(len(batch) <= 8 for _, batch in model.calls)
+    assert sorted(n for _, batch in model.calls for n in batch) == list(range(20))
+    assert results == [{"input_type": "text", "n": n} for _, n in requests]
+
+
+def test_input_types_are_batched_separately():
+    model = RecordingModel()
+    scheduler = BatchScheduler(model, max_batch_size=8, max_wait_ms=20)
+    requests = [("text" if n % 2 else "image", n) for n in range(12)]
+
+    results = _submit_all(scheduler, requests)
+
+    assert sorted(input_type for input_type, _ in model.calls) == ["image", "text"]
+    assert results == [{"input_type": input_type, "n": n} for input_type, n in requests]
+
+
+def test_model_error_is_raised_to_every_caller_in_batch():
+    class BrokenModel:
+        def predict_batch(self, input_type, inputs):
+            raise RuntimeError("model crashed")
+
+    scheduler = BatchScheduler(BrokenModel(), max_batch_size=4, max_wait_ms=20)
+
+    async def scenario():
+        return await asyncio.gather(
+            *(scheduler.submit("text", {"n": n}) for n in range(3)), return_exceptions=True
+        )
+
+    errors = asyncio.run(scenario())
+    assert [str(error) for error in errors] == ["model crashed"] * 3
+
+
+def test_emotion_model_loader_is_opt_in(monkeypatch):
+    assert isinstance(load_emotion_model(), KeywordEmotionModel)
+    monkeypatch.setattr(settings, "EMOTION_MODEL_LOADER", f"{__name__}:RecordingModel")
+    assert isinstance(load_emotion_model(), RecordingModel)
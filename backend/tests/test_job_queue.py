@@ -0,0 +1,111 @@
+"""
+数据库任务队列测试：领取竞争、租约过期接管、失败重试与归还
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.config import settings
+from app.database import Base, SessionLocal
+from app.models import GenerationJob, JobStatus
+from app.services.job_queue import DatabaseJobQueue
+
+
+def test_claim_complete(db, music):
+    queue = DatabaseJobQueue(SessionLocal)
+    job_id = queue.enqueue(music.id, "noop", {"n": 1})
+
+    job = queue.claim("w1", 60)
+    assert (job.id, job.payload, job.attempts) == (job_id, {"n": 1}, 1)
+    assert queue.claim("w2", 60) is None
+    assert queue.heartbeat(job_id, "w1", 60)
+    assert not queue.heartbeat(job_id, "w2", 60)
+
+    queue.complete(job_id, "w1")
+    row = db.get(GenerationJob, job_id)
+    assert row.status == JobStatus.succeeded
+    assert row.locked_by is None
+
+
+def test_expired_lease_is_taken_over(db, music):
+    queue = DatabaseJobQueue(SessionLocal)
+    job_id = queue.enqueue(music.id, "noop")
+    assert queue.claim("w1", 0).id == job_id
+    time.sleep(0.01)
+
+    job = queue.claim("w2", 60)
+    assert job.id == job_id and job.attempts == 2
+    # 原 worker 已失去租约，续约、完成、失败都不再生效
+    assert not queue.heartbeat(job_id, "w1", 60)
+    queue.complete(job_id, "w1")
+    assert not queue.fail(job_id, "w1", "late")
+    row = db.get(GenerationJob, job_id)
+    assert row.status == JobStatus.running
+    assert row.locked_by == "w2"
+
+
+def test_fail_retries_with_backoff_then_fails(db, music, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_RETRY_BACKOFF_SECONDS", 10)
+    queue = DatabaseJobQueue(SessionLocal)
+    job_id = queue.enqueue(music.id, "noop", max_attempts=2)
+
+    before = datetime.utcnow()
+    queue.claim("w1", 60)
+    assert queue.fail(job_id, "w1", "boom")
+    row = db.get(GenerationJob, job_id)
+    assert row.status == JobStatus.pending
+    assert row.available_at >= before + timedelta(seconds=10)
+    assert queue.claim("w1", 60) is None
+
+    # 退避结束后再次领取，达到最大次数后不再重试
+    row.available_at = datetime.utcnow()
+    db.commit()
+    assert queue.claim("w1", 60).attempts == 2
+    assert not queue.fail(job_id, "w1", "boom again")
+    db.expire_all()
+    row = db.get(GenerationJob, job_id)
+    assert row.status == JobStatus.failed
+    assert row.last_error == "boom again"
+
+
+def test_release_returns_job_without_counting_attempt(db, music):
+    queue = DatabaseJobQueue(SessionLocal)
+    job_id = queue.enqueue(music.id, "noop")
+    queue.claim("w1", 60)
+    queue.release(job_id, "w1")
+
+    row = db.get(GenerationJob, job_id)
+    assert row.status == JobStatus.pending
+    assert row.attempts == 0
+    assert row.locked_by is None
+    assert queue.claim("w2", 60).attempts == 1
+
+
+def test_concurrent_claims_take_each_job_once(tmp_path, music):
+    # 多个连接并发领取（内存数据库只有一个连接，这里使用文件数据库）
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'queue.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30}
+    )
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    # 多个 worker 的候选列表相同，只有条件更新成功的一方得到任务
+    queues = [DatabaseJobQueue(factory, claim_batch=5) for _ in range(8)]
+    job_ids = {queues[0].enqueue(music.id, "noop") for _ in range(40)}
+
+    def drain(index: int):
+        claimed = []
+        while True:
+            job = queues[index].claim(f"w{index}", 60)
+            if job is None:
+                return claimed
+            claimed.append(job)
+
+    with ThreadPoolExecutor(len(queues)) as pool:
+        results = list(pool.map(drain, range(len(queues))))
+    engine.dispose()
+
+    claimed = [job for jobs in results for job in jobs]
+    assert sorted(job.id for job in claimed) == sorted(job_ids)
+    assert all(job.attempts == 1 for job in claimed)
@@ -0,0 +1,47 @@
+"""
+日记测试：按用户时区分日时，每个日期使用当天的实际偏移（跨夏令时切换）
+"""
+from datetime import date, datetime
+from app.models import Music
+from app.services.music_service import get_user_journal
+
+TZ = "America/New_York"
+
+
+def _add(db, user_id: int, created_at: datetime) -> None:
+    db.add(Music(user_id=user_id, title=created_at.isoformat(), input_type="text", input_content="",
+                 music_url="", duration=30, status="completed", created_at=created_at))
+
+
+def test_days_follow_dst_offset(db, music):
+    # 都是当地 23:30：冬令时 UTC-5，夏令时 UTC-4（数据库时区为 UTC）
+    _add(db, music.user_id, datetime(2024, 1, 15, 4, 30))
+    _add(db, music.user_id, datetime(2024, 7, 15, 3, 30))
+    # 切换当天（3 月 10 日 02:00 起 UTC-4）前后各一个
+    _add(db, music.user_id, datetime(2024, 3, 10, 6, 59))
+    _add(db, music.user_id, datetime(2024, 3, 11, 3, 59))
+    db.commit()
+
+    journal = get_user_journal(db, music.user_id, tz=TZ, days=31)
+    days = {entry["date"]: entry["count"] for entry in journal["entries"]}
+    assert days == {date(2024, 7, 14): 1, date(2024, 3, 10): 2, date(2024, 1, 14): 1}
+    assert all(len(entry["items"]) == entry["count"] for entry in journal["entries"])
+
+    winter = get_user_journal(db, music.user_id, date(2024, 1, 14), date(2024, 1, 14), tz=TZ)
+    assert [entry["date"] for entry in winter["entries"]] == [date(2024, 1, 14)]
+    assert winter["total"] == 1
+
+
+def test_cursor_pages_across_dst(db, music):
+    for created_at in (datetime(2024, 1, 15, 4, 30), datetime(2024, 7, 15, 3, 30), datetime(2024, 11, 4, 4, 30)):
+        _add(db, music.user_id, created_at)
+    db.commit()
+
+    pages, cursor = [], None
+    while True:
+        journal = get_user_journal(db, music.user_id, cursor=cursor, days=1, tz=TZ)
+        pages += [(entry["date"], len(entry["items"])) for entry in journal["entries"]]
+        cursor = journal["next_cursor"]
+        if not cursor:
+            break
+    assert pages == [(date(2024, 11, 3), 1), (date(2024, 7, 14), 1), (date(2024, 1, 14), 1)]
@@ -0,0 +1,97 @@
+"""
+媒体访问测试：/uploads 只公开头像，音频只能通过鉴权或签名的播放接口读取
+"""
+import asyncio
+import httpx
+from app.config import settings
+from app.main import app
+from app.services.auth_service import create_access_token
+from app.services.blob_service import blob_url, ingest_file, mark_public
+from app.services.stream_service import stream_url_expiry
+
+AUDIO = b"ID3" + b"\x00" * 1024
+
+
+def _get(path: str, headers: dict = None) -> httpx.Response:
+    async def request():
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            return await client.get(path, headers=headers)
+    return asyncio.run(request())
+
+
+def _write(relpath: str, data: bytes = AUDIO) -> None:
+    path = settings.UPLOAD_DIR / relpath
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def _complete(db, music) -> None:
+    _write(f"music/generated_{music.id}.mp3")
+    music.music_url = f"/uploads/music/generated_{music.id}.mp3"
+    music.status = "completed"
+    db.commit()
+
+
+def test_uploads_do_not_expose_audio_inputs_or_tmp(db, music):
+    _complete(db, music)
+    _write("tmp/upload.part")
+    _write("images/image_1_input.jpg")
+    assert _get(f"/uploads/music/generated_{music.id}.mp3").status_code == 404
+    assert _get("/uploads/tmp/upload.part").status_code == 404
+    assert _get("/uploads/images/image_1_input.jpg").status_code == 404
+
+
+def test_only_public_blobs_are_served(db, tmp_path):
+    source = tmp_path / "voice.wav"
+    source.write_bytes(b"RIFF" + b"\x01" * 512)
+    url = blob_url(ingest_file(db, source, "wav"))
+    assert _get(url).status_code == 404
+
+    mark_public(db, [url])
+    response = _get(url)
+    assert response.status_code == 200
+    assert "immutable" in response.headers["cache-control"]
+
+
+def test_legacy_avatars_are_served(db):
+    _write("images/avatar_1_legacy.jpg", b"jpeg")
+    assert _get("/uploads/images/avatar_1_legacy.jpg").content == b"jpeg"
+
+
+def test_responses_return_signed_stream_urls(db, music):
+    _complete(db, music)
+    auth = {"Authorization": "Bearer " + create_access_token({"sub": str(music.user_id)})}
+
+    for path, pick in (
+        (f"/api/music/{music.id}", lambda body: body["music_url"]),
+        (f"/api/music/{music.id}/status", lambda body: body["music_url"]),
+        ("/api/music/?view=compact", lambda body: body["items"][0]["music_url"]),
+    ):
+        response = _get(path, auth)
+        assert response.status_code == 200, path
+        url = pick(response.json())
+        assert url.startswith(f"/api/music/{music.id}/stream?expires={stream_url_expiry()}&signature="), path
+
+    # 播放器不带 Authorization 头也能直接播放签名地址
+    stream = _get(url)
+    assert stream.status_code == 200
+    assert stream.content == AUDIO
+    assert _get(f"/api/music/{music.id}/stream?expires={stream_url_expiry()}&signature=0").status_code == 403
+
+
+def test_profile_update_cannot_publish_other_blobs(db, music, tmp_path):
+    source = tmp_path / "private.jpg"
+    source.write_bytes(b"private image")
+    url = blob_url(ingest_file(db, source, "jpg"))
+    auth = {"Authorization": "Bearer " + create_access_token({"sub": str(music.user_id)})}
+
+    async def request():
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            return await client.put("/api/user/profile", json={"username": "renamed", "avatar_url": url}, headers=auth)
+
+    response = asyncio.run(request())
+    assert response.status_code == 200
+    assert response.json()["username"] == "renamed"
+    # 头像只能通过上传接口设置，客户端提供的地址被忽略，不会变为公开
+    assert response.json()["avatar_url"] is None
+    assert _get(url).status_code == 404
@@ -0,0 +1,72 @@
+"""
+迁移测试：多个进程同时启动时每个迁移只执行一次
+"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from sqlalchemy import create_engine, inspect, text
+from app.database import Base
+from app.migrations import MIGRATIONS, run_migrations
+
+
+def _engine(path):
+    return create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+
+
+def test_concurrent_startup_runs_each_migration_once(tmp_path):
+    path = tmp_path / "app.db"
+    engines = [_engine(path) for _ in range(6)]
+    barrier = threading.Barrier(len(engines))
+
+    def start(engine):
+        barrier.wait()
+        return run_migrations(engine, Base.metadata)
+
+    with ThreadPoolExecutor(len(engines)) as pool:
+        results = list(pool.map(start, engines))
+    for engine in engines:
+        engine.dispose()
+
+    applied = sorted(version for versions in results for version in versions)
+    assert applied == [version for version, _, _ in MIGRATIONS]
+    engine = _engine(path)
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT version FROM schema_migrations ORDER BY version")).scalars().all()
+        assert rows == applied
+        assert "uq_collections_user_music" in {index["name"] for index in inspect(conn).get_indexes("collections")}
+    engine.dispose()
+
+
+def test_migrations_upgrade_existing_schema(tmp_path):
+    # 旧版本建的表：缺少后来加的列和索引
+    engine = _engine(tmp_path / "old.db")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX uq_collections_user_music"))
+        conn.execute(text("ALTER TABLE users DROP COLUMN avatar_variants"))
+
+    assert run_migrations(engine, Base.metadata) == [version for version, _, _ in MIGRATIONS]
+    assert run_migrations(engine, Base.metadata) == []
+    with engine.connect() as conn:
+        assert "avatar_variants" in {column["name"] for column in inspect(conn).get_columns("users")}
+        assert "uq_collections_user_music" in {index["name"] for index in inspect(conn).get_indexes("collections")}
+    engine.dispose()
+
+
+def test_existing_avatars_marked_public(tmp_path):
+    engine = _engine(tmp_path / "old.db")
+    Base.metadata.create_all(bind=engine)
+    avatar, private = "a" * 64, "b" * 64
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE blobs DROP COLUMN is_public"))
+        for sha256 in (avatar, private):
+            conn.execute(text("INSERT INTO blobs (sha256, ext, size, ref_count) VALUES (:sha256, 'jpg', 1, 1)"), {"sha256": sha256})
+        conn.execute(text(
+            "INSERT INTO users (email, username, hashed_password, avatar_url, is_active) "
+            "VALUES ('a@example.com', 'a', 'x', :url, 1)"
+        ), {"url": f"/uploads/blobs/aa/aa/{avatar}.jpg"})
+
+    run_migrations(engine, Base.metadata)
+    with engine.connect() as conn:
+        rows = dict(conn.execute(text("SELECT sha256, is_public FROM blobs")).all())
+    assert rows == {avatar: 1, private: 0}
+    engine.dispose()
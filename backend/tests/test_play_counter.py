@@ -0,0 +1,140 @@
+"""
+播放计数缓冲测试：写回前后读到的播放次数既不丢失也不重复
+"""
+import threading
+from sqlalchemy import event
+from app.database import SessionLocal
+from app.models.music import Music
+from app.models.play import PlayEvent
+from app.services.music_service import delete_music
+from app.services.play_service import PlayCounter, set_play_counter
+
+
+def _db_count(music_id: int) -> int:
+    db = SessionLocal()
+    try:
+        return db.query(Music.play_count).filter(Music.id == music_id).scalar()
+    finally:
+        db.close()
+
+
+def test_flush_writes_buffered_plays(db, music):
+    counter = PlayCounter(record_events=True)
+    for _ in range(3):
+        counter.record(music.id, music.user_id)
+    assert counter.pending(music.id) == 3
+
+    assert counter.flush() == 1
+    assert counter.pending(music.id) == 0
+    assert _db_count(music.id) == 3
+    assert counter.flush() == 0
+
+
+def test_read_during_flush_commit_is_not_double_counted(db, music):
+    observed = []
+
+    def read_after_commit(session):
+        # 提交刚完成时并发读取：数据库已包含增量，缓冲中不能再计入
+        committed = _db_count(music.id)
+        reader = threading.Thread(target=lambda: observed.append(committed + counter.pending(music.id)))
+        reader.start()
+        reader.join(timeout=0.2)
+        threads.append(reader)
+
+    def session_factory():
+        session = SessionLocal()
+        event.listen(session, "after_commit", read_after_commit)
+        return session
+
+    threads = []
+    counter = PlayCounter(session_factory=session_factory, record_events=False)
+    for _ in range(5):
+        counter.record(music.id, music.user_id)
+    counter.flush()
+    for thread in threads:
+        thread.join()
+
+    assert observed == [5]
+    assert _db_count(music.id) + counter.pending(music.id) == 5
+
+
+def test_failed_flush_keeps_plays_buffered(db, music):
+    def broken_factory():
+        session = SessionLocal()
+
+        def fail(*args, **kwargs):
+            raise RuntimeError("database unavailable")
+
+        session.commit = fail
+        return session
+
+    counter = PlayCounter(session_factory=broken_factory, record_events=False)
+    counter.record(music.id, music.user_id)
+    counter.record(music.id, music.user_id)
+    assert counter.flush() == 0
+    assert counter.pending(music.id) == 2
+    assert counter.stats()["flush_errors"] == 1
+
+    counter.session_factory = SessionLocal
+    assert counter.flush() == 1
+    assert _db_count(music.id) == 2
+    assert counter.pending(music.id) == 0
+
+
+def test_plays_of_deleted_music_are_dropped(db, music):
+    other = Music(user_id=music.user_id, title="other", input_type="text", input_content="",
+                  music_url="", duration=30, status="completed")
+    db.add(other)
+    db.commit()
+    counter = PlayCounter(record_events=True)
+    counter.record(music.id, music.user_id)
+    counter.record(other.id, music.user_id)
+    counter.record(other.id, music.user_id)
+    other_id = other.id
+    db.delete(other)
+    db.commit()
+
+    # 已删除音乐的增量和播放事件被丢弃，其余正常写回，不会每次写回都失败
+    assert counter.flush() == 1
+    assert counter.stats()["flush_errors"] == 0
+    assert counter.pending(other_id) == 0
+    assert _db_count(music.id) == 1
+    assert [event.music_id for event in db.query(PlayEvent)] == [music.id]
+
+
+def test_delete_music_discards_pending_plays(db, music):
+    counter = PlayCounter(record_events=True)
+    set_play_counter(counter)
+    try:
+        counter.record(music.id, music.user_id)
+        counter.record(music.id, music.user_id)
+        delete_music(db, music.id, music.user_id)
+        assert counter.pending(music.id) == 0
+        assert counter.stats()["pending_plays"] == 0
+        assert counter.flush() == 0
+    finally:
+        set_play_counter(None)
+
+
+def test_record_does_not_wait_for_flush_commit(db, music):
+    recorded = []
+
+    def record_during_commit(session):
+        # 提交进行中记录新的播放：只需要缓冲锁，不等待提交
+        recorder = threading.Thread(target=lambda: recorded.append(counter.record(music.id, music.user_id)))
+        recorder.start()
+        recorder.join(timeout=1)
+        recorded.append(recorder.is_alive())
+
+    def session_factory():
+        session = SessionLocal()
+        event.listen(session, "before_commit", record_during_commit)
+        return session
+
+    counter = PlayCounter(session_factory=session_factory, record_events=False)
+    counter.record(music.id, music.user_id)
+    counter.flush()
+
+    assert recorded[-1] is False
+    assert _db_count(music.id) == 1
+    assert counter.pending(music.id) == 1
@@ -0,0 +1,142 @@
+"""
+输入预处理测试：无法处理的上传文件直接失败而不重试，近似图片共用分析缓存
+"""
+import asyncio
+import io
+import numpy as np
+import pytest
+from PIL import Image
+from app.config import settings
+from app.models import JobStatus
+from app.models.music import GenerationLog, Music
+from app.services.blob_service import blob_url, ingest_file
+from app.services.cache_service import AnalysisCache, set_analysis_cache
+from app.services.generation_service import GENERATE_MUSIC_JOB, generate_music
+from app.services.job_queue import LocalJobQueue
+from app.services.preprocess_service import _wav_header, ffmpeg_binary
+from app.worker import WorkerPool
+
+requires_ffmpeg = pytest.mark.skipif(ffmpeg_binary() is None, reason="ffmpeg not installed")
+
+
+@pytest.fixture(autouse=True)
+def fast_timing(monkeypatch):
+    monkeypatch.setattr(settings, "JOB_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(settings, "JOB_RETRY_BACKOFF_SECONDS", 0)
+
+
+def _upload(db, music, tmp_path, name: str, data: bytes, input_type: str):
+    """把文件登记为 blob 并设为音乐的输入，返回内容哈希"""
+    path = tmp_path / name
+    path.write_bytes(data)
+    blob = ingest_file(db, path, name.rsplit(".", 1)[1])
+    music.input_type = input_type
+    music.input_content = blob_url(blob)
+    db.commit()
+    return blob.sha256
+
+
+def _generate(db, music, input_type: str, input_hash: str):
+    """用 worker 池执行一次生成任务，返回 (调用次数, 任务状态)"""
+    queue = LocalJobQueue()
+    calls = []
+
+    async def handler(session, job):
+        calls.append(job.attempts)
+        await generate_music(session, job)
+
+    async def scenario():
+        pool = WorkerPool(queue, {GENERATE_MUSIC_JOB: handler}, concurrency=1)
+        queue.enqueue(music.id, GENERATE_MUSIC_JOB, {"input_type": input_type, "input_hash": input_hash}, max_attempts=3)
+        await pool.start()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + 10
+        while queue.jobs()[0]["status"] not in (JobStatus.succeeded, JobStatus.failed):
+            assert loop.time() < deadline, "timed out"
+            await asyncio.sleep(0.01)
+        await pool.stop()
+
+    asyncio.run(scenario())
+    db.expire_all()
+    return calls, queue.jobs()[0]["status"]
+
+
+def _last_log(db, music):
+    return db.query(GenerationLog).filter(GenerationLog.music_id == music.id).order_by(GenerationLog.id.desc()).first()
+
+
+def _photo(quality: int) -> bytes:
+    """同一张图片（大色块加细节噪声）按不同 JPEG 质量编码"""
+    rng = np.random.default_rng(0)
+    blocks = rng.integers(0, 256, (6, 8, 3)).repeat(80, axis=0).repeat(80, axis=1)
+    pixels = (blocks + rng.integers(-20, 20, blocks.shape)).clip(0, 255)
+    out = io.BytesIO()
+    Image.fromarray(pixels.astype(np.uint8)).save(out, "JPEG", quality=quality)
+    return out.getvalue()
+
+
+@requires_ffmpeg
+def test_undecodable_voice_fails_without_retry(db, music, tmp_path):
+    sha256 = _upload(db, music, tmp_path, "voice.m4a", b"not audio at all" * 64, "voice")
+    calls, status = _generate(db, music, "voice", sha256)
+    assert calls == [1]
+    assert status == JobStatus.failed
+    assert db.query(Music.status).filter(Music.id == music.id).scalar() == "failed"
+    assert _last_log(db, music).message == "无法解码语音文件"
+
+
+@requires_ffmpeg
+def test_silent_voice_is_analyzed(db, music, tmp_path):
+    samples = settings.VOICE_SAMPLE_RATE
+    sha256 = _upload(db, music, tmp_path, "voice.wav", _wav_header(samples, samples) + b"\x00\x00" * samples, "voice")
+    calls, status = _generate(db, music, "voice", sha256)
+    assert calls == [1]
+    assert status == JobStatus.succeeded
+    assert db.query(Music.status).filter(Music.id == music.id).scalar() == "completed"
+
+
+def test_unidentified_image_fails_without_retry(db, music, tmp_path):
+    sha256 = _upload(db, music, tmp_path, "photo.jpg", b"not an image" * 64, "image")
+    calls, status = _generate(db, music, "image", sha256)
+    assert calls == [1]
+    assert status == JobStatus.failed
+    # 固定的错误信息，不包含 Pillow 错误中的服务器文件路径
+    assert _last_log(db, music).message == "无法识别的图片"
+
+
+def test_oversized_image_fails_without_retry(db, music, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "IMAGE_MAX_PIXELS", 100)
+    out = io.BytesIO()
+    Image.new("RGB", (20, 20), "red").save(out, "PNG")
+    sha256 = _upload(db, music, tmp_path, "photo.png", out.getvalue(), "image")
+    calls, status = _generate(db, music, "image", sha256)
+    assert calls == [1]
+    assert status == JobStatus.failed
+    assert _last_log(db, music).message == "图片尺寸过大: 20x20"
+
+
+def test_reencoded_image_hits_similar_cache(db, music, tmp_path):
+    set_analysis_cache(AnalysisCache())
+    try:
+        first_sha256 = _upload(db, music, tmp_path, "a.jpg", _photo(95), "image")
+        assert _generate(db, music, "image", first_sha256)[1] == JobStatus.succeeded
+
+        second = Music(
+            user_id=music.user_id, title="again", input_type="text", input_content="",
+            music_url="", duration=music.duration, status="generating",
+        )
+        db.add(second)
+        db.commit()
+        second_sha256 = _upload(db, second, tmp_path, "b.jpg", _photo(60), "image")
+        assert second_sha256 != first_sha256
+        assert _generate(db, second, "image", second_sha256)[1] == JobStatus.succeeded
+    finally:
+        set_analysis_cache(None)
+
+    messages = [
+        message for (message,) in db.query(GenerationLog.message).filter(GenerationLog.music_id == second.id)
+    ]
+    # 第二张图片没有重新推理，直接使用第一张的分析结果
+    assert "命中近似图片的分析缓存" in messages
+    assert "正在分析输入情绪" not in messages
+    assert db.query(Music.primary_emotion).filter(Music.id == second.id).scalar() == music.primary_emotion
@@ -0,0 +1,146 @@
+"""
+查询计划回归测试：对 music_service 中的每个查询执行 EXPLAIN，出现全表扫描时失败
+
+默认在内存 SQLite 上检查；DATABASE_URL 指向一个空的 MySQL 测试库时检查 MySQL 的执行计划
+（测试会删除并重建所有表，不要指向有数据的库）。
+"""
+from datetime import date, datetime, timedelta
+from sqlalchemy import event
+from app.database import engine
+from app.models.music import Music, Collection
+from app.models.user import User
+from app.services import music_service
+from app.services.play_service import get_play_counter
+
+USER_ID = 1
+OTHER_USER_ID = 2
+# 表很小时规划器选择全表扫描是合理的，这些表不参与检查
+IGNORED_TABLES = {"schema_migrations"}
+
+
+def seed(db, musics: int = 200) -> None:
+    db.add_all([
+        User(id=USER_ID, email="plans@example.com", username="plans", hashed_password="x"),
+        User(id=OTHER_USER_ID, email="other@example.com", username="other", hashed_password="x"),
+    ])
+    db.commit()
+    now = datetime.utcnow()
+    for i in range(musics):
+        db.add(Music(
+            user_id=USER_ID if i % 4 else OTHER_USER_ID,
+            title=f"music {i}",
+            input_type="text",
+            input_content="plans",
+            music_url=f"/uploads/music/generated_{i}.mp3",
+            status="completed" if i % 5 else "generating",
+            primary_emotion=("calm", "happy", "sad", "energetic")[i % 4],
+            duration=30,
+            created_at=now - timedelta(hours=i * 7),
+        ))
+    db.commit()
+    for music_id in range(2, 60, 3):
+        db.add(Collection(user_id=USER_ID, music_id=music_id, folder_name="default"))
+    db.commit()
+
+
+def scenarios(db):
+    """逐个调用服务函数，覆盖各个过滤与分页分支"""
+    ms = music_service
+    page = ms.get_user_musics_with_favorite(db, USER_ID, limit=10)
+    music_id = next(item["id"] for item in page["items"] if not item["is_favorite"])
+    return [
+        ("get_music_by_id", lambda: ms.get_music_by_id(db, music_id, USER_ID)),
+        ("get_user_musics", lambda: ms.get_user_musics(db, USER_ID, status_filter="completed")),
+        ("get_user_musics_with_favorite", lambda: ms.get_user_musics_with_favorite(db, USER_ID, limit=10)),
+        ("get_user_musics_with_favorite(cursor)", lambda: ms.get_user_musics_with_favorite(
+            db, USER_ID, limit=10, cursor=page["next_cursor"])),
+        ("get_user_musics_with_favorite(status)", lambda: ms.get_user_musics_with_favorite(
+            db, USER_ID, status_filter="completed")),
+        ("get_user_musics_with_favorite(emotion)", lambda: ms.get_user_musics_with_favorite(
+            db, USER_ID, emotion="calm")),
+        ("get_user_musics_with_favorite(favorite)", lambda: ms.get_user_musics_with_favorite(
+            db, USER_ID, is_favorite=True)),
+        ("get_user_musics_with_favorite(not favorite)", lambda: ms.get_user_musics_with_favorite(
+            db, USER_ID, is_favorite=False)),
+        ("get_user_journal", lambda: ms.get_user_journal(db, USER_ID)),
+        ("get_user_journal(range, emotion, tz)", lambda: ms.get_user_journal(
+            db, USER_ID, date.today() - timedelta(days=30), date.today(), "calm", tz="Asia/Shanghai")),
+        ("get_user_journal(cursor)", lambda: ms.get_user_journal(db, USER_ID, cursor=date.today())),
+        ("get_user_stats", lambda: ms.get_user_stats(db, USER_ID)),
+        ("toggle_favorite(add)", lambda: ms.toggle_favorite(db, USER_ID, music_id)),
+        ("toggle_favorite(remove)", lambda: ms.toggle_favorite(db, USER_ID, music_id)),
+        ("add_to_collection", lambda: ms.add_to_collection(db, USER_ID, music_id, "road")),
+        ("get_user_collections", lambda: ms.get_user_collections(db, USER_ID)),
+        ("get_user_collections(folder)", lambda: ms.get_user_collections(db, USER_ID, "road")),
+        ("get_user_collections_with_tags", lambda: ms.get_user_collections_with_tags(db, USER_ID, tag="x")),
+        ("remove_from_collection", lambda: ms.remove_from_collection(db, USER_ID, music_id)),
+        ("increment_play_count", lambda: ms.increment_play_count(db, music_id, USER_ID)),
+        ("play_counter.flush", lambda: get_play_counter() and get_play_counter().flush()),
+        ("create_music", lambda: ms.create_music(db, USER_ID, "new", "text", "hello")),
+        ("update_music_status", lambda: ms.update_music_status(db, music_id, "completed", primary_emotion="sad")),
+        ("delete_music", lambda: ms.delete_music(db, music_id, USER_ID)),
+    ]
+
+
+def full_scans(conn, statement: str, parameters) -> list:
+    """返回语句执行计划中的全表扫描"""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+        details = [row[-1] for row in plan]
+        scans = [
+            detail for detail in details
+            if detail.startswith("SCAN ") and " USING " not in detail
+            and not detail.startswith(("SCAN CONSTANT ROW", "SCAN (subquery"))
+        ]
+    elif dialect == "mysql":
+        result = conn.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+        rows = [dict(zip(result.keys(), row)) for row in result.fetchall()]
+        details = [f"{row.get('table')}: type={row.get('type')} key={row.get('key')}" for row in rows]
+        scans = [
+            f"{row.get('table')}: full scan"
+            for row in rows
+            if row.get("type") == "ALL" and not str(row.get("table") or "").startswith("<")
+        ]
+    else:
+        raise NotImplementedError(f"unsupported dialect: {dialect}")
+    return [scan for scan in scans if not any(table in scan for table in IGNORED_TABLES)], details
+
+
+def _capture_statements(call) -> list:
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        call()
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    return captured
+
+
+def test_hot_queries_use_indexes(db):
+    seed(db)
+    failures = []
+    checked = 0
+    for name, call in scenarios(db):
+        statements = _capture_statements(call)
+        with engine.connect() as conn:
+            for statement, parameters in statements:
+                checked += 1
+                scans, _ = full_scans(conn, statement, parameters)
+                if scans:
+                    failures.append(f"{name}: {' '.join(statement.split())} -> {scans}")
+    assert checked >= 50
+    assert not failures, "full table scans:\n" + "\n".join(failures)
+
+
+def test_detects_full_scan(db):
+    # 确认检查本身有效：按无索引的列过滤必然全表扫描
+    with engine.connect() as conn:
+        scans, _ = full_scans(conn, "SELECT id FROM musics WHERE title = ?" if conn.dialect.name == "sqlite"
+                              else "SELECT id FROM musics WHERE title = %s", ("x",))
+    assert scans
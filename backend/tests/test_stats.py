@@ -0,0 +1,106 @@
+"""
+统计测试：并发完成的生成任务不会丢失统计增量
+"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models import Music, User
+from app.models.stats import UserStats
+from app.services.music_service import delete_music, update_music_status
+from app.services.stats_service import _compute_stats, rebuild_user_stats
+
+EMOTIONS = ["happy", "calm", "sad"]
+
+
+def _session_factory(tmp_path):
+    # 每个线程使用独立连接（与多个 worker 进程/线程相同），内存库共享同一个连接无法复现竞争
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'stats.db'}", connect_args={"check_same_thread": False, "timeout": 30}
+    )
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def _setup(Session, count: int):
+    db = Session()
+    user = User(email="stats@example.com", username="stats", hashed_password="x")
+    db.add(user)
+    db.flush()
+    musics = [
+        Music(user_id=user.id, title=f"m{i}", input_type="text", input_content="", music_url="",
+              duration=30 + i, status="generating")
+        for i in range(count)
+    ]
+    db.add_all(musics)
+    db.commit()
+    user_id, ids = user.id, [music.id for music in musics]
+    rebuild_user_stats(db, user_id)
+    db.close()
+    return user_id, ids
+
+
+def _run_concurrently(fn, args):
+    barrier = threading.Barrier(len(args))
+
+    def run(arg):
+        barrier.wait()
+        fn(arg)
+
+    with ThreadPoolExecutor(len(args)) as pool:
+        list(pool.map(run, args))
+
+
+def test_concurrent_completions_are_all_counted(tmp_path):
+    engine, Session = _session_factory(tmp_path)
+    user_id, ids = _setup(Session, 8)
+
+    def complete(index):
+        db = Session()
+        try:
+            update_music_status(db, ids[index], "completed", primary_emotion=EMOTIONS[index % len(EMOTIONS)])
+        finally:
+            db.close()
+
+    _run_concurrently(complete, list(range(len(ids))))
+
+    db = Session()
+    stats = db.get(UserStats, user_id)
+    expected = _compute_stats(db, user_id)
+    assert stats.total_count == len(ids) == expected["total_count"]
+    assert stats.total_duration == expected["total_duration"]
+    assert stats.monthly_counts == expected["monthly_counts"]
+    assert stats.emotion_counts == expected["emotion_counts"]
+    db.close()
+    engine.dispose()
+
+
+def test_concurrent_deletes_and_completions(tmp_path):
+    engine, Session = _session_factory(tmp_path)
+    user_id, ids = _setup(Session, 8)
+    db = Session()
+    for music_id in ids[:4]:
+        update_music_status(db, music_id, "completed", primary_emotion="calm")
+    db.close()
+
+    def change(index):
+        db = Session()
+        try:
+            if index < 4:
+                delete_music(db, ids[index], user_id)
+            else:
+                update_music_status(db, ids[index], "completed", primary_emotion="happy")
+        finally:
+            db.close()
+
+    _run_concurrently(change, list(range(len(ids))))
+
+    db = Session()
+    stats = db.get(UserStats, user_id)
+    expected = _compute_stats(db, user_id)
+    assert stats.total_count == 4 == expected["total_count"]
+    assert stats.total_duration == expected["total_duration"]
+    assert stats.emotion_counts == expected["emotion_counts"] == {"happy": 4}
+    db.close()
+    engine.dispose()
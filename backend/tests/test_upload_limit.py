@@ -0,0 +1,67 @@
+"""
+上传大小限制测试：超限请求在解析表单之前被拒绝
+"""
+import asyncio
+import httpx
+from fastapi import FastAPI, File, UploadFile
+from app.services.upload_service import UploadSizeLimitMiddleware
+
+LIMIT = 1024
+
+
+def _make_app(calls):
+    app = FastAPI()
+    app.add_middleware(UploadSizeLimitMiddleware, max_body_size=LIMIT)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        calls.append(file.filename)
+        return {"size": len(await file.read())}
+
+    return app
+
+
+def _post(app, **kwargs):
+    async def request():
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            return await client.post("/upload", **kwargs)
+    return asyncio.run(request())
+
+
+def test_small_upload_passes():
+    calls = []
+    response = _post(_make_app(calls), files={"file": ("a.bin", b"x" * 100)})
+    assert response.status_code == 200
+    assert response.json() == {"size": 100}
+    assert calls == ["a.bin"]
+
+
+def test_content_length_over_limit_rejected_before_parsing():
+    calls = []
+    response = _post(_make_app(calls), files={"file": ("a.bin", b"x" * (LIMIT * 2))})
+    assert response.status_code == 413
+    assert calls == []
+
+
+def test_chunked_body_over_limit_rejected_while_receiving():
+    calls = []
+    boundary = "b0undary"
+    chunks = []
+
+    async def body():
+        # 没有 Content-Length 的分块请求体
+        yield f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.bin\"\r\n\r\n".encode()
+        for _ in range(16):
+            chunks.append(1)
+            yield b"x" * 256
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    response = _post(
+        _make_app(calls),
+        content=body(),
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    )
+    assert response.status_code == 413
+    assert calls == []
+    # 超过上限后不再继续读取
+    assert len(chunks) < 16
@@ -0,0 +1,249 @@
+"""
+worker 池测试：租约、心跳、失败重试与停止归还（使用 LocalJobQueue）
+"""
+from datetime import datetime, timedelta
+import asyncio
+import pytest
+from app.config import settings
+from app.models import JobStatus
+from app.models.music import GenerationLog, Music
+from app.services.generation_service import GENERATE_MUSIC_JOB, GENERATION_FAILED_MESSAGE, mark_generation_failed
+from app.services.job_queue import LocalJobQueue, PermanentJobError, compute_backoff
+from app.worker import WorkerPool
+
+
+@pytest.fixture(autouse=True)
+def fast_timing(monkeypatch):
+    monkeypatch.setattr(settings, "JOB_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(settings, "JOB_LEASE_SECONDS", 60)
+    monkeypatch.setattr(settings, "JOB_HEARTBEAT_SECONDS", 0.05)
+    monkeypatch.setattr(settings, "JOB_RETRY_BACKOFF_SECONDS", 0)
+    monkeypatch.setattr(settings, "JOB_RETRY_BACKOFF_MAX_SECONDS", 300)
+
+
+async def _wait(condition, timeout: float = 5.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_job_completes(db, music):
+    queue = LocalJobQueue()
+    calls = []
+
+    async def handler(session, job):
+        calls.append(job.payload["n"])
+
+    async def scenario():
+        pool = WorkerPool(queue, {"noop": handler}, concurrency=2)
+        job_id = queue.enqueue(music.id, "noop", {"n": 1})
+        await pool.start()
+        await _wait(lambda: queue.jobs()[0]["status"] == JobStatus.succeeded)
+        await pool.stop()
+        return job_id
+
+    job_id = asyncio.run(scenario())
+    job = queue.jobs()[0]
+    assert job["id"] == job_id
+    assert calls == [1]
+    assert job["attempts"] == 1
+    assert job["locked_by"] is None
+
+
+def test_lost_lease_cancels_job(db, music, monkeypatch):
+    # 租约很短、心跳较慢：租约过期后被其他 worker 接管，下一次心跳发现并取消本地执行
+    monkeypatch.setattr(settings, "JOB_LEASE_SECONDS", 0.05)
+    monkeypatch.setattr(settings, "JOB_HEARTBEAT_SECONDS", 0.5)
+    queue = LocalJobQueue()
+    started = asyncio.Event()
+    cancelled = []
+    failed = []
+
+    async def handler(session, job):
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(job.id)
+            raise
+
+    async def scenario():
+        pool = WorkerPool(
+            queue, {"slow": handler}, concurrency=1,
+            on_failed=lambda session, job, error, message: failed.append(job.id)
+        )
+        queue.enqueue(music.id, "slow")
+        await pool.start()
+        await asyncio.wait_for(started.wait(), 5)
+        await asyncio.sleep(0.15)
+        stolen = queue.claim("other-worker", 60)
+        await _wait(lambda: cancelled)
+        await pool.stop()
+        return stolen
+
+    stolen = asyncio.run(scenario())
+    job = queue.jobs()[0]
+    assert stolen is not None and stolen.attempts == 2
+    assert cancelled == [job["id"]]
+    assert failed == []
+    # 任务仍归接管者所有，没有被本地 worker 完成、失败或归还
+    assert job["status"] == JobStatus.running
+    assert job["locked_by"] == "other-worker"
+
+
+def test_failure_is_retried_with_backoff(db, music, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_RETRY_BACKOFF_SECONDS", 30)
+    queue = LocalJobQueue()
+    calls = []
+
+    async def handler(session, job):
+        calls.append(job.attempts)
+        raise RuntimeError("boom")
+
+    async def scenario():
+        pool = WorkerPool(queue, {"flaky": handler}, concurrency=1)
+        queue.enqueue(music.id, "flaky", max_attempts=3)
+        await pool.start()
+        await _wait(lambda: queue.jobs()[0]["status"] == JobStatus.pending and calls)
+        await pool.stop()
+
+    before = datetime.utcnow()
+    asyncio.run(scenario())
+    job = queue.jobs()[0]
+    assert calls == [1]
+    assert job["attempts"] == 1
+    assert "boom" in job["last_error"]
+    # 退避期间不可领取
+    assert job["available_at"] >= before + timedelta(seconds=30)
+    assert queue.claim("other-worker", 60) is None
+
+
+def test_backoff_grows_exponentially_and_is_capped(monkeypatch):
+    monkeypatch.setattr(settings, "JOB_RETRY_BACKOFF_SECONDS", 5)
+    monkeypatch.setattr(settings, "JOB_RETRY_BACKOFF_MAX_SECONDS", 30)
+    assert [compute_backoff(n) for n in range(1, 6)] == [5, 10, 20, 30, 30]
+
+
+def test_generation_marked_failed_after_max_attempts(db, music):
+    queue = LocalJobQueue()
+    calls = []
+    failed = []
+
+    async def handler(session, job):
+        calls.append(job.attempts)
+        raise RuntimeError("model exploded")
+
+    def on_failed(session, job, error, message):
+        mark_generation_failed(session, job, error, message)
+        failed.append(job.id)
+
+    async def scenario():
+        pool = WorkerPool(queue, {GENERATE_MUSIC_JOB: handler}, concurrency=1, on_failed=on_failed)
+        queue.enqueue(music.id, GENERATE_MUSIC_JOB, max_attempts=3)
+        await pool.start()
+        await _wait(lambda: failed)
+        await pool.stop()
+
+    asyncio.run(scenario())
+    db.expire_all()
+    assert calls == [1, 2, 3]
+    assert len(failed) == 1
+    assert queue.jobs()[0]["status"] == JobStatus.failed
+    assert queue.jobs()[0]["attempts"] == 3
+    assert db.query(Music.status).filter(Music.id == music.id).scalar() == "failed"
+    log = db.query(GenerationLog).filter(GenerationLog.music_id == music.id).order_by(GenerationLog.id.desc()).first()
+    assert log.status == "failed"
+    # 非预期错误的细节只留在任务记录中，展示给用户的是通用信息
+    assert log.message == GENERATION_FAILED_MESSAGE
+    assert "model exploded" in queue.jobs()[0]["last_error"]
+
+
+def test_permanent_error_fails_without_retry(db, music):
+    queue = LocalJobQueue()
+    calls = []
+    failed = []
+
+    async def handler(session, job):
+        calls.append(job.attempts)
+        raise PermanentJobError("无法解码语音文件")
+
+    def on_failed(session, job, error, message):
+        mark_generation_failed(session, job, error, message)
+        failed.append(job.id)
+
+    async def scenario():
+        pool = WorkerPool(queue, {GENERATE_MUSIC_JOB: handler}, concurrency=1, on_failed=on_failed)
+        queue.enqueue(music.id, GENERATE_MUSIC_JOB, max_attempts=3)
+        await pool.start()
+        await _wait(lambda: failed)
+        await pool.stop()
+
+    asyncio.run(scenario())
+    db.expire_all()
+    assert calls == [1]
+    assert queue.jobs()[0]["status"] == JobStatus.failed
+    assert db.query(Music.status).filter(Music.id == music.id).scalar() == "failed"
+    log = db.query(GenerationLog).filter(GenerationLog.music_id == music.id).order_by(GenerationLog.id.desc()).first()
+    # 展示给用户的是错误信息本身，而不是异常的 repr
+    assert log.message == "无法解码语音文件"
+
+
+def test_stop_releases_running_job(db, music):
+    queue = LocalJobQueue()
+    started = asyncio.Event()
+    cancelled = []
+    failed = []
+
+    async def handler(session, job):
+        started.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(job.id)
+            raise
+
+    async def scenario():
+        pool = WorkerPool(
+            queue, {"forever": handler}, concurrency=1,
+            on_failed=lambda session, job, error, message: failed.append(job.id)
+        )
+        queue.enqueue(music.id, "forever")
+        await pool.start()
+        await asyncio.wait_for(started.wait(), 5)
+        await pool.stop(timeout=0.05)
+
+    asyncio.run(scenario())
+    job = queue.jobs()[0]
+    assert cancelled == [job["id"]]
+    assert failed == []
+    # 归还不计入尝试次数，立即可被其他 worker 领取
+    assert job["status"] == JobStatus.pending
+    assert job["attempts"] == 0
+    assert job["locked_by"] is None
+    assert queue.claim("other-worker", 60).id == job["id"]
+
+
+def test_expired_lease_counts_as_attempt(db, music):
+    queue = LocalJobQueue()
+    handled = []
+
+    async def handler(session, job):
+        handled.append(job.id)
+
+    async def scenario():
+        pool = WorkerPool(
+            queue, {"noop": handler}, concurrency=1,
+            on_failed=lambda session, job, error, message: None
+        )
+        queue.enqueue(music.id, "noop", max_attempts=1)
+        # 第一次领取后崩溃（租约立即过期），再次领取超过最大尝试次数，直接判定失败
+        assert queue.claim("crashed-worker", 0) is not None
+        await asyncio.sleep(0.01)
+        await pool.start()
+        await _wait(lambda: queue.jobs()[0]["status"] == JobStatus.failed)
+        await pool.stop()
+
+    asyncio.run(scenario())
+    assert handled == []
+    assert queue.jobs()[0]["last_error"] == "lease expired too many times"
@@ -0,0 +1,8 @@
+"""
+生成任务 worker 启动脚本
+"""
+import asyncio
+from app.worker import main
+
+if __name__ == "__main__":
+    asyncio.run(main())